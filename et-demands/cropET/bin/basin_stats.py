@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+
+class BasinStats():
+    """Area weighted annual cell and basin totals computed during the run
+
+    The annual totals of each cell/crop are weighted by the crop acreage
+    (the CROP_NN fields of the ET cells shapefile) as the results are
+    written, so the basin water demand doesn't need a second pass over
+    the daily output files.
+
+    Depths are area weighted means [mm] and volumes are in acre-feet.
+    """
+    # Annual output field names of the aggregated variables
+    fields = ['ETact', 'NIWR', 'Irrigation', 'PPT']
+    # Millimeters per foot
+    mm_per_ft = 304.8
+
+    def __init__(self, data, cells):
+        """
+
+        Args:
+            data (CropETData):
+            cells (ETCellData): cells with the crop acreages set
+        """
+        self.data = data
+        self.acreages = dict(
+            (cell_id, getattr(cell, 'crop_acreages', {}))
+            for cell_id, cell in cells.et_cells_dict.items())
+        # Annual volumes [acre-feet], keyed by (cell_id, crop_num)
+        self.volumes = dict()
+        # First year of the results appended to a previous run
+        self.append_year = None
+
+    def add(self, cell_id, crop_num, annual_pd):
+        """Add the annual totals for a single cell/crop
+
+        Args:
+            cell_id (str):
+            crop_num (int):
+            annual_pd (DataFrame): annual stats with a Year column or
+                a DatetimeIndex
+        """
+        try:
+            acres = float(self.acreages[cell_id][int(crop_num)])
+        except KeyError:
+            logging.debug(
+                '  CellID {} crop {} has no acreage, skipping'.format(
+                    cell_id, crop_num))
+            return
+        if acres <= 0:
+            return
+        if 'Year' in annual_pd.columns:
+            years = annual_pd['Year'].values.astype(np.int64)
+        else:
+            years = annual_pd.index.year.values.astype(np.int64)
+        volume_pd = pd.DataFrame(
+            dict(
+                (field, annual_pd[field].values.astype(np.float64) *
+                 acres / self.mm_per_ft)
+                for field in self.fields),
+            index=pd.Index(years, name='Year'))
+        volume_pd['Acres'] = acres
+        self.volumes[(cell_id, int(crop_num))] = volume_pd
+
+    def add_crop_output(self, crop_output):
+        """Add the annual totals from the crop results
+
+        When appending to a previous run, the results only start at the
+        append year and the earlier years are kept from the previous
+        totals files in write()
+        """
+        if crop_output.append_year is not None:
+            self.append_year = min(
+                self.append_year or crop_output.append_year,
+                crop_output.append_year)
+        self.add(
+            crop_output.cell_id, crop_output.crop_num,
+            crop_output.period_stats('year'))
+
+    def cell_totals(self):
+        """Area weighted annual totals for each cell
+
+        Returns:
+            DataFrame with Year, CellID, Acres, the area weighted depths
+                and the volumes (<field>_AF) of each variable
+        """
+        if not self.volumes:
+            return None
+        volume_pd = pd.concat([
+            v.assign(CellID=k[0]) for k, v in sorted(self.volumes.items())])
+        cell_pd = volume_pd.reset_index().groupby(
+            ['Year', 'CellID'], sort=True).sum()
+        return self._totals(cell_pd.reset_index())
+
+    def basin_totals(self):
+        """Area weighted annual totals for the basin"""
+        if not self.volumes:
+            return None
+        basin_pd = pd.concat([
+            v for k, v in sorted(self.volumes.items())]).groupby(level=0).sum()
+        return self._totals(basin_pd.reset_index())
+
+    def _totals(self, volume_pd):
+        """Add the area weighted depths and rename the volume fields"""
+        for field in self.fields:
+            volume_pd[field + '_AF'] = volume_pd[field]
+            volume_pd[field] = (
+                self.mm_per_ft * volume_pd[field] / volume_pd['Acres'])
+        return volume_pd
+
+    def _previous_totals(self, output_path, output_pd):
+        """Add the years of a previous run before the append year
+
+        Args:
+            output_path (str): previous totals file path
+            output_pd (DataFrame): totals of the appended years
+
+        Returns:
+            DataFrame
+        """
+        if self.append_year is None:
+            return output_pd
+        elif not os.path.isfile(output_path):
+            logging.warning(
+                '  {} does not exist, only the appended years are '
+                'written'.format(os.path.basename(output_path)))
+            return output_pd
+        prev_pd = pd.read_csv(output_path, sep=',', dtype={'CellID': str})
+        prev_pd = prev_pd.loc[
+            prev_pd['Year'] < self.append_year, output_pd.columns]
+        return pd.concat([prev_pd, output_pd], ignore_index=True)
+
+    def write(self):
+        """Write the cell and basin totals to the basin stats folder"""
+        columns = (
+            ['Year', 'Acres'] + self.fields +
+            [field + '_AF' for field in self.fields])
+        cell_path = os.path.join(
+            self.data.basin_output_ws,
+            '{}_cell_annual.csv'.format(self.data.basin_id))
+        basin_path = os.path.join(
+            self.data.basin_output_ws,
+            '{}_basin_annual.csv'.format(self.data.basin_id))
+        if not any(self.acreages.values()):
+            logging.warning(
+                '  No crop acreages were found, basin stats not written')
+            return
+        elif not self.volumes:
+            logging.warning(
+                '  No annual results were computed for the crops with '
+                'acreages, basin stats not written')
+            return
+        self._previous_totals(cell_path, self.cell_totals()).to_csv(
+            cell_path, sep=',', columns=['Year', 'CellID'] + columns[1:],
+            float_format='%.4f', index=False)
+        self._previous_totals(basin_path, self.basin_totals()).to_csv(
+            basin_path, sep=',', columns=columns, float_format='%.4f',
+            index=False)
+
+
+if __name__ == '__main__':
+    pass
@@ -10,6 +10,9 @@ import pandas as pd
 import calculate_height
 import compute_crop_et
 import compute_crop_gdd
+import crop_output
+import crop_snapshot
+import crop_stats
 from initialize_crop_cycle import InitializeCropCycle
 import kcb_daily
 
@@ -21,16 +24,18 @@ class DayData:
         self.etref_array = np.zeros(30)
 
 
-def crop_cycle_mp(data, et_cell, vb_flag=False, mp_procs=1):
+def crop_cycle_mp(data, et_cell, vb_flag=False, mp_procs=1, writer=None):
     """Compute crop ET for all crops using multiprocessing
 
     crop_day_loop_mp() will unpack arguments and call crop_day_loop
+    The crop results are returned to this process and passed to the writer
 
     Args:
         data ():
         et_cell ():
         vb_flag (bool): If True, mimic calculations in VB version of code
         mp_procs (int): number of cores to use for multiprocessing
+        writer (CropOutputWriter): writer stage for the crop results
     """
     crop_mp_list = []
     for crop_num, crop in sorted(et_cell.crop_params.items()):
@@ -39,16 +44,20 @@ def crop_cycle_mp(data, et_cell, vb_flag=False, mp_procs=1):
             # Force debug_flag false when multiprocessing
             crop_mp_list.append([
                 data, et_cell, crop, False, vb_flag, mp_procs])
-    results = []
     if crop_mp_list:
         pool = mp.Pool(mp_procs)
-        results = pool.imap(crop_day_loop_mp, crop_mp_list, chunksize=1)
+        results = pool.imap_unordered(
+            crop_day_loop_mp, crop_mp_list, chunksize=1)
         pool.close()
+        for result in results:
+            if writer is not None:
+                writer.write(result)
         pool.join()
         del pool, results
 
 
-def crop_cycle(data, et_cell, debug_flag=False, vb_flag=False, mp_procs=1):
+def crop_cycle(data, et_cell, debug_flag=False, vb_flag=False, mp_procs=1,
+               writer=None):
     """Compute crop ET for all crops
 
     Args:
@@ -56,17 +65,29 @@ def crop_cycle(data, et_cell, debug_flag=False, vb_flag=False, mp_procs=1):
         et_cell ():
         debug_flag (bool): If True, write debug level comments to debug.txt
         vb_flag (bool): If True, mimic calculations in VB version of code
+        mp_procs (int):
+        writer (CropOutputWriter): writer stage for the crop results
+            If not set, the results are returned instead
 
     Returns:
-        None
+        list of CropOutput results (empty if writer is set)
     """
+    crop_output_list = []
     for crop_num, crop in sorted(et_cell.crop_params.items()):
         if et_cell.crop_flags[crop_num] == 0:
             if debug_flag:
                 logging.debug('Crop %2d %s' % (crop_num, crop.name))
                 logging.debug('  NOT USED')
             continue
-        crop_day_loop(data, et_cell, crop, debug_flag, vb_flag, mp_procs)
+        result = crop_day_loop(
+            data, et_cell, crop, debug_flag, vb_flag, mp_procs)
+        if result is None:
+            continue
+        elif writer is not None:
+            writer.write(result)
+        else:
+            crop_output_list.append(result)
+    return crop_output_list
 
 
 def crop_day_loop_mp(tup):
@@ -102,7 +123,7 @@ def crop_day_loop(data, et_cell, crop, debug_flag=False, vb_flag=False,
         mp_procs (int):
 
     Returns
-        Bool
+        CropOutput results for the crop (or None if no output is needed)
     """
     func_str = 'crop_day_loop()'
 
@@ -117,31 +138,68 @@ def crop_day_loop(data, et_cell, crop, debug_flag=False, vb_flag=False,
                 crop.class_number, et_cell.crop_flags[crop.class_number]))
         logging.debug('  GDD trigger DOY: {}'.format(crop.gdd_trigger_doy))
 
-    # 'foo' is holder of all these global variables for now
-    foo = InitializeCropCycle()
-
-    # First time through for crop, load basic crop parameters and
-    #   process climate data
-    foo.crop_load(et_cell, crop)
-
-    # Get the CO2 correction factors for each crop
-    if data.co2_flag:
-        foo.setup_co2(et_cell, crop)
-
-    # Initialize crop data frame
-    foo.setup_dataframe(et_cell)
+    # Continue from the warm state saved at the end of the previous run
+    snapshot = None
+    if data.append_flag:
+        snapshot = crop_snapshot.read_snapshot(
+            data, et_cell.cell_id, crop.class_number)
 
-    foo_day = DayData()
-    foo_day.sdays = 0
-    foo_day.doy_prev = 0
-
-    # At very start for crop, set up for next season
-    # crop_setup_flag is only set true in initialize_crop_cycle
-    #   but setup_crop() is called in kcb_daily
-    if not foo.in_season and foo.crop_setup_flag:
-        foo.setup_crop(crop)
-
-    for step_dt, step_doy in foo.crop_pd[['doy']].iterrows():
+    if snapshot is not None:
+        foo = snapshot.foo
+        foo_day = snapshot.foo_day
+        if data.co2_flag:
+            foo.setup_co2(et_cell, crop)
+        # Only simulate the days after the snapshot
+        foo.setup_dataframe(et_cell)
+        foo.crop_pd = foo.crop_pd[foo.crop_pd.index > snapshot.end_dt]
+        foo.reducers = None
+        if not hasattr(foo, 'gs_tracker'):
+            foo.gs_tracker = crop_stats.SeasonTracker()
+    else:
+        # 'foo' is holder of all these global variables for now
+        foo = InitializeCropCycle()
+
+        # First time through for crop, load basic crop parameters and
+        #   process climate data
+        foo.crop_load(et_cell, crop)
+
+        # Get the CO2 correction factors for each crop
+        if data.co2_flag:
+            foo.setup_co2(et_cell, crop)
+
+        # Initialize crop data frame
+        # If only the monthly, annual and growing season stats are needed,
+        #   the daily values are reduced as they are computed instead
+        if (data.daily_output_flag or
+                data.cube_flag or
+                data.snapshot_flag):
+            foo.setup_dataframe(et_cell)
+            foo.reducers = None
+        else:
+            foo.reducers = dict()
+            if data.monthly_output_flag:
+                foo.reducers['month'] = crop_stats.PeriodReducer('month')
+            if data.annual_output_flag or data.basin_stats_flag:
+                foo.reducers['year'] = crop_stats.PeriodReducer('year')
+
+        foo_day = DayData()
+        foo_day.sdays = 0
+        foo_day.doy_prev = 0
+
+        # Growing season statistics are tracked as the season flag changes
+        foo.gs_tracker = crop_stats.SeasonTracker()
+
+        # At very start for crop, set up for next season
+        # crop_setup_flag is only set true in initialize_crop_cycle
+        #   but setup_crop() is called in kcb_daily
+        if not foo.in_season and foo.crop_setup_flag:
+            foo.setup_crop(crop)
+
+    if foo.reducers is None:
+        day_pd = foo.crop_pd[['doy']]
+    else:
+        day_pd = et_cell.refet_pd[['doy']]
+    for step_dt, step_doy in day_pd.iterrows():
         if debug_flag:
             logging.debug(
                 '\n{}: DOY {}  Date {}'.format(
@@ -215,17 +273,30 @@ def crop_day_loop(data, et_cell, crop, debug_flag=False, vb_flag=False,
 
         # Retrieve values from foo_day and write to output data frame
         # Eventually let compute_crop_et() write directly to output df
-        foo.crop_pd.at[step_dt, 'et_act'] = foo.etc_act
-        foo.crop_pd.at[step_dt, 'et_pot'] = foo.etc_pot
-        foo.crop_pd.at[step_dt, 'et_bas'] = foo.etc_bas
-        foo.crop_pd.at[step_dt, 'kc_act'] = foo.kc_act
-        foo.crop_pd.at[step_dt, 'kc_bas'] = foo.kc_bas
-        foo.crop_pd.at[step_dt, 'irrigation'] = foo.irr_sim
-        foo.crop_pd.at[step_dt, 'runoff'] = foo.sro
-        foo.crop_pd.at[step_dt, 'dperc'] = foo.dperc
-        foo.crop_pd.at[step_dt, 'niwr'] = foo.niwr + 0
-        foo.crop_pd.at[step_dt, 'season'] = int(foo.in_season)
-        foo.crop_pd.at[step_dt, 'cutting'] = int(foo.cutting)
+        if foo.reducers is None:
+            foo.crop_pd.at[step_dt, 'et_act'] = foo.etc_act
+            foo.crop_pd.at[step_dt, 'et_pot'] = foo.etc_pot
+            foo.crop_pd.at[step_dt, 'et_bas'] = foo.etc_bas
+            foo.crop_pd.at[step_dt, 'kc_act'] = foo.kc_act
+            foo.crop_pd.at[step_dt, 'kc_bas'] = foo.kc_bas
+            foo.crop_pd.at[step_dt, 'irrigation'] = foo.irr_sim
+            foo.crop_pd.at[step_dt, 'runoff'] = foo.sro
+            foo.crop_pd.at[step_dt, 'dperc'] = foo.dperc
+            foo.crop_pd.at[step_dt, 'niwr'] = foo.niwr + 0
+            foo.crop_pd.at[step_dt, 'season'] = int(foo.in_season)
+            foo.crop_pd.at[step_dt, 'cutting'] = int(foo.cutting)
+        elif foo.reducers:
+            day_values = {
+                'etref': foo_day.etref, 'et_act': foo.etc_act,
+                'et_pot': foo.etc_pot, 'et_bas': foo.etc_bas,
+                'kc_act': foo.kc_act, 'kc_bas': foo.kc_bas,
+                'ppt': foo_day.precip, 'irrigation': foo.irr_sim,
+                'runoff': foo.sro, 'dperc': foo.dperc,
+                'niwr': foo.niwr + 0, 'season': int(foo.in_season),
+                'cutting': int(foo.cutting)}
+            for reducer in foo.reducers.values():
+                reducer.update(step_dt, day_values)
+        foo.gs_tracker.update(foo_day.year, foo_day.doy, foo.in_season)
 
         # Write final output file variables to DEBUG file
         if debug_flag:
@@ -242,8 +313,7 @@ def crop_day_loop(data, et_cell, crop, debug_flag=False, vb_flag=False,
 
         # Check that season started
         if foo_day.month == 12 and foo_day.day == 31:
-            season_count = foo.crop_pd.loc[
-                str(foo_day.year):str(foo_day.year), 'season'].sum()
+            season_count = foo.gs_tracker.season_days()
             if season_count == 0:
                 logging.warning(
                     '  Crop {} - {} growing season never started'.format(
@@ -253,283 +323,24 @@ def crop_day_loop(data, et_cell, crop, debug_flag=False, vb_flag=False,
                     '  Crop {} - {} growing season active for 1 day'.format(
                         crop.class_number, foo_day.year))
 
-    # Write output files
+    # Return the output arrays to the writer stage
     if (data.daily_output_flag or
             data.monthly_output_flag or
             data.annual_output_flag or
-            data.gs_output_flag):
-        write_crop_output(data, et_cell, crop, foo)
-    return True
-
+            data.gs_output_flag or
+            data.basin_stats_flag or
+            data.cube_flag or
+            data.snapshot_flag):
+        output = crop_output.CropOutput(et_cell, crop, foo)
+        if snapshot is not None:
+            # Statistics for the last year of the previous run are recomputed
+            output = snapshot.tail.concat(output)
+            output.append_year = snapshot.tail.end_dt().year
+        if data.snapshot_flag:
+            output.snapshot = crop_snapshot.CropSnapshot(foo, foo_day, output)
+        return output
+    return None
 
-def write_crop_output(data, et_cell, crop, foo):
-    """Write ET-Demands output files for each cell/crop
-
-    Args:
-        data ():
-        et_cell ():
-        crop ():
-        foo ():
-    """
-    year_field = 'Year'
-    month_field = 'Month'
-    day_field = 'Day'
-    doy_field = 'DOY'
-    pmeto_field = 'PMETo'
-    precip_field = 'PPT'
-    etact_field = 'ETact'
-    etpot_field = 'ETpot'
-    etbas_field = 'ETbas'
-    irrig_field = 'Irrigation'
-    season_field = 'Season'
-    cutting_field = 'Cutting'
-    runoff_field = 'Runoff'
-    dperc_field = 'DPerc'
-    niwr_field = 'NIWR'
-    kc_field = 'Kc'
-    kcb_field = 'Kcb'
-    gs_start_doy_field = 'Start_DOY'
-    gs_end_doy_field = 'End_DOY'
-    gs_start_date_field = 'Start_Date'
-    gs_end_date_field = 'End_Date'
-    gs_length_field = 'GS_Length'
-
-    # Merge the crop and weather data frames to form the daily output
-    if (data.daily_output_flag or
-            data.monthly_output_flag or
-            data.annual_output_flag or
-            data.gs_output_flag):
-        daily_output_pd = pd.merge(
-            foo.crop_pd, et_cell.weather_pd[['ppt']],
-            # foo.crop_pd, et_cell.weather_pd[['ppt', 't30']],
-            left_index=True, right_index=True)
-        # Rename the output columns
-        daily_output_pd.index.rename('Date', inplace=True)
-        daily_output_pd[year_field] = daily_output_pd.index.year
-        daily_output_pd = daily_output_pd.rename(columns={
-            'doy': doy_field, 'ppt': precip_field, 'etref': pmeto_field,
-            'et_act': etact_field, 'et_pot': etpot_field,
-            'et_bas': etbas_field, 'kc_act': kc_field, 'kc_bas': kcb_field,
-            'niwr': niwr_field, 'irrigation': irrig_field,
-            'runoff': runoff_field, 'dperc': dperc_field,
-            'season': season_field, 'cutting': cutting_field})
-            # 't30':'T30',
-    # Compute monthly and annual stats before modifying daily format below
-    if data.monthly_output_flag:
-        monthly_resample_func = {
-            pmeto_field: np.sum, etact_field: np.sum, etpot_field: np.sum,
-            etbas_field: np.sum, kc_field: np.mean, kcb_field: np.mean,
-            niwr_field: np.sum, precip_field: np.sum, irrig_field: np.sum,
-            runoff_field: np.sum, dperc_field: np.sum, season_field: np.sum,
-            cutting_field: np.sum}
-        monthly_output_pd = daily_output_pd.resample('MS').apply(
-            monthly_resample_func)
-        # monthly_output_pd = daily_output_pd.resample(
-        #     'MS', how=monthly_resample_func)
-    if data.annual_output_flag:
-        resample_func = {
-            pmeto_field: np.sum, etact_field: np.sum, etpot_field: np.sum,
-            etbas_field: np.sum, kc_field: np.mean, kcb_field: np.mean,
-            niwr_field: np.sum, precip_field: np.sum, irrig_field: np.sum,
-            runoff_field: np.sum, dperc_field: np.sum, season_field: np.sum,
-            cutting_field: np.sum}
-        annual_output_pd = daily_output_pd.resample('AS').apply(resample_func)
-        # annual_output_pd = daily_output_pd.resample(
-        #     'AS', how=resample_func)
-
-    # Get growing season start and end DOY for each year
-    # Compute growing season length for each year
-    if data.gs_output_flag:
-        gs_output_pd = daily_output_pd.resample('AS').apply(
-            {year_field: np.mean})
-        # gs_output_pd = daily_output_pd.resample(
-        #     'AS', how={year_field: np.mean})
-        gs_output_pd[gs_start_doy_field] = np.nan
-        gs_output_pd[gs_end_doy_field] = np.nan
-        gs_output_pd[gs_start_date_field] = None
-        gs_output_pd[gs_end_date_field] = None
-        gs_output_pd[gs_length_field] = np.nan
-        for year_i, (year, group) in enumerate(daily_output_pd.groupby([year_field])):
-            # if year_i == 0:
-            #     .debug('  Skipping first year')
-            #
-            if not np.any(group[season_field].values):
-                logging.debug('  Skipping, season flag was never set to 1')
-                continue
-            else:
-                season_diff = np.diff(group[season_field].values)
-                try:
-                    start_i = np.where(season_diff == 1)[0][0] + 1
-                    gs_output_pd.set_value(
-                        group.index[0], gs_start_doy_field,
-                        int(group.ix[start_i, doy_field]))
-                except:
-                    gs_output_pd.set_value(
-                        group.index[0], gs_start_doy_field,
-                        int(min(group[doy_field].values)))
-                try:
-                    end_i = np.where(season_diff == -1)[0][0] + 1
-                    gs_output_pd.set_value(
-                        group.index[0], gs_end_doy_field,
-                        int(group.ix[end_i, doy_field]))
-                except:
-                    gs_output_pd.set_value(
-                        group.index[0], gs_end_doy_field,
-                        int(max(group[doy_field].values)))
-                del season_diff
-            gs_output_pd.set_value(
-                group.index[0], gs_length_field,
-                int(sum(group[season_field].values)))
-
-
-    # # Write daily output
-    if data.daily_output_flag:
-        daily_output_pd[year_field] = daily_output_pd.index.year
-        daily_output_pd[month_field] = daily_output_pd.index.month
-        daily_output_pd[day_field] = daily_output_pd.index.day
-        daily_output_pd[year_field] = daily_output_pd[year_field].map(
-            lambda x: ' %4d' % x)
-        daily_output_pd[month_field] = daily_output_pd[month_field].map(
-            lambda x: ' %2d' % x)
-        daily_output_pd[day_field] = daily_output_pd[day_field].map(
-            lambda x: ' %2d' % x)
-        daily_output_pd[doy_field] = daily_output_pd[doy_field].map(
-            lambda x: ' %3d' % x)
-        # This will convert negative "zeros" to positive
-        daily_output_pd[niwr_field] = np.round(daily_output_pd[niwr_field], 6)
-        daily_output_pd[season_field] = daily_output_pd[season_field].map(
-            lambda x: ' %1d' % x)
-        # daily_output_pd['Irrigation'] = daily_output_pd['Irrigation'].map(
-        #      x: daily_flt_format % x)
-        daily_output_path = os.path.join(
-            data.daily_output_ws, '{0}_daily_crop_{1:02d}.csv'.format(
-                et_cell.cell_id, int(crop.class_number)))
-        # Set the output column order
-        daily_output_columns = [
-            year_field, month_field, day_field, doy_field, pmeto_field,
-            etact_field, etpot_field, etbas_field, kc_field, kcb_field,
-            precip_field, irrig_field, runoff_field, dperc_field,
-            niwr_field, season_field]
-        # Remove these (instead of appending) to preserve column order
-        if not data.kc_flag:
-            daily_output_columns.remove(kc_field)
-            daily_output_columns.remove(kcb_field)
-        if not data.niwr_flag:
-            daily_output_columns.remove(niwr_field)
-        # Most crops do not have cuttings, so append if needed
-        if data.cutting_flag and crop.cutting_crop:
-            daily_output_pd[cutting_field] = daily_output_pd[cutting_field].map(
-                lambda x: ' %1d' % x)
-            daily_output_columns.append(cutting_field)
-        with open(daily_output_path, 'w') as daily_output_f:
-            daily_output_f.write(
-                '# {0:2d} - {1}\n'.format(crop.class_number, crop.name))
-            daily_output_pd.to_csv(
-                daily_output_f, sep=',', columns=daily_output_columns,
-                float_format='%10.6f', date_format='%Y-%m-%d')
-        del daily_output_pd, daily_output_path, daily_output_columns
-
-    # Write monthly statistics
-    if data.monthly_output_flag:
-        monthly_output_pd[year_field] = monthly_output_pd.index.year
-        monthly_output_pd[month_field] = monthly_output_pd.index.month
-        monthly_output_pd[year_field] = monthly_output_pd[year_field].map(
-            lambda x: ' %4d' % x)
-        monthly_output_pd[month_field] = monthly_output_pd[month_field].map(
-            lambda x: ' %2d' % x)
-        monthly_output_pd[season_field] = monthly_output_pd[season_field].map(
-            lambda x: ' %2d' % x)
-        monthly_output_path = os.path.join(
-            data.monthly_output_ws, '{0}_monthly_crop_{1:02d}.csv'.format(
-                et_cell.cell_id, int(crop.class_number)))
-        monthly_output_columns = [
-            year_field, month_field, pmeto_field, etact_field, etpot_field,
-            etbas_field, kc_field, kcb_field, precip_field, irrig_field,
-            runoff_field, dperc_field, niwr_field,
-            season_field]
-        if data.cutting_flag and crop.cutting_crop:
-            monthly_output_pd[cutting_field] = monthly_output_pd[cutting_field].map(
-                lambda x: ' %1d' % x)
-            monthly_output_columns.append(cutting_field)
-        with open(monthly_output_path, 'w') as monthly_output_f:
-            monthly_output_f.write(
-                '# {0:2d} - {1}\n'.format(crop.class_number, crop.name))
-            monthly_output_pd.to_csv(
-                monthly_output_f, sep=',', columns=monthly_output_columns,
-                float_format=' %8.4f', date_format='%Y-%m')
-        del monthly_output_pd, monthly_output_path, monthly_output_columns
-
-    # Write annual statistics
-    if data.annual_output_flag:
-        annual_output_pd[year_field] = annual_output_pd.index.year
-        annual_output_pd[season_field] = annual_output_pd[season_field].map(
-            lambda x: ' %3d' % x)
-        annual_output_path = os.path.join(
-            data.annual_output_ws, '{0}_annual_crop_{1:02d}.csv'.format(
-                et_cell.cell_id, int(crop.class_number)))
-        annual_output_columns = [
-            year_field, pmeto_field, etact_field, etpot_field, etbas_field,
-            kc_field, kcb_field, precip_field, irrig_field, runoff_field,
-            dperc_field, niwr_field, season_field]
-        if data.cutting_flag and crop.cutting_crop:
-            annual_output_pd[cutting_field] = annual_output_pd[cutting_field].map(
-                lambda x: ' %2d' % x)
-            annual_output_columns.append(cutting_field)
-        with open(annual_output_path, 'w') as annual_output_f:
-            annual_output_f.write(
-                '# {0:2d} - {1}\n'.format(crop.class_number, crop.name))
-            annual_output_pd.to_csv(
-                annual_output_f, sep=',', columns=annual_output_columns,
-                float_format=' %9.4f', date_format='%Y', index=False)
-        del annual_output_pd, annual_output_path, annual_output_columns
-
-    # Write growing season statistics
-    if data.gs_output_flag:
-        def doy_2_date(test_year, test_doy):
-            try:
-                test_dt = datetime.datetime.strptime(
-                    '{0}_{1}'.format(int(test_year), int(test_doy)),
-                    '%Y_%j')
-                return test_dt.date().isoformat()
-            except:
-                return 'None'
-        gs_output_pd[gs_start_date_field] = gs_output_pd[
-            [year_field, gs_start_doy_field]].apply(
-                lambda s: doy_2_date(*s), axis=1)
-        gs_output_pd[gs_end_date_field] = gs_output_pd[
-            [year_field, gs_end_doy_field]].apply(
-                lambda s: doy_2_date(*s), axis=1)
-        # gs_output_pd[gs_start_doy_field] = gs_output_pd[
-        #     gs_start_doy_field].map(lambda x: ' %3d' % x)
-        # gs_output_pd[gs_end_doy_field] = gs_output_pd[
-        #     gs_end_doy_field].map(lambda x: ' %3d' % x)
-        # gs_output_pd[gs_length_field] = gs_output_pd[
-        #     gs_length_field].map(lambda x: ' %3d' % x)
-        gs_output_path = os.path.join(
-            data.gs_output_ws, '{0}_gs_crop_{1:02d}.csv'.format(
-                et_cell.cell_id, int(crop.class_number)))
-        gs_output_columns = [
-            year_field, gs_start_doy_field, gs_end_doy_field,
-            gs_start_date_field, gs_end_date_field, gs_length_field]
-        with open(gs_output_path, 'w') as gs_output_f:
-            gs_output_f.write(
-                '# {0:2d} - {1}\n'.format(crop.class_number, crop.name))
-            gs_start_doy = int(round(gs_output_pd[gs_start_doy_field].mean()))
-            gs_end_doy = int(round(gs_output_pd[gs_end_doy_field].mean()))
-            gs_start_dt = datetime.datetime.strptime(
-                '2001_{:03d}'.format(gs_start_doy), '%Y_%j')
-            gs_end_dt = datetime.datetime.strptime(
-                '2001_{:03d}'.format(gs_end_doy), '%Y_%j')
-            gs_output_f.write(
-                '# Mean Start Date: {dt.month}/{dt.day}  ({doy})\n'.format(
-                    dt=gs_start_dt, doy=gs_start_doy))
-            gs_output_f.write(
-                '# Mean End Date:   {dt.month}/{dt.day}  ({doy})\n'.format(
-                    dt=gs_end_dt, doy=gs_end_doy))
-            gs_output_pd.to_csv(
-                gs_output_f, sep=',', columns=gs_output_columns,
-                date_format='%Y', index=False)
-        del gs_output_pd, gs_output_path, gs_output_columns
 
 if __name__ == '__main__':
     pass
@@ -182,6 +182,173 @@ class CropETData():
                 logging.debug('    gs_output_folder = growing_season_stats')
                 self.gs_output_ws = 'growing_season_stats'
 
+        # Daily, monthly and annual output file format
+        # Growing season stats are always written as CSV files
+        try:
+            self.output_format = config.get(
+                crop_et_sec, 'output_format').lower()
+        except:
+            logging.debug('    output_format = csv')
+            self.output_format = 'csv'
+        if self.output_format not in ['csv', 'parquet', 'hdf5']:
+            logging.error(
+                '  ERROR: output_format must be csv, parquet or hdf5')
+            sys.exit()
+        elif self.output_format == 'parquet':
+            try:
+                import pyarrow
+            except ImportError:
+                logging.error(
+                    '  ERROR: The pyarrow module is needed for ' +
+                    'output_format = parquet')
+                sys.exit()
+        elif self.output_format == 'hdf5':
+            try:
+                import tables
+            except ImportError:
+                logging.error(
+                    '  ERROR: The pytables module is needed for ' +
+                    'output_format = hdf5')
+                sys.exit()
+
+        # CSV output files can be compressed as they are written
+        try:
+            self.output_compression = config.get(
+                crop_et_sec, 'output_compression').lower()
+        except:
+            logging.debug('    output_compression = None')
+            self.output_compression = 'none'
+        if self.output_compression in ['none', '']:
+            self.output_compression = None
+        elif self.output_compression not in ['gzip', 'zstd']:
+            logging.error(
+                '  ERROR: output_compression must be none, gzip or zstd')
+            sys.exit()
+        elif self.output_format != 'csv':
+            logging.warning(
+                '  The {} output files are already compressed, '
+                'ignoring output_compression'.format(self.output_format))
+            self.output_compression = None
+        elif self.output_compression == 'zstd':
+            try:
+                import zstandard
+            except ImportError:
+                logging.error(
+                    '  ERROR: The zstandard module is needed for ' +
+                    'output_compression = zstd')
+                sys.exit()
+
+        # Output variables and precision
+        # The date columns are always written
+        output_field_list = [
+            'PMETo', 'ETact', 'ETpot', 'ETbas', 'Kc', 'Kcb', 'PPT',
+            'Irrigation', 'Runoff', 'DPerc', 'NIWR', 'Season', 'Cutting']
+        try:
+            output_fields = [
+                f.strip() for f in config.get(
+                    crop_et_sec, 'output_fields').split(',')
+                if f.strip()]
+        except:
+            logging.debug('    output_fields = all')
+            output_fields = []
+        if output_fields:
+            field_dict = dict((f.lower(), f) for f in output_field_list)
+            invalid_fields = [
+                f for f in output_fields if f.lower() not in field_dict]
+            if invalid_fields:
+                logging.error(
+                    ('  ERROR: Unsupported output_fields: {}\n' +
+                     '  Output fields must be: {}').format(
+                        ', '.join(invalid_fields), ', '.join(output_field_list)))
+                sys.exit()
+            self.output_fields = [field_dict[f.lower()] for f in output_fields]
+        else:
+            self.output_fields = None
+        try:
+            self.output_precision = config.getint(
+                crop_et_sec, 'output_precision')
+        except:
+            logging.debug('    output_precision = None')
+            self.output_precision = None
+        if self.output_precision is not None and self.output_precision < 0:
+            logging.error('  ERROR: output_precision must be >= 0')
+            sys.exit()
+        try:
+            self.output_dtype = config.get(
+                crop_et_sec, 'output_dtype').lower()
+        except:
+            logging.debug('    output_dtype = float64')
+            self.output_dtype = 'float64'
+        if self.output_dtype not in ['float32', 'float64']:
+            logging.error('  ERROR: output_dtype must be float32 or float64')
+            sys.exit()
+
+        # Number of crop results that can wait to be written while the
+        #   next crop is simulated (0 to write each crop before the next)
+        try:
+            self.output_queue_size = config.getint(
+                crop_et_sec, 'output_queue_size')
+        except:
+            logging.debug('    output_queue_size = 2')
+            self.output_queue_size = 2
+        if self.output_queue_size < 0:
+            logging.error('  ERROR: output_queue_size must be >= 0')
+            sys.exit()
+
+        # Basin wide memory-mapped cube of the daily results
+        try:
+            self.cube_flag = config.getboolean(crop_et_sec, 'result_cube_flag')
+        except:
+            logging.debug('    result_cube_flag = False')
+            self.cube_flag = False
+        try:
+            self.cube_name = config.get(crop_et_sec, 'result_cube_name')
+        except:
+            logging.debug('    result_cube_name = result_cube')
+            self.cube_name = 'result_cube'
+
+        # Area weighted cell and basin totals from the crop acreages
+        #   (CROP_NN fields) of the ET cells shapefile
+        try:
+            self.basin_stats_flag = config.getboolean(
+                crop_et_sec, 'basin_stats_flag')
+        except:
+            logging.debug('    basin_stats_flag = False')
+            self.basin_stats_flag = False
+        if self.basin_stats_flag:
+            try:
+                self.cells_path = config.get(crop_et_sec, 'cells_path')
+            except:
+                logging.error(
+                    '  ERROR: cells_path must be set when basin_stats_flag ' +
+                    '= True')
+                sys.exit()
+            if not os.path.isfile(self.cells_path):
+                logging.error(
+                    '  ERROR: The ET cells shapefile {} does not exist'.format(
+                        self.cells_path))
+                sys.exit()
+            try:
+                self.basin_output_ws = os.path.join(
+                    self.project_ws,
+                    config.get(crop_et_sec, 'basin_output_folder'))
+            except:
+                logging.debug('    basin_output_folder = basin_stats')
+                self.basin_output_ws = os.path.join(
+                    self.project_ws, 'basin_stats')
+            if not os.path.isdir(self.basin_output_ws):
+                os.makedirs(self.basin_output_ws)
+
+        # Warm state snapshots are only written/read if set in mod_crop_et
+        self.snapshot_flag = False
+        self.append_flag = False
+        try:
+            self.snapshot_ws = os.path.join(
+                self.project_ws, config.get(crop_et_sec, 'snapshot_folder'))
+        except:
+            logging.debug('    snapshot_folder = snapshots')
+            self.snapshot_ws = os.path.join(self.project_ws, 'snapshots')
+
         # Start/end date
         try:
             self.start_dt = dt.datetime.strptime(config.get(
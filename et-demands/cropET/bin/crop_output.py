@@ -0,0 +1,863 @@
+#!/usr/bin/env python
+import copy
+import cStringIO
+import datetime
+import gzip
+import logging
+import os
+import Queue
+import re
+import sys
+import threading
+
+import numpy as np
+import pandas as pd
+
+import basin_stats
+import crop_snapshot
+import crop_stats
+import result_cube
+
+
+class CropOutput():
+    """Compact daily results for a single cell/crop
+
+    Workers return these to the parent process instead of writing their own
+    output files, so only a single writer stage touches the output folders.
+    """
+    # Float variables saved from the crop data frame
+    float_fields = [
+        'etref', 'et_act', 'et_pot', 'et_bas', 'kc_act', 'kc_bas',
+        'irrigation', 'runoff', 'dperc', 'niwr']
+
+    def __init__(self, et_cell, crop, foo):
+        """Pull the result arrays from the crop and weather data frames
+
+        Args:
+            et_cell ():
+            crop ():
+            foo ():
+        """
+        self.cell_id = et_cell.cell_id
+        self.crop_num = int(crop.class_number)
+        self.crop_name = crop.name
+        self.cutting_crop = crop.cutting_crop
+
+        # When the daily values were reduced in the day loop,
+        #   only the monthly/annual statistics are kept
+        self.period_pd = dict()
+        if foo.reducers is not None:
+            self.date = None
+            for period, reducer in foo.reducers.items():
+                self.period_pd[period] = reducer.stats()
+        else:
+            self.date = foo.crop_pd.index.values
+            self.doy = foo.crop_pd['doy'].values.astype(np.int16)
+            self.season = foo.crop_pd['season'].values.astype(np.int8)
+            self.cutting = foo.crop_pd['cutting'].values.astype(np.int8)
+            self.data = dict([
+                (field, foo.crop_pd[field].values.astype(np.float64))
+                for field in self.float_fields])
+            # Only keep the precipitation values for the crop dates
+            self.data['ppt'] = et_cell.weather_pd['ppt'].loc[
+                foo.crop_pd.index].values.astype(np.float64)
+
+        # Growing season statistics for each year (see SeasonTracker)
+        self.gs = foo.gs_tracker.table()
+
+        # When appending to a previous run, rows from this year onward
+        #   replace the rows in the existing output files
+        self.append_year = None
+        # Warm state to be saved by the writer (see crop_snapshot)
+        self.snapshot = None
+
+    def __str__(self):
+        """ """
+        return '<CropOutput {0}, crop {1:02d}>'.format(
+            self.cell_id, self.crop_num)
+
+    def period_stats(self, period='month'):
+        """Monthly or annual statistics (see crop_stats.period_stats())"""
+        if period in self.period_pd:
+            return self.period_pd[period].copy()
+        return crop_stats.period_stats(self, period)
+
+    def end_dt(self):
+        """Date of the last day in the results"""
+        return pd.Timestamp(self.date[-1]).to_pydatetime()
+
+    def subset(self, mask):
+        """Return a copy of the results for the masked days"""
+        output = copy.copy(self)
+        output.date = self.date[mask]
+        output.doy = self.doy[mask]
+        output.season = self.season[mask]
+        output.cutting = self.cutting[mask]
+        output.data = dict([(k, v[mask]) for k, v in self.data.items()])
+        year_mask = np.in1d(
+            self.gs['year'],
+            np.unique(output.date.astype('datetime64[Y]').astype(np.int64) +
+                      1970))
+        output.gs = dict([(k, v[year_mask]) for k, v in self.gs.items()])
+        output.snapshot = None
+        return output
+
+    def last_year(self):
+        """Return a copy of the results since January 1st of the last year"""
+        return self.subset(self.date >= np.datetime64(
+            '{0:04d}-01-01'.format(self.end_dt().year)))
+
+    def concat(self, other):
+        """Return a copy of the results with other appended to the end"""
+        output = copy.copy(other)
+        output.date = np.concatenate([self.date, other.date])
+        output.doy = np.concatenate([self.doy, other.doy])
+        output.season = np.concatenate([self.season, other.season])
+        output.cutting = np.concatenate([self.cutting, other.cutting])
+        output.data = dict([
+            (k, np.concatenate([self.data[k], other.data[k]]))
+            for k in self.data.keys()])
+        return output
+
+
+class CropOutputWriter():
+    """Single writer stage for the crop output files
+
+    All output files are written from the parent process, in the order the
+    results are received.  Summary values needed after the run are kept in
+    memory so the output files do not need to be read back in.
+
+    If queue_size is greater than 0, the results are written by a background
+    thread so the next crop can be simulated while the previous crop's
+    output files are formatted and written.  Once the queue is full, write()
+    waits for the writer thread.  Call flush() before using the summary
+    values and close() at the end of the run.
+    """
+    def __init__(self, data, manifest=None, cells=None, queue_size=0):
+        """
+
+        Args:
+            data ():
+            manifest (RunManifest): completed tasks are added to the manifest
+                after the output files are written
+            cells (ETCellData): cells with the crop acreages
+                (only needed for the basin stats)
+            queue_size (int): maximum number of results waiting to be
+                written by the writer thread (0 to write in write())
+        """
+        self.data = data
+        self.manifest = manifest
+        self.crop_count = 0
+        # The daily results are also written into the basin result cube
+        if data.cube_flag:
+            self.cube = result_cube.ResultCube(
+                result_cube.cube_path(data)).open('r+')
+        else:
+            self.cube = None
+        # Mean growing season start/end DOY, keyed by (cell_id, crop_num)
+        self.gs_summary = dict()
+        # Area weighted annual totals
+        if data.basin_stats_flag and cells is not None:
+            self.basin = basin_stats.BasinStats(data, cells)
+        else:
+            self.basin = None
+
+        # Background writer thread
+        self.queue = None
+        self.thread = None
+        self.error = None
+        if queue_size > 0:
+            self.queue = Queue.Queue(maxsize=queue_size)
+            self.thread = threading.Thread(target=self._run)
+            self.thread.daemon = True
+            self.thread.start()
+
+    def _run(self):
+        """Write the queued results until close() is called"""
+        while True:
+            crop_output = self.queue.get()
+            try:
+                if crop_output is None:
+                    break
+                # Stop writing after an error, but keep emptying the queue
+                elif self.error is None:
+                    self._write(crop_output)
+            except Exception:
+                self.error = sys.exc_info()
+            finally:
+                self.queue.task_done()
+
+    def _check_error(self):
+        """Raise an error from the writer thread in the calling thread"""
+        if self.error is not None:
+            error = self.error
+            self.error = None
+            raise error[0], error[1], error[2]
+
+    def write(self, crop_output):
+        """Write (or queue) the output files for a single cell/crop
+
+        Args:
+            crop_output (CropOutput): daily results for the cell/crop
+        """
+        if crop_output is None:
+            return
+        elif self.queue is None:
+            self._write(crop_output)
+        else:
+            self._check_error()
+            self.queue.put(crop_output)
+
+    def flush(self):
+        """Wait for all of the queued results to be written"""
+        if self.queue is not None:
+            self.queue.join()
+            self._check_error()
+
+    def close(self):
+        """Write the queued results and stop the writer thread"""
+        if self.queue is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.queue = None
+            self.thread = None
+            self._check_error()
+
+    def _write(self, crop_output):
+        """Write the output files for a single cell/crop"""
+        gs_output_pd = write_crop_output(self.data, crop_output)
+        if gs_output_pd is not None:
+            self.gs_summary[(crop_output.cell_id, crop_output.crop_num)] = (
+                gs_output_pd['Start_DOY'].mean(),
+                gs_output_pd['End_DOY'].mean())
+        if self.cube is not None:
+            self.cube.write(crop_output)
+        if self.basin is not None:
+            self.basin.add_crop_output(crop_output)
+        if crop_output.snapshot is not None:
+            crop_snapshot.write_snapshot(
+                self.data, crop_output.cell_id, crop_output.crop_num,
+                crop_output.snapshot)
+        if self.manifest is not None:
+            self.manifest.add(crop_output.cell_id, crop_output.crop_num)
+        self.crop_count += 1
+
+    def write_list(self, crop_output_list):
+        """Write the output files for a list of cell/crop results"""
+        for crop_output in crop_output_list:
+            self.write(crop_output)
+
+
+# File extensions of the daily, monthly and annual output formats
+output_extensions = {'csv': '.csv', 'parquet': '.parquet', 'hdf5': '.h5'}
+# Additional file extensions of the compressed CSV files
+compression_extensions = {'gzip': '.gz', 'zstd': '.zst'}
+
+
+def output_paths(data, cell_id, crop_num):
+    """Build the output file paths for a single cell/crop
+
+    Args:
+        data ():
+        cell_id (str): ET cell ID
+        crop_num (int): crop number
+
+    Returns:
+        dict of the file paths for each of the active output types
+    """
+    output_ext = output_extensions[data.output_format]
+    if data.output_compression is not None:
+        output_ext += compression_extensions[data.output_compression]
+    path_dict = dict()
+    if data.daily_output_flag:
+        path_dict['daily'] = os.path.join(
+            data.daily_output_ws, '{0}_daily_crop_{1:02d}{2}'.format(
+                cell_id, int(crop_num), output_ext))
+    if data.monthly_output_flag:
+        path_dict['monthly'] = os.path.join(
+            data.monthly_output_ws, '{0}_monthly_crop_{1:02d}{2}'.format(
+                cell_id, int(crop_num), output_ext))
+    if data.annual_output_flag:
+        path_dict['annual'] = os.path.join(
+            data.annual_output_ws, '{0}_annual_crop_{1:02d}{2}'.format(
+                cell_id, int(crop_num), output_ext))
+    if data.gs_output_flag:
+        path_dict['gs'] = os.path.join(
+            data.gs_output_ws, '{0}_gs_crop_{1:02d}.csv'.format(
+                cell_id, int(crop_num)))
+    return path_dict
+
+
+def write_crop_output(data, crop_output):
+    """Write ET-Demands output files for each cell/crop
+
+    Args:
+        data ():
+        crop_output (CropOutput): daily results for the cell/crop
+
+    Returns:
+        DataFrame of the growing season statistics (or None)
+    """
+    year_field = 'Year'
+    month_field = 'Month'
+    day_field = 'Day'
+    doy_field = 'DOY'
+    pmeto_field = 'PMETo'
+    precip_field = 'PPT'
+    etact_field = 'ETact'
+    etpot_field = 'ETpot'
+    etbas_field = 'ETbas'
+    irrig_field = 'Irrigation'
+    season_field = 'Season'
+    cutting_field = 'Cutting'
+    runoff_field = 'Runoff'
+    dperc_field = 'DPerc'
+    niwr_field = 'NIWR'
+    kc_field = 'Kc'
+    kcb_field = 'Kcb'
+    gs_start_doy_field = 'Start_DOY'
+    gs_end_doy_field = 'End_DOY'
+    gs_start_date_field = 'Start_Date'
+    gs_end_date_field = 'End_Date'
+    gs_length_field = 'GS_Length'
+
+    # Compute monthly and annual stats from the daily result arrays
+    if data.monthly_output_flag:
+        monthly_output_pd = crop_output.period_stats('month')
+    if data.annual_output_flag:
+        annual_output_pd = crop_output.period_stats('year')
+
+    # Get growing season start and end DOY for each year
+    # The statistics were tracked in the day loop, only keep the years
+    #   of the daily results (the tracker covers the whole run when appending)
+    if data.gs_output_flag:
+        if crop_output.date is not None:
+            first_year = pd.Timestamp(crop_output.date[0]).year
+            year_mask = crop_output.gs['year'] >= first_year
+        else:
+            year_mask = np.ones(crop_output.gs['year'].shape, dtype=bool)
+        gs_output_pd = pd.DataFrame({
+            year_field: crop_output.gs['year'][year_mask],
+            gs_start_doy_field: crop_output.gs['start_doy'][year_mask],
+            gs_end_doy_field: crop_output.gs['end_doy'][year_mask],
+            gs_length_field: crop_output.gs['length'][year_mask]})
+        for year in gs_output_pd.loc[
+                gs_output_pd[gs_length_field].isnull(), year_field]:
+            logging.debug(
+                '  Skipping {}, season flag was never set to 1'.format(year))
+
+    # # Write daily output
+    if data.daily_output_flag:
+        daily_output_path = output_paths(
+            data, crop_output.cell_id, crop_output.crop_num)['daily']
+        if data.output_format == 'csv':
+            write_output_text(
+                daily_output_path, daily_output_text(data, crop_output),
+                crop_output.append_year)
+        else:
+            write_output_frame(
+                data, daily_output_path, daily_output_frame(data, crop_output),
+                crop_output)
+        del daily_output_path
+
+    # Write monthly statistics
+    if data.monthly_output_flag:
+        monthly_output_pd[year_field] = monthly_output_pd.index.year
+        monthly_output_pd[month_field] = monthly_output_pd.index.month
+        monthly_output_path = output_paths(
+            data, crop_output.cell_id, crop_output.crop_num)['monthly']
+        monthly_output_columns = [
+            year_field, month_field, pmeto_field, etact_field, etpot_field,
+            etbas_field, kc_field, kcb_field, precip_field, irrig_field,
+            runoff_field, dperc_field, niwr_field,
+            season_field]
+        if data.cutting_flag and crop_output.cutting_crop:
+            monthly_output_columns.append(cutting_field)
+        monthly_output_columns = output_columns(data, monthly_output_columns)
+        monthly_output_pd = output_stats_frame(data, monthly_output_pd)
+        if data.output_format != 'csv':
+            monthly_output_pd.index.rename('Date', inplace=True)
+            write_output_frame(
+                data, monthly_output_path,
+                monthly_output_pd[monthly_output_columns].reset_index(),
+                crop_output)
+        else:
+            monthly_output_pd[year_field] = monthly_output_pd[year_field].map(
+                lambda x: ' %4d' % x)
+            monthly_output_pd[month_field] = monthly_output_pd[month_field].map(
+                lambda x: ' %2d' % x)
+            monthly_output_pd[season_field] = monthly_output_pd[season_field].map(
+                lambda x: ' %2d' % x)
+            if data.cutting_flag and crop_output.cutting_crop:
+                monthly_output_pd[cutting_field] = monthly_output_pd[cutting_field].map(
+                    lambda x: ' %1d' % x)
+            monthly_output_f = cStringIO.StringIO()
+            monthly_output_f.write(
+                '# {0:2d} - {1}\n'.format(
+                    crop_output.crop_num, crop_output.crop_name))
+            monthly_output_pd.to_csv(
+                monthly_output_f, sep=',', columns=monthly_output_columns,
+                float_format=output_float_format(data, ' %8.4f'),
+                date_format='%Y-%m')
+            write_output_text(
+                monthly_output_path, monthly_output_f.getvalue(),
+                crop_output.append_year)
+            monthly_output_f.close()
+        del monthly_output_pd, monthly_output_path, monthly_output_columns
+
+    # Write annual statistics
+    if data.annual_output_flag:
+        annual_output_pd[year_field] = annual_output_pd.index.year
+        annual_output_path = output_paths(
+            data, crop_output.cell_id, crop_output.crop_num)['annual']
+        annual_output_columns = [
+            year_field, pmeto_field, etact_field, etpot_field, etbas_field,
+            kc_field, kcb_field, precip_field, irrig_field, runoff_field,
+            dperc_field, niwr_field, season_field]
+        if data.cutting_flag and crop_output.cutting_crop:
+            annual_output_columns.append(cutting_field)
+        annual_output_columns = output_columns(data, annual_output_columns)
+        annual_output_pd = output_stats_frame(data, annual_output_pd)
+        if data.output_format != 'csv':
+            write_output_frame(
+                data, annual_output_path,
+                annual_output_pd[annual_output_columns].reset_index(drop=True),
+                crop_output)
+        else:
+            annual_output_pd[season_field] = annual_output_pd[season_field].map(
+                lambda x: ' %3d' % x)
+            if data.cutting_flag and crop_output.cutting_crop:
+                annual_output_pd[cutting_field] = annual_output_pd[cutting_field].map(
+                    lambda x: ' %2d' % x)
+            annual_output_f = cStringIO.StringIO()
+            annual_output_f.write(
+                '# {0:2d} - {1}\n'.format(
+                    crop_output.crop_num, crop_output.crop_name))
+            annual_output_pd.to_csv(
+                annual_output_f, sep=',', columns=annual_output_columns,
+                float_format=output_float_format(data, ' %9.4f'),
+                date_format='%Y', index=False)
+            write_output_text(
+                annual_output_path, annual_output_f.getvalue(),
+                crop_output.append_year)
+            annual_output_f.close()
+        del annual_output_pd, annual_output_path, annual_output_columns
+
+    # Write growing season statistics
+    if data.gs_output_flag:
+        def doy_2_date(test_year, test_doy):
+            try:
+                test_dt = datetime.datetime.strptime(
+                    '{0}_{1}'.format(int(test_year), int(test_doy)),
+                    '%Y_%j')
+                return test_dt.date().isoformat()
+            except:
+                return 'None'
+        gs_output_pd[gs_start_date_field] = gs_output_pd[
+            [year_field, gs_start_doy_field]].apply(
+                lambda s: doy_2_date(*s), axis=1)
+        gs_output_pd[gs_end_date_field] = gs_output_pd[
+            [year_field, gs_end_doy_field]].apply(
+                lambda s: doy_2_date(*s), axis=1)
+        # gs_output_pd[gs_start_doy_field] = gs_output_pd[
+        #     gs_start_doy_field].map(lambda x: ' %3d' % x)
+        # gs_output_pd[gs_end_doy_field] = gs_output_pd[
+        #     gs_end_doy_field].map(lambda x: ' %3d' % x)
+        # gs_output_pd[gs_length_field] = gs_output_pd[
+        #     gs_length_field].map(lambda x: ' %3d' % x)
+        gs_output_path = output_paths(
+            data, crop_output.cell_id, crop_output.crop_num)['gs']
+        gs_output_columns = [
+            year_field, gs_start_doy_field, gs_end_doy_field,
+            gs_start_date_field, gs_end_date_field, gs_length_field]
+        # When appending, the mean dates must include the previous years
+        if (crop_output.append_year is not None and
+                os.path.isfile(gs_output_path)):
+            prev_gs_pd = pd.read_table(
+                gs_output_path, header=0, comment='#', sep=',',
+                dtype={gs_start_date_field: str, gs_end_date_field: str},
+                keep_default_na=False, na_values=[''])
+            gs_output_pd = pd.concat([
+                prev_gs_pd[prev_gs_pd[year_field] < crop_output.append_year],
+                gs_output_pd[gs_output_columns]])
+            del prev_gs_pd
+        with open(gs_output_path, 'w') as gs_output_f:
+            gs_output_f.write(
+                '# {0:2d} - {1}\n'.format(
+                    crop_output.crop_num, crop_output.crop_name))
+            gs_start_doy = int(round(gs_output_pd[gs_start_doy_field].mean()))
+            gs_end_doy = int(round(gs_output_pd[gs_end_doy_field].mean()))
+            gs_start_dt = datetime.datetime.strptime(
+                '2001_{:03d}'.format(gs_start_doy), '%Y_%j')
+            gs_end_dt = datetime.datetime.strptime(
+                '2001_{:03d}'.format(gs_end_doy), '%Y_%j')
+            gs_output_f.write(
+                '# Mean Start Date: {dt.month}/{dt.day}  ({doy})\n'.format(
+                    dt=gs_start_dt, doy=gs_start_doy))
+            gs_output_f.write(
+                '# Mean End Date:   {dt.month}/{dt.day}  ({doy})\n'.format(
+                    dt=gs_end_dt, doy=gs_end_doy))
+            gs_output_pd.to_csv(
+                gs_output_f, sep=',', columns=gs_output_columns,
+                date_format='%Y', index=False)
+        del gs_output_path, gs_output_columns
+        return gs_output_pd
+    return None
+
+
+def daily_output_columns(data, crop_output):
+    """Build the daily output columns for a single cell/crop
+
+    Args:
+        data ():
+        crop_output (CropOutput): daily results for the cell/crop
+
+    Returns:
+        list of the column name, CSV format and value array for each column
+    """
+    date = crop_output.date.astype('datetime64[D]')
+    month_start = date.astype('datetime64[M]')
+
+    # Set the output column order
+    daily_columns = [
+        ('Date', '%s', date),
+        ('Year', ' %4d', (
+            date.astype('datetime64[Y]').astype(np.int64) + 1970).astype(
+                np.int16)),
+        ('Month', ' %2d', (month_start.astype(np.int64) % 12 + 1).astype(
+            np.int8)),
+        ('Day', ' %2d', ((date - month_start).astype(np.int64) + 1).astype(
+            np.int8)),
+        ('DOY', ' %3d', crop_output.doy),
+        ('PMETo', '%10.6f', crop_output.data['etref']),
+        ('ETact', '%10.6f', crop_output.data['et_act']),
+        ('ETpot', '%10.6f', crop_output.data['et_pot']),
+        ('ETbas', '%10.6f', crop_output.data['et_bas'])]
+    if data.kc_flag:
+        daily_columns.extend([
+            ('Kc', '%10.6f', crop_output.data['kc_act']),
+            ('Kcb', '%10.6f', crop_output.data['kc_bas'])])
+    daily_columns.extend([
+        ('PPT', '%10.6f', crop_output.data['ppt']),
+        ('Irrigation', '%10.6f', crop_output.data['irrigation']),
+        ('Runoff', '%10.6f', crop_output.data['runoff']),
+        ('DPerc', '%10.6f', crop_output.data['dperc'])])
+    if data.niwr_flag:
+        # This will convert negative "zeros" to positive
+        daily_columns.append(
+            ('NIWR', '%10.6f', np.round(crop_output.data['niwr'], 6)))
+    daily_columns.append(('Season', ' %1d', crop_output.season))
+    # Most crops do not have cuttings, so append if needed
+    if data.cutting_flag and crop_output.cutting_crop:
+        daily_columns.append(('Cutting', ' %1d', crop_output.cutting))
+
+    # Only keep the selected variables and apply the output precision
+    return [
+        (name, output_float_format(data, col_format),
+         output_values(data, values))
+        for name, col_format, values in daily_columns
+        if name in output_columns(data, [name])]
+
+
+# Date columns are written even if they are not in the output fields
+date_fields = ['Date', 'Year', 'Month', 'Day', 'DOY']
+
+
+def output_columns(data, columns):
+    """Filter the output column names to the selected output fields
+
+    Args:
+        data ():
+        columns (list): output column names
+
+    Returns:
+        list
+    """
+    if data.output_fields is None:
+        return columns
+    return [
+        column for column in columns
+        if column in date_fields or column in data.output_fields]
+
+
+def output_float_format(data, float_format):
+    """Apply the output precision to a float format string
+
+    The width is changed by the same number of digits as the precision
+
+    Args:
+        data ():
+        float_format (str): i.e. '%10.6f' (other formats are not changed)
+
+    Returns:
+        str
+    """
+    format_match = re.match('^(\s*%)(\d+)\.(\d+)f$', float_format)
+    if data.output_precision is None or not format_match:
+        return float_format
+    width = (
+        int(format_match.group(2)) - int(format_match.group(3)) +
+        data.output_precision)
+    return '{0}{1}.{2}f'.format(
+        format_match.group(1), width, data.output_precision)
+
+
+def output_values(data, values):
+    """Apply the output precision and float type to the output values
+
+    Args:
+        data ():
+        values (array): other than float values are not changed
+
+    Returns:
+        array
+    """
+    if values.dtype.kind != 'f':
+        return values
+    if data.output_precision is not None:
+        values = np.round(values, data.output_precision)
+    if data.output_dtype != 'float64':
+        values = values.astype(data.output_dtype)
+    return values
+
+
+def output_stats_frame(data, stats_pd):
+    """Apply the output precision and float type to a stats data frame"""
+    if data.output_precision is None and data.output_dtype == 'float64':
+        return stats_pd
+    for column in stats_pd.columns:
+        stats_pd[column] = output_values(data, stats_pd[column].values)
+    return stats_pd
+
+
+def daily_output_text(data, crop_output):
+    """Format the daily output file text for a single cell/crop
+
+    All of the rows are formatted with a single string template instead of
+    formatting each value separately.  The text is identical to writing the
+    formatted daily data frame with DataFrame.to_csv().
+
+    Args:
+        data ():
+        crop_output (CropOutput): daily results for the cell/crop
+
+    Returns:
+        str of the file text (with the header lines)
+    """
+    daily_columns = daily_output_columns(data, crop_output)
+
+    row_count = len(crop_output.date)
+    row_values = np.empty((row_count, len(daily_columns)), dtype=object)
+    row_formats = []
+    for col_i, (name, col_format, values) in enumerate(daily_columns):
+        if values.dtype.kind == 'M':
+            values = np.datetime_as_string(values)
+        elif values.dtype.kind == 'f' and np.any(np.isnan(values)):
+            # Missing values are written as empty strings
+            values = np.where(
+                np.isnan(values), '', np.char.mod(col_format, values))
+            col_format = '%s'
+        row_values[:, col_i] = values
+        row_formats.append(col_format)
+    row_format = ','.join(row_formats) + '\n'
+
+    return ''.join([
+        '# {0:2d} - {1}\n'.format(crop_output.crop_num, crop_output.crop_name),
+        ','.join(name for name, col_format, values in daily_columns) + '\n',
+        (row_format * row_count) % tuple(row_values.ravel().tolist())])
+
+
+def daily_output_frame(data, crop_output):
+    """Build the typed daily output data frame for the binary formats
+
+    The columns match the daily CSV file
+
+    Args:
+        data ():
+        crop_output (CropOutput): daily results for the cell/crop
+
+    Returns:
+        DataFrame
+    """
+    daily_columns = daily_output_columns(data, crop_output)
+    daily_pd = pd.DataFrame(
+        dict([(name, values) for name, col_format, values in daily_columns]))
+    return daily_pd[[name for name, col_format, values in daily_columns]]
+
+
+def write_output_frame(data, output_path, output_pd, crop_output):
+    """Write a daily, monthly or annual output data frame to a binary file
+
+    The crop number and name (the first line of the CSV files) are saved
+    in the file metadata.  When appending to a previous run, the existing
+    rows before the append year are kept.
+
+    Args:
+        data ():
+        output_path (str): output file path
+        output_pd (DataFrame): output values (the Date is a column)
+        crop_output (CropOutput): daily results for the cell/crop
+    """
+    if (crop_output.append_year is not None and
+            os.path.isfile(output_path)):
+        prev_pd = read_output_frame(output_path)[1]
+        output_pd = pd.concat(
+            [prev_pd[prev_pd['Year'] < crop_output.append_year], output_pd],
+            ignore_index=True)
+        del prev_pd
+    crop_str = '{0:2d} - {1}'.format(
+        crop_output.crop_num, crop_output.crop_name)
+
+    if data.output_format == 'parquet':
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        output_table = pa.Table.from_pandas(output_pd, preserve_index=False)
+        metadata = dict(output_table.schema.metadata or {})
+        metadata[b'crop'] = crop_str.encode('utf-8')
+        pq.write_table(
+            output_table.replace_schema_metadata(metadata), output_path,
+            compression='snappy')
+    elif data.output_format == 'hdf5':
+        output_store = pd.HDFStore(
+            output_path, mode='w', complevel=5, complib='zlib')
+        output_store.put('data', output_pd, format='fixed')
+        output_store.get_storer('data').attrs.crop = crop_str
+        output_store.close()
+
+
+def read_output_frame(output_path, sep=',', usecols=None):
+    """Read a daily, monthly or annual output file written in any format
+
+    The output files can be CSV, Parquet (.parquet) or HDF5 (.h5) files.
+    Gzip (.gz) and Zstandard (.zst) compressed CSV files are decompressed
+    as they are read.  This is also used by the tools (see tools/util.py).
+
+    Args:
+        output_path (str): output file path
+        sep (str): CSV file delimiter
+        usecols (list): only read these columns (default reads all columns)
+
+    Returns:
+        tuple of the crop string ("NN - Crop Name") and the DataFrame
+    """
+    if output_path.lower().endswith('.parquet'):
+        import pyarrow.parquet as pq
+        output_table = pq.read_table(output_path, columns=usecols)
+        crop_str = output_table.schema.metadata[b'crop'].decode('utf-8')
+        return crop_str.strip(), output_table.to_pandas()
+    elif output_path.lower().endswith('.h5'):
+        output_store = pd.HDFStore(output_path, mode='r')
+        output_pd = output_store.get('data')
+        crop_str = output_store.get_storer('data').attrs.crop
+        output_store.close()
+        # The fixed format HDF5 files can't be read by column
+        if usecols is not None:
+            output_pd = output_pd[usecols]
+        return crop_str.strip(), output_pd
+    elif output_path.lower().endswith(('.gz', '.zst')):
+        output_f = cStringIO.StringIO(read_output_text(output_path))
+        crop_str = output_f.readline().lstrip('#').strip()
+        output_f.seek(0)
+        return crop_str, pd.read_table(
+            output_f, header=0, comment='#', sep=sep, usecols=usecols)
+    else:
+        with open(output_path, 'r') as output_f:
+            crop_str = output_f.readline().lstrip('#').strip()
+        return crop_str, pd.read_table(
+            output_path, header=0, comment='#', sep=sep, usecols=usecols)
+
+
+def open_output(output_path, mode='r'):
+    """Open an output text file
+
+    Gzip (.gz) and Zstandard (.zst) files are compressed/decompressed
+    as they are written/read
+
+    Args:
+        output_path (str): output file path
+        mode (str): 'r' or 'w'
+
+    Returns:
+        file object
+    """
+    if output_path.lower().endswith('.gz'):
+        return gzip.open(output_path, mode + 'b')
+    elif output_path.lower().endswith('.zst'):
+        import zstandard
+        if mode == 'w':
+            return zstandard.ZstdCompressor(level=3).stream_writer(
+                open(output_path, 'wb'))
+        else:
+            return zstandard.ZstdDecompressor().stream_reader(
+                open(output_path, 'rb'))
+    return open(output_path, mode)
+
+
+def read_output_text(output_path):
+    """Read the full text of an output file (see open_output())"""
+    output_f = open_output(output_path, 'r')
+    try:
+        return output_f.read()
+    finally:
+        output_f.close()
+
+
+def write_output_text(output_path, output_text, append_year=None):
+    """Write the formatted text of an output file
+
+    When appending to a previous run, the existing rows before the append
+    year are kept and the data rows of the new text replace everything from
+    the append year onward.  All of the output files start with one or more
+    comment lines and a column header line, and every data row starts with
+    the year.
+
+    Args:
+        output_path (str): output file path
+        output_text (str): formatted file text (with the header lines)
+        append_year (int): first year of the new rows
+    """
+    if append_year is None or not os.path.isfile(output_path):
+        output_f = open_output(output_path, 'w')
+        output_f.write(output_text)
+        output_f.close()
+        return True
+
+    # Skip the comment lines and the column header line of the new text
+    new_lines = output_text.splitlines(True)
+    header_count = 1
+    while new_lines[header_count - 1].startswith('#'):
+        header_count += 1
+
+    # Compressed files can't be truncated, so the kept rows are rewritten
+    if output_path.lower().endswith(('.gz', '.zst')):
+        prev_lines = read_output_text(output_path).splitlines(True)
+        keep_count = header_count
+        while (keep_count < len(prev_lines) and
+               int(prev_lines[keep_count].lstrip()[:4]) < append_year):
+            keep_count += 1
+        output_f = open_output(output_path, 'w')
+        output_f.write(''.join(prev_lines[:keep_count] + new_lines[header_count:]))
+        output_f.close()
+        return True
+
+    with open(output_path, 'r+') as output_f:
+        # Find the offset of the first existing row at or after the year
+        offset = 0
+        line_count = 0
+        while True:
+            line = output_f.readline()
+            if not line:
+                break
+            line_count += 1
+            if (line_count > header_count and
+                    int(line.lstrip()[:4]) >= append_year):
+                break
+            offset = output_f.tell()
+        output_f.seek(offset)
+        output_f.truncate()
+        output_f.write(''.join(new_lines[header_count:]))
+    return True
+
+
+if __name__ == '__main__':
+    pass
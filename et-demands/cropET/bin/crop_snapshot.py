@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+import copy
+import cPickle as pickle
+import logging
+import os
+
+
+class CropSnapshot():
+    """Warm state of a single cell/crop at the end of a run
+
+    The snapshot holds everything needed to continue the day loop on the
+    next day without re-simulating the period of record:
+        foo: InitializeCropCycle state (soil water, season flags, CGDD,
+            30 day ETref mean, long term planting/green-up DOY, etc.)
+        foo_day: DayData state (30 day ETref buffer, doy_prev, sdays)
+        tail: CropOutput daily results since January 1st of the last year,
+            used to recompute the monthly, annual and growing season
+            statistics for the periods that are still open
+    """
+    def __init__(self, foo, foo_day, crop_output):
+        """
+
+        Args:
+            foo (InitializeCropCycle):
+            foo_day (DayData):
+            crop_output (CropOutput): daily results for the cell/crop
+        """
+        self.end_dt = crop_output.end_dt()
+
+        # The output data frames are rebuilt for the new dates
+        self.foo = copy.copy(foo)
+        for attr in ['crop_pd', 'co2']:
+            if hasattr(self.foo, attr):
+                delattr(self.foo, attr)
+        self.foo_day = foo_day
+        self.tail = crop_output.last_year()
+
+
+def snapshot_path(data, cell_id, crop_num):
+    """Build the snapshot file path for a single cell/crop"""
+    return os.path.join(
+        data.snapshot_ws, '{0}_snapshot_crop_{1:02d}.pkl'.format(
+            cell_id, int(crop_num)))
+
+
+def read_snapshot(data, cell_id, crop_num):
+    """Read the warm state for a single cell/crop
+
+    Returns:
+        CropSnapshot (or None if the snapshot could not be read)
+    """
+    input_path = snapshot_path(data, cell_id, crop_num)
+    if not os.path.isfile(input_path):
+        logging.warning(
+            '  Crop {0:2d} - snapshot not found, processing all days'.format(
+                int(crop_num)))
+        return None
+    try:
+        with open(input_path, 'rb') as input_f:
+            return pickle.load(input_f)
+    except Exception as e:
+        logging.warning(
+            ('  Crop {0:2d} - snapshot could not be read, ' +
+             'processing all days\n  {1}').format(int(crop_num), e))
+        return None
+
+
+def write_snapshot(data, cell_id, crop_num, snapshot):
+    """Write the warm state for a single cell/crop
+
+    The snapshot is written to a temporary file first so that a killed run
+    can't leave a partial snapshot behind
+    """
+    if not os.path.isdir(data.snapshot_ws):
+        os.makedirs(data.snapshot_ws)
+    output_path = snapshot_path(data, cell_id, crop_num)
+    temp_path = output_path + '.tmp'
+    with open(temp_path, 'wb') as output_f:
+        pickle.dump(snapshot, output_f, protocol=pickle.HIGHEST_PROTOCOL)
+    if os.path.isfile(output_path):
+        os.remove(output_path)
+    os.rename(temp_path, output_path)
+
+
+if __name__ == '__main__':
+    pass
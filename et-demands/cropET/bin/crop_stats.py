@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+import datetime
+import logging
+
+import numpy as np
+import pandas as pd
+
+
+# Output field name and aggregation for each of the CropOutput variables
+#   in the monthly and annual output files
+period_fields = [
+    ('etref', 'PMETo', 'sum'), ('et_act', 'ETact', 'sum'),
+    ('et_pot', 'ETpot', 'sum'), ('et_bas', 'ETbas', 'sum'),
+    ('kc_act', 'Kc', 'mean'), ('kc_bas', 'Kcb', 'mean'),
+    ('niwr', 'NIWR', 'sum'), ('ppt', 'PPT', 'sum'),
+    ('irrigation', 'Irrigation', 'sum'), ('runoff', 'Runoff', 'sum'),
+    ('dperc', 'DPerc', 'sum'), ('season', 'Season', 'sum'),
+    ('cutting', 'Cutting', 'sum')]
+
+
+class SeasonTracker():
+    """Growing season statistics updated each day of the day loop
+
+    For each year, the start DOY is the first day the season flag turns on
+    and the end DOY is the first day it turns off (only changes within the
+    year are counted).  If the flag never turns on/off, the first/last DOY
+    of the year is used.  The length is the number of days in season.
+    Years where the season flag is never set have no statistics.
+    """
+    def __init__(self):
+        """ """
+        self.year = []
+        self.first_doy = []
+        self.last_doy = []
+        self.start_doy = []
+        self.end_doy = []
+        self.length = []
+        self.prev_season = None
+
+    def update(self, year, doy, in_season):
+        """Add a single day
+
+        Args:
+            year (int):
+            doy (int):
+            in_season (bool): the season flag at the end of the day
+        """
+        if not self.year or year != self.year[-1]:
+            self.year.append(year)
+            self.first_doy.append(doy)
+            self.last_doy.append(doy)
+            self.start_doy.append(None)
+            self.end_doy.append(None)
+            self.length.append(0)
+            self.prev_season = None
+        self.last_doy[-1] = doy
+        if in_season:
+            self.length[-1] += 1
+            if self.prev_season is False and self.start_doy[-1] is None:
+                self.start_doy[-1] = doy
+        elif self.prev_season and self.end_doy[-1] is None:
+            self.end_doy[-1] = doy
+        self.prev_season = bool(in_season)
+
+    def season_days(self):
+        """Number of days in season so far for the current year"""
+        return self.length[-1] if self.length else 0
+
+    def table(self):
+        """Growing season statistics for each year
+
+        Returns:
+            dict of arrays (NaN for years that never started a season)
+        """
+        gs_table = {
+            'year': np.array(self.year, dtype=np.int64),
+            'start_doy': np.full(len(self.year), np.nan),
+            'end_doy': np.full(len(self.year), np.nan),
+            'length': np.full(len(self.year), np.nan)}
+        for year_i, length in enumerate(self.length):
+            if not length:
+                continue
+            gs_table['start_doy'][year_i] = (
+                self.start_doy[year_i] if self.start_doy[year_i] is not None
+                else self.first_doy[year_i])
+            gs_table['end_doy'][year_i] = (
+                self.end_doy[year_i] if self.end_doy[year_i] is not None
+                else self.last_doy[year_i])
+            gs_table['length'][year_i] = length
+        return gs_table
+
+
+class PeriodReducer():
+    """Monthly or annual statistics accumulated as each day is simulated
+
+    Used instead of the daily results when only the monthly, annual and
+    growing season outputs are needed, so memory is O(periods) instead of
+    O(days).  The values are added in day order, so the statistics are
+    identical to period_stats() of the daily results.
+    """
+    def __init__(self, period='month'):
+        """
+
+        Args:
+            period (str): 'month' or 'year'
+        """
+        self.period = period
+        self.start_dates = []
+        self.sums = []
+        self.counts = []
+
+    def update(self, date, day_values):
+        """Add a single day
+
+        Args:
+            date (datetime):
+            day_values (dict): daily values keyed by CropOutput field name
+        """
+        month = date.month if self.period == 'month' else 1
+        if (not self.start_dates or
+                self.start_dates[-1].year != date.year or
+                self.start_dates[-1].month != month):
+            self.start_dates.append(datetime.datetime(date.year, month, 1))
+            # Season and cutting days are integer sums
+            self.sums.append([
+                0 if field in ['season', 'cutting'] else 0.0
+                for field, output_field, agg_type in period_fields])
+            self.counts.append([0] * len(period_fields))
+        sums, counts = self.sums[-1], self.counts[-1]
+        for field_i, (field, output_field, agg_type) in enumerate(
+                period_fields):
+            value = day_values[field]
+            # Skip missing values
+            if value != value:
+                continue
+            sums[field_i] += value
+            counts[field_i] += 1
+
+    def stats(self):
+        """Build the statistics data frame (see period_stats())"""
+        sums = np.array(self.sums, dtype=np.float64).reshape(
+            len(self.start_dates), len(period_fields))
+        counts = np.array(self.counts, dtype=np.int64).reshape(sums.shape)
+        stats_dict = dict()
+        for field_i, (field, output_field, agg_type) in enumerate(
+                period_fields):
+            if field in ['season', 'cutting']:
+                stats_dict[output_field] = sums[:, field_i].astype(np.int64)
+            elif agg_type == 'sum':
+                stats_dict[output_field] = sums[:, field_i]
+            else:
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    stats_dict[output_field] = np.where(
+                        counts[:, field_i] > 0,
+                        sums[:, field_i] / np.maximum(counts[:, field_i], 1),
+                        np.nan)
+        stats_pd = pd.DataFrame(
+            stats_dict, index=pd.DatetimeIndex(self.start_dates, name='Date'))
+        return stats_pd[[output_field for f, output_field, a in period_fields]]
+
+
+def period_starts(date, period='month'):
+    """Index of the first day of each month or year
+
+    Args:
+        date (array): consecutive daily datetime64 values
+        period (str): 'month' or 'year'
+
+    Returns:
+        tuple of the start indices and the datetime64 start date of each
+            period
+    """
+    if period == 'month':
+        period_date = date.astype('datetime64[M]')
+    elif period == 'year':
+        period_date = date.astype('datetime64[Y]')
+    else:
+        logging.error('  ERROR: Unsupported period: {}'.format(period))
+        raise ValueError(period)
+    start_i = np.concatenate(
+        [[0], np.flatnonzero(period_date[1:] != period_date[:-1]) + 1])
+    return start_i, period_date[start_i].astype('datetime64[D]')
+
+
+def period_labels(start_i, day_count):
+    """Period number of each day
+
+    Args:
+        start_i (array): start index of each period (see period_starts())
+        day_count (int): number of days
+
+    Returns:
+        array
+    """
+    return np.repeat(
+        np.arange(len(start_i)), np.diff(np.append(start_i, day_count)))
+
+
+def period_sum(values, start_i):
+    """Sum the values of each period, skipping missing values
+
+    The values are accumulated in day order (like the pandas groupby sum)
+    so the totals are identical to DataFrame.resample().sum()
+
+    Args:
+        values (array): daily values
+        start_i (array): start index of each period (see period_starts())
+
+    Returns:
+        array (integer values are returned as integers)
+    """
+    if values.dtype.kind in 'iub':
+        return np.add.reduceat(values.astype(np.int64), start_i)
+    labels = period_labels(start_i, len(values))
+    valid_mask = ~np.isnan(values)
+    return np.bincount(
+        labels[valid_mask], weights=values[valid_mask],
+        minlength=len(start_i))
+
+
+def period_mean(values, start_i):
+    """Mean of the values for each period, skipping missing values
+
+    Args:
+        values (array): daily values
+        start_i (array): start index of each period (see period_starts())
+
+    Returns:
+        array (NaN for periods without any values)
+    """
+    labels = period_labels(start_i, len(values))
+    valid_mask = ~np.isnan(values)
+    counts = np.bincount(labels[valid_mask], minlength=len(start_i))
+    sums = np.bincount(
+        labels[valid_mask], weights=values[valid_mask],
+        minlength=len(start_i))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+
+
+def period_stats(crop_output, period='month'):
+    """Compute the monthly or annual statistics for a single cell/crop
+
+    The variables are aggregated directly from the daily result arrays
+    using the period boundary indices (no data frame or resample).  The
+    values match DataFrame.resample().apply() of the daily output data
+    frame.
+
+    Args:
+        crop_output (CropOutput): daily results for the cell/crop
+        period (str): 'month' or 'year'
+
+    Returns:
+        DataFrame indexed by the period start date
+    """
+    start_i, start_date = period_starts(
+        crop_output.date.astype('datetime64[D]'), period)
+    stats_dict = dict()
+    for field, output_field, agg_type in period_fields:
+        if field == 'season':
+            values = crop_output.season
+        elif field == 'cutting':
+            values = crop_output.cutting
+        else:
+            values = crop_output.data[field]
+        if agg_type == 'sum':
+            stats_dict[output_field] = period_sum(values, start_i)
+        else:
+            stats_dict[output_field] = period_mean(values, start_i)
+    stats_pd = pd.DataFrame(
+        stats_dict, index=pd.DatetimeIndex(start_date, name='Date'))
+    return stats_pd[[output_field for f, output_field, a in period_fields]]
+
+
+if __name__ == '__main__':
+    pass
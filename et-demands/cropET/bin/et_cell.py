@@ -209,6 +209,40 @@ class ETCellData():
             cell = self.et_cells_dict[cell_id]
             cell.crop_coeffs = copy.deepcopy(crop_coeffs)
 
+    def set_crop_acreages(self, cells_path):
+        """Read the crop acreages (CROP_NN fields) from the ET cells shapefile
+
+        Args:
+            cells_path (str): file path of the ET cells shapefile
+        """
+        import shapefile
+
+        logging.info('Setting crop acreages')
+        cell_id_field = 'CELL_ID'
+        crop_field_re = re.compile('CROP_(?P<crop_num>\d{2})$', re.I)
+
+        cells_f = shapefile.Reader(cells_path)
+        cell_fields = [f[0] for f in cells_f.fields if f[0] != 'DeletionFlag']
+        if cell_id_field not in cell_fields:
+            logging.error(
+                '  ERROR: The ET cells shapefile does not have a {} field'.format(
+                    cell_id_field))
+            sys.exit()
+        crop_fields = [
+            (i, int(crop_field_re.match(f).group('crop_num')))
+            for i, f in enumerate(cell_fields) if crop_field_re.match(f)]
+        if not crop_fields:
+            logging.warning(
+                '  The ET cells shapefile does not have any CROP_NN fields')
+        for record in cells_f.iterRecords():
+            cell_id = str(record[cell_fields.index(cell_id_field)])
+            # Skip cells
+            if cell_id not in self.et_cells_dict.keys():
+                continue
+            self.et_cells_dict[cell_id].crop_acreages = dict(
+                (crop_num, float(record[i] or 0))
+                for i, crop_num in crop_fields)
+
     def set_spatial_crop_params(self, calibration_ws):
         """"""
         import shapefile
@@ -410,9 +444,15 @@ class ETCell():
         skiprows = [i for i in range(refet['header_lines'])
                     if i + 1 != refet['names_line']]
         try:
-            self.refet_pd = pd.read_table(
-                refet_path, engine='python', header=refet['names_line'] - 1,
-                skiprows=skiprows, delimiter=refet['delimiter'])
+            # Parquet files (i.e. from gridmet_eto_csv_2_dat.py) don't have
+            #   the extra header lines
+            if refet_path.lower().endswith('.parquet'):
+                self.refet_pd = pd.read_parquet(refet_path)
+            else:
+                self.refet_pd = pd.read_table(
+                    refet_path, engine='python',
+                    header=refet['names_line'] - 1,
+                    skiprows=skiprows, delimiter=refet['delimiter'])
         except IOError:
             logging.error(('  IOError: RefET data file could not be read ' +
                            'and may not exist\n  {}').format(refet_path))
@@ -547,10 +587,13 @@ class ETCell():
         skiprows = [i for i in range(weather['header_lines'])
                     if i + 1 != weather['names_line']]
         try:
-            self.weather_pd = pd.read_table(
-                weather_path, engine='python',
-                header=weather['names_line'] - 1, skiprows=skiprows,
-                delimiter=weather['delimiter'])
+            if weather_path.lower().endswith('.parquet'):
+                self.weather_pd = pd.read_parquet(weather_path)
+            else:
+                self.weather_pd = pd.read_table(
+                    weather_path, engine='python',
+                    header=weather['names_line'] - 1, skiprows=skiprows,
+                    delimiter=weather['delimiter'])
         except IOError:
             logging.error(('  IOError: Weather data file could not be read ' +
                            'and may not exist\n  {}').format(weather_path))
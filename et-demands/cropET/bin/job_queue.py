@@ -0,0 +1,301 @@
+#!/usr/bin/env python
+import json
+import logging
+import os
+import socket
+import threading
+import uuid
+
+
+class JobQueue():
+    """File based queue of (cell, crop) tasks shared by any number of workers
+
+    Each task is a small JSON file that is moved between sub folders of the
+    queue folder:
+        pending: published tasks waiting to be claimed
+        claimed: tasks being run, the file modified time is the lease
+        done: completed tasks
+        failed: tasks that raised an error (with the traceback)
+
+    Tasks are claimed by renaming the file from pending to a temporary claim
+    name, which is atomic so only one worker can claim each task, even on a
+    shared network folder.  The worker ID and a claim token are written to
+    the claim (starting the lease) before it is renamed into claimed.
+    Workers renew the lease while a task is running by touching the claimed
+    file, and only the worker holding the token can renew, commit or fail
+    the claim.  Claimed tasks whose lease has expired (i.e. the worker died)
+    are moved back to pending by the other workers.
+
+    The lease ages are measured with the file modified times of the queue
+    folder, so the clocks of the worker hosts don't need to match.
+    """
+    folder_names = ['pending', 'claimed', 'done', 'failed']
+
+    def __init__(self, queue_ws, lease_time=600, poll_time=5):
+        """
+
+        Args:
+            queue_ws (str): job queue folder
+            lease_time (float): seconds before a claimed task expires
+            poll_time (float): seconds to wait between claim attempts
+        """
+        self.queue_ws = queue_ws
+        self.lease_time = lease_time
+        self.poll_time = poll_time
+        self.worker_id = '{0}_{1}'.format(socket.gethostname(), os.getpid())
+        # Claim tokens of the tasks claimed by this worker
+        self.tokens = dict()
+        # Time each unfinished claim of another worker was first seen
+        self.partial_claims = dict()
+        for folder_name in self.folder_names:
+            folder_ws = os.path.join(self.queue_ws, folder_name)
+            if not os.path.isdir(folder_ws):
+                try:
+                    os.makedirs(folder_ws)
+                except OSError:
+                    # Another worker may have made the folder
+                    pass
+
+    def _path(self, folder_name, task_name):
+        """ """
+        return os.path.join(self.queue_ws, folder_name, task_name)
+
+    def _list(self, folder_name, ext='.json'):
+        """ """
+        return sorted(
+            item for item in os.listdir(os.path.join(self.queue_ws, folder_name))
+            if item.endswith(ext))
+
+    def _now(self):
+        """Current time of the queue folder file system
+
+        The modified time of a file written by this worker is compared to
+        the lease times, so only the file system clock is used
+        """
+        clock_path = os.path.join(
+            self.queue_ws, 'clock_{}.tmp'.format(self.worker_id))
+        with open(clock_path, 'w') as clock_f:
+            clock_f.write(self.worker_id)
+        now = os.path.getmtime(clock_path)
+        os.remove(clock_path)
+        return now
+
+    def _read_claim(self, claim_path):
+        """Read a claimed task file (or None if it can't be read)"""
+        try:
+            with open(claim_path, 'r') as task_f:
+                return json.load(task_f)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def _release(self, task_name, folder_name):
+        """Move a task claimed by this worker to another folder
+
+        The claimed file is first renamed to a name only this worker uses,
+        so the claim can't be requeued while the token is checked.  A claim
+        that was taken over by another worker is moved back.
+
+        Returns:
+            bool: True if the task was moved
+        """
+        token = self.tokens.pop(task_name, None)
+        if token is None:
+            return False
+        claim_path = self._path('claimed', task_name)
+        release_path = '{}.{}.release'.format(claim_path, token)
+        try:
+            os.rename(claim_path, release_path)
+        except OSError:
+            return False
+        task = self._read_claim(release_path)
+        if task is None or task.get('token') != token:
+            os.rename(release_path, claim_path)
+            return False
+        os.rename(release_path, self._path(folder_name, task_name))
+        return True
+
+    def publish(self, task_list):
+        """Add (cell_id, crop_num) tasks to the queue
+
+        Tasks that are already done are not published again
+
+        Args:
+            task_list (list): (cell_id, crop_num) tuples
+
+        Returns:
+            int: number of tasks published
+        """
+        done_set = set(self._list('done'))
+        count = 0
+        for cell_id, crop_num in task_list:
+            task_name = task_file_name(cell_id, crop_num)
+            if task_name in done_set:
+                continue
+            # Write to a temporary name so workers never see a partial file
+            task_path = self._path('pending', task_name)
+            with open(task_path + '.tmp', 'w') as task_f:
+                task_f.write(json.dumps(
+                    {'cell_id': cell_id, 'crop_num': int(crop_num)}))
+            if os.path.isfile(task_path):
+                os.remove(task_path)
+            os.rename(task_path + '.tmp', task_path)
+            count += 1
+        return count
+
+    def claim(self, cell_id=None):
+        """Claim the next pending task
+
+        Args:
+            cell_id (str): prefer tasks for this cell so the worker
+                doesn't need to read in new weather data
+
+        Returns:
+            tuple of the task name, cell ID and crop number
+                (or None if no tasks could be claimed)
+        """
+        task_names = self._list('pending')
+        if cell_id is not None:
+            prefix = '{}_crop_'.format(cell_id)
+            task_names.sort(key=lambda x: not x.startswith(prefix))
+        for task_name in task_names:
+            token = uuid.uuid4().hex
+            claim_path = '{}.{}.claim'.format(
+                self._path('claimed', task_name), token)
+            try:
+                os.rename(self._path('pending', task_name), claim_path)
+            except OSError:
+                # Another worker claimed the task first
+                continue
+            # Writing the owner to the claim also starts the lease
+            try:
+                with open(claim_path, 'r') as task_f:
+                    task = json.load(task_f)
+                task.update({'worker_id': self.worker_id, 'token': token})
+                with open(claim_path, 'w') as task_f:
+                    task_f.write(json.dumps(task))
+                os.rename(claim_path, self._path('claimed', task_name))
+            except (IOError, OSError, ValueError):
+                logging.warning('  Task {} could not be claimed'.format(
+                    task_name))
+                continue
+            self.tokens[task_name] = token
+            return task_name, task['cell_id'], int(task['crop_num'])
+        return None
+
+    def renew(self, task_name):
+        """Renew the lease on a task claimed by this worker
+
+        Returns:
+            bool: False if the task is no longer claimed by this worker
+        """
+        claim_path = self._path('claimed', task_name)
+        task = self._read_claim(claim_path)
+        if (task is None or task_name not in self.tokens or
+                task.get('token') != self.tokens[task_name]):
+            return False
+        try:
+            os.utime(claim_path, None)
+            return True
+        except OSError:
+            return False
+
+    def commit(self, task_name):
+        """Move a task claimed by this worker to done"""
+        if self._release(task_name, 'done'):
+            return True
+        logging.warning(
+            '  Task {} was no longer claimed by this worker'.format(
+                task_name))
+        return False
+
+    def fail(self, task_name, error_str):
+        """Move a task claimed by this worker to failed and save the error"""
+        if not self._release(task_name, 'failed'):
+            return False
+        with open(self._path('failed', task_name)[:-5] + '.txt', 'w') as f:
+            f.write('{}\n{}'.format(self.worker_id, error_str))
+        return True
+
+    def requeue_expired(self):
+        """Move claimed tasks with an expired lease back to pending
+
+        Claims left by a worker that stopped while claiming or releasing a
+        task are requeued once they have been seen for the lease time
+        (their modified times are from before the claim)
+
+        Returns:
+            int: number of tasks moved back to pending
+        """
+        count = 0
+        now = self._now()
+        partial_list = (
+            self._list('claimed', '.claim') + self._list('claimed', '.release'))
+        self.partial_claims = dict(
+            (item, self.partial_claims.get(item, now)) for item in partial_list)
+        for item in self._list('claimed') + partial_list:
+            claim_path = self._path('claimed', item)
+            task_name = item.split('.json')[0] + '.json'
+            if item in self.partial_claims:
+                lease_start = self.partial_claims[item]
+            else:
+                try:
+                    lease_start = os.path.getmtime(claim_path)
+                except OSError:
+                    continue
+            if now - lease_start < self.lease_time:
+                continue
+            try:
+                os.rename(claim_path, self._path('pending', task_name))
+            except OSError:
+                continue
+            logging.warning('  Lease expired, requeuing {}'.format(task_name))
+            count += 1
+        return count
+
+    def counts(self):
+        """Number of tasks in each of the queue folders"""
+        return dict(
+            (folder_name, len(self._list(folder_name)))
+            for folder_name in self.folder_names)
+
+    def heartbeat(self, task_name):
+        """Start a thread that renews the lease while the task is running
+
+        Call stop() on the returned thread when the task is finished
+        """
+        heartbeat_thread = LeaseHeartbeat(self, task_name)
+        heartbeat_thread.start()
+        return heartbeat_thread
+
+
+class LeaseHeartbeat(threading.Thread):
+    """Renew the lease on a claimed task at a quarter of the lease time"""
+    def __init__(self, queue, task_name):
+        """ """
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.queue = queue
+        self.task_name = task_name
+        self._stop_event = threading.Event()
+
+    def run(self):
+        """Stop renewing if the task was claimed by another worker"""
+        while not self._stop_event.wait(self.queue.lease_time / 4.0):
+            if not self.queue.renew(self.task_name):
+                logging.warning(
+                    '  Lease on {} was lost'.format(self.task_name))
+                break
+
+    def stop(self):
+        """ """
+        self._stop_event.set()
+        self.join()
+
+
+def task_file_name(cell_id, crop_num):
+    """Build the task file name for a single cell/crop"""
+    return '{0}_crop_{1:02d}.json'.format(cell_id, int(crop_num))
+
+
+if __name__ == '__main__':
+    pass
@@ -5,19 +5,26 @@ import logging
 import multiprocessing as mp
 import os
 import sys
-from time import clock
+from time import clock, sleep
+import traceback
 
 import numpy as np
 import pandas as pd
 
 import crop_et_data
 import crop_cycle
+import crop_output
 import et_cell
+import job_queue
+import result_cube
+import run_manifest
 import util
 
 
 def main(ini_path, log_level=logging.WARNING,
-         debug_flag=False, cal_flag=False, vb_flag=False, mp_procs=1):
+         debug_flag=False, cal_flag=False, vb_flag=False, mp_procs=1,
+         resume_flag=False, snapshot_flag=False, append_flag=False,
+         publish_ws=None, worker_ws=None, lease_time=600):
     """ Main function for running the Crop ET model
 
     Args:
@@ -26,6 +33,15 @@ def main(ini_path, log_level=logging.WARNING,
         debug_flag (bool): If True, write debug level comments to debug.txt
         vb_flag (bool): If True, mimic calculations in VB version of code
         mp_procs (int): number of cores to use for multiprocessing
+        resume_flag (bool): If True, skip cell/crops that were completed
+            in a previous run and whose inputs have not changed
+        snapshot_flag (bool): If True, save the end of run state of each
+            cell/crop so that new days can be appended later
+        append_flag (bool): If True, continue each cell/crop from the saved
+            state, only simulating the new days and appending to the outputs
+        publish_ws (str): job queue folder to publish the cell/crop tasks to
+        worker_ws (str): job queue folder to claim and run cell/crop tasks from
+        lease_time (float): seconds before a claimed task is requeued
 
     Returns:
         None
@@ -44,6 +60,8 @@ def main(ini_path, log_level=logging.WARNING,
         logging.warning('  Multiprocessing mode, {0} cores'.format(mp_procs))
     if cal_flag:
         logging.warning('  Displaying additional calibration information')
+    if append_flag:
+        logging.warning('  Appending new days to the previous run')
 
     # All general data will be handled in this class
     data = crop_et_data.CropETData()
@@ -62,6 +80,19 @@ def main(ini_path, log_level=logging.WARNING,
         logging.warning('  Setting growing_season_stats_flag = True')
         data.gs_output_flag = True
 
+    # The snapshots are rolled forward when appending
+    data.snapshot_flag = snapshot_flag or append_flag
+    data.append_flag = append_flag
+
+    # The result cube is memory-mapped, so it can only be written by the
+    #   processes of a single host (not by job queue workers on other hosts
+    #   sharing a network folder)
+    if data.cube_flag and (publish_ws or worker_ws):
+        logging.error(
+            '\nERROR: result_cube_flag is not supported with the job queue '
+            '(--publish/--worker)\n')
+        sys.exit()
+
     # Read in common crop specific parameters and coefficients
     # File paths are read in from INI
     data.set_crop_params()
@@ -89,6 +120,62 @@ def main(ini_path, log_level=logging.WARNING,
     if data.spatial_cal_flag:
         cells.set_spatial_crop_params(data.spatial_cal_ws)
 
+    # Read in the crop acreages for the area weighted basin stats
+    if data.basin_stats_flag:
+        cells.set_crop_acreages(data.cells_path)
+
+    # Allocate the basin result cube before any of the results are written
+    if data.cube_flag:
+        build_result_cube(data, cells)
+
+    # Distributed mode, the cell/crop tasks are run by any number of
+    #   workers (on one or more machines) sharing a job queue folder
+    if publish_ws:
+        logging.warning('\nPublishing tasks to {}'.format(publish_ws))
+        queue = job_queue.JobQueue(publish_ws, lease_time=lease_time)
+        task_count = queue.publish([
+            (cell_id, crop_num)
+            for cell_id, cell in sorted(cells.et_cells_dict.items())
+            for crop_num in cell.crop_num_list])
+        logging.warning('  Tasks published: {}'.format(task_count))
+        return
+    elif worker_ws:
+        logging.warning('\nRunning tasks from {}'.format(worker_ws))
+        if data.basin_stats_flag:
+            logging.warning(
+                '  Basin stats are not computed by the job queue workers')
+        queue_worker(
+            data, cells, job_queue.JobQueue(worker_ws, lease_time=lease_time),
+            vb_flag=vb_flag)
+        logging.info('\n{} seconds'.format(clock()-clock_start))
+        return
+
+    # Completed cell/crops are recorded in the run manifest
+    # Each task is fingerprinted from its effective inputs
+    #   (after the spatial crop parameters have been applied)
+    manifest = run_manifest.RunManifest(data, vb_flag=vb_flag)
+    for cell_id, cell in sorted(cells.et_cells_dict.items()):
+        manifest.set_cell_tasks(cell)
+    if resume_flag:
+        logging.warning('\nResuming from previous run')
+        manifest.read()
+        for cell_id, cell in sorted(cells.et_cells_dict.items()):
+            # Previous output files must still exist to be reused
+            done_crops = set(
+                crop_num for crop_num in cell.crop_num_list
+                if (manifest.is_completed(cell_id, crop_num) and
+                    all(map(os.path.isfile, crop_output.output_paths(
+                        data, cell_id, crop_num).values()))))
+            if not done_crops:
+                continue
+            logging.info('  CellID: {} skipping crops {}'.format(
+                cell_id, ', '.join(map(str, sorted(done_crops)))))
+            # Turn off the crop flag but leave the crop number list
+            cell.crop_flags = {
+                c: f and c not in done_crops
+                for c, f in cell.crop_flags.iteritems()}
+    manifest.start()
+
     # Multiprocessing logic
     # If cell count is low, process crops in parallel
     # If cell count is high, process cells in parallel (crops in serial)
@@ -109,10 +196,19 @@ def main(ini_path, log_level=logging.WARNING,
             logging.warning("  Multiprocessing by crop")
             crop_mp_flag = True
 
+    # All output files are written by a single writer stage in this process
+    # The writer thread overlaps the output writing with the next crop
+    writer = crop_output.CropOutputWriter(
+        data, manifest=manifest, cells=cells,
+        queue_size=data.output_queue_size)
+
     # Process each cell/station
     logging.warning("")
     for cell_id, cell in sorted(cells.et_cells_dict.items()):
-        if cell_mp_flag:
+        if not any(cell.crop_flags.values()):
+            logging.warning('CellID: {} (completed)'.format(cell_id))
+            continue
+        elif cell_mp_flag:
             # Multiprocessing by cell
             cell_mp_list.append([data, cell, vb_flag, mp_procs])
         elif crop_mp_flag:
@@ -120,22 +216,53 @@ def main(ini_path, log_level=logging.WARNING,
             logging.warning('CellID: {}'.format(cell_id))
             cell.initialize_weather(data)
             crop_cycle.crop_cycle_mp(data, cell, vb_flag=vb_flag,
-                                     mp_procs=mp_procs)
+                                     mp_procs=mp_procs, writer=writer)
+            writer.flush()
         else:
             logging.warning('CellID: {}'.format(cell_id))
             cell.initialize_weather(data)
             crop_cycle.crop_cycle(data, cell, debug_flag=debug_flag,
-                                  vb_flag=vb_flag)
+                                  vb_flag=vb_flag, writer=writer)
+            writer.flush()
 
     # Process all cells
-    results = []
+    # Workers return the crop results and the outputs are written here
     if cell_mp_list:
         pool = mp.Pool(mp_procs)
-        results = pool.imap(cell_mp, cell_mp_list, chunksize=1)
+        results = pool.imap_unordered(cell_mp, cell_mp_list, chunksize=1)
         pool.close()
+        for crop_output_list in results:
+            writer.write_list(crop_output_list)
         pool.join()
         del pool, results
 
+    # Wait for the last results to be written
+    writer.close()
+
+    # Area weighted annual cell and basin totals
+    # Crops skipped when resuming are read from the annual output files
+    # When appending, the years before the append year are kept from the
+    #   previous totals files
+    if writer.basin is not None:
+        logging.warning('\nWriting basin stats')
+        for cell_id, cell in sorted(cells.et_cells_dict.items()):
+            for crop_num in cell.crop_num_list:
+                if (cell_id, int(crop_num)) in writer.basin.volumes:
+                    continue
+                elif not data.annual_output_flag:
+                    continue
+                annual_output_path = crop_output.output_paths(
+                    data, cell_id, crop_num)['annual']
+                if not os.path.isfile(annual_output_path):
+                    continue
+                annual_pd = crop_output.read_output_frame(
+                    annual_output_path)[1]
+                if writer.basin.append_year is not None:
+                    annual_pd = annual_pd[
+                        annual_pd['Year'] >= writer.basin.append_year]
+                writer.basin.add(cell_id, crop_num, annual_pd)
+        writer.basin.write()
+
     logging.info('\n{} seconds'.format(clock()-clock_start))
 
 
@@ -147,19 +274,26 @@ def main(ini_path, log_level=logging.WARNING,
 
         for cell_id, cell in sorted(cells.et_cells_dict.items()):
             logging.warning('CellID: {}'.format(cell_id))
-            for crop_num, crop in sorted(cell.crop_params.items()):
-                if cell.crop_flags[crop_num] == 0:
-                    continue
+            for crop_num in cell.crop_num_list:
+                crop = cell.crop_params[crop_num]
                 # logging.warning('Crop %2d %s' % (crop_num, crop))
 
-                gs_output_path = os.path.join(
-                    data.gs_output_ws, '{0}_gs_crop_{1:02d}.csv'.format(
-                        cell_id, int(crop.class_number)))
-
-                gs_df = pd.read_table(gs_output_path, header=0, comment='#', sep=',')
-
-                gs_start_doy = int(round(gs_df['Start_DOY'].mean()))
-                gs_end_doy = int(round(gs_df['End_DOY'].mean()))
+                # Mean start/end DOY were saved by the writer stage
+                # Crops skipped when resuming must be read from the file
+                try:
+                    gs_start_doy, gs_end_doy = writer.gs_summary[
+                        (cell_id, int(crop.class_number))]
+                except KeyError:
+                    gs_output_path = crop_output.output_paths(
+                        data, cell_id, crop_num)['gs']
+                    if not os.path.isfile(gs_output_path):
+                        continue
+                    gs_df = pd.read_table(
+                        gs_output_path, header=0, comment='#', sep=',')
+                    gs_start_doy = gs_df['Start_DOY'].mean()
+                    gs_end_doy = gs_df['End_DOY'].mean()
+                gs_start_doy = int(round(gs_start_doy))
+                gs_end_doy = int(round(gs_end_doy))
                 gs_start_dt = datetime.datetime.strptime(
                     '2001_{:03d}'.format(gs_start_doy), '%Y_%j')
                 gs_end_dt = datetime.datetime.strptime(
@@ -184,15 +318,113 @@ def cell_mp(tup):
     return cell_sp(*tup)
 
 def cell_sp(data, cell, vb_flag, mp_procs=1):
-    """Compute crop cycle for each cell"""
+    """Compute crop cycle for each cell
+
+    Returns:
+        list of CropOutput results for the cell
+    """
     if mp_procs == 1:
         logging.warning('CellID: {}'.format(cell.cell_id))
     else:
         print('CellID: {}'.format(cell.cell_id))
     cell.initialize_weather(data)
     # Force debug_flag false when multiprocessing
-    crop_cycle.crop_cycle(data, cell, debug_flag=False, vb_flag=vb_flag,
-                          mp_procs=mp_procs)
+    # Results are written by the parent process
+    return crop_cycle.crop_cycle(
+        data, cell, debug_flag=False, vb_flag=vb_flag, mp_procs=mp_procs)
+
+
+def build_result_cube(data, cells):
+    """Allocate the basin result cube for all cells and active crops
+
+    If the start or end date is not set in the INI, the date range is
+    taken from the RefET data of the first cell
+
+    Args:
+        data ():
+        cells (ETCellData):
+
+    Returns:
+        None
+    """
+    logging.warning('\nBuilding result cube')
+    start_dt, end_dt = data.start_dt, data.end_dt
+    if start_dt is None or end_dt is None:
+        cell = cells.et_cells_dict[sorted(cells.et_cells_dict.keys())[0]]
+        cell.set_refet_data(data.refet)
+        if start_dt is None:
+            start_dt = cell.refet_pd.index[0].to_pydatetime()
+        if end_dt is None:
+            end_dt = cell.refet_pd.index[-1].to_pydatetime()
+        del cell.refet_pd
+    cube = result_cube.ResultCube(result_cube.cube_path(data))
+    cube.create(
+        sorted(cells.et_cells_dict.keys()), cells.crop_num_list,
+        start_dt, end_dt)
+
+
+def queue_worker(data, cells, queue, vb_flag=False):
+    """Claim and run cell/crop tasks until the job queue is empty
+
+    Each worker writes the output files for the tasks it claimed
+    The output files are written before the task is committed, so the
+    writer thread is not used
+    The lease on the running task is renewed by a heartbeat thread
+    Tasks from the same cell are preferred so that the weather data
+    is only read once per cell
+
+    Args:
+        data ():
+        cells (ETCellData):
+        queue (JobQueue):
+        vb_flag (bool): If True, mimic calculations in VB version of code
+
+    Returns:
+        None
+    """
+    writer = crop_output.CropOutputWriter(data)
+    cell = None
+    while True:
+        task = queue.claim(None if cell is None else cell.cell_id)
+        if task is None:
+            # Pick up tasks from workers that have stopped
+            if queue.requeue_expired():
+                continue
+            elif not queue.counts()['claimed']:
+                break
+            sleep(queue.poll_time)
+            continue
+        task_name, cell_id, crop_num = task
+
+        heartbeat = queue.heartbeat(task_name)
+        try:
+            if cell is None or cell.cell_id != cell_id:
+                # Release the weather data for the previous cell
+                if cell is not None:
+                    for attr in ['refet_pd', 'weather_pd', 'climate_pd']:
+                        if hasattr(cell, attr):
+                            delattr(cell, attr)
+                cell = cells.et_cells_dict[cell_id]
+                logging.warning('CellID: {}'.format(cell_id))
+                cell.initialize_weather(data)
+            result = crop_cycle.crop_day_loop(
+                data, cell, cell.crop_params[crop_num], vb_flag=vb_flag)
+            if result is not None:
+                writer.write(result)
+        except Exception:
+            heartbeat.stop()
+            logging.error('  Task {} failed\n{}'.format(
+                task_name, traceback.format_exc()))
+            queue.fail(task_name, traceback.format_exc())
+            # Weather data may not have been read in completely
+            cell = None
+            continue
+        heartbeat.stop()
+        queue.commit(task_name)
+
+    counts = queue.counts()
+    logging.warning('\nTasks done: {}  failed: {}'.format(
+        counts['done'], counts['failed']))
 
 
 def is_valid_file(parser, arg):
@@ -234,6 +466,26 @@ def parse_args():
     parser.add_argument(
         '--cal', action='store_true', default=False,
         help="Display mean annual start/end dates to screen")
+    parser.add_argument(
+        '--resume', '--incremental', dest='resume', action='store_true',
+        default=False,
+        help="Only run cell/crops that are incomplete or have changed inputs")
+    parser.add_argument(
+        '--snapshot', action='store_true', default=False,
+        help="Save the end of run crop states for appending new days")
+    parser.add_argument(
+        '--append', action='store_true', default=False,
+        help="Only simulate days after the saved crop states and " +
+             "append to the output files")
+    parser.add_argument(
+        '--publish', metavar='FOLDER',
+        help="Publish the cell/crop tasks to a job queue folder")
+    parser.add_argument(
+        '--worker', metavar='FOLDER',
+        help="Claim and run cell/crop tasks from a job queue folder")
+    parser.add_argument(
+        '--lease', default=600, type=float, metavar='SECONDS',
+        help="Time before a claimed task from a stopped worker is requeued")
     args = parser.parse_args()
 
     # Convert INI path to an absolute path if necessary
@@ -246,4 +498,7 @@ if __name__ == '__main__':
     args = parse_args()
 
     main(ini_path=args.ini, log_level=args.log_level, debug_flag=args.debug,
-         cal_flag=args.cal, vb_flag=args.vb, mp_procs=args.multiprocessing)
+         cal_flag=args.cal, vb_flag=args.vb, mp_procs=args.multiprocessing,
+         resume_flag=args.resume, snapshot_flag=args.snapshot,
+         append_flag=args.append, publish_ws=args.publish,
+         worker_ws=args.worker, lease_time=args.lease)
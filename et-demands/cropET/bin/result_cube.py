@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+import json
+import logging
+import os
+
+import numpy as np
+
+
+class ResultCube():
+    """Basin wide memory-mapped array of the daily crop results
+
+    The cube is a NumPy (.npy) array file with the dimensions
+    (cell, crop, day, variable) that is allocated once for the whole run.
+    Each cell/crop is a contiguous slice that is written by the writer stage
+    of the run.  A second small (cell, crop) array counts the consecutive
+    days of each slice that have been written (from the cube start date).
+
+    The cube is single host only.  Memory-mapped pages are written back
+    whole, so processes on different hosts sharing a network folder would
+    overwrite each other's slices and day counts (the job queue modes don't
+    support the cube).
+
+    The coordinates (cell IDs, crop numbers, start date, variables) are
+    saved in a JSON sidecar index next to the cube.  Unwritten values are
+    zero, so only the slices selected by valid_mask() (all of the days
+    written) should be summarized.
+    """
+    # Daily variables saved in the cube (the CropOutput field names)
+    variables = [
+        'etref', 'et_act', 'et_pot', 'et_bas', 'kc_act', 'kc_bas', 'ppt',
+        'irrigation', 'runoff', 'dperc', 'niwr', 'season', 'cutting']
+    dtype = 'float32'
+
+    def __init__(self, cube_path):
+        """
+
+        Args:
+            cube_path (str): file path of the cube (.npy)
+                The index and written day counts have the same base name
+        """
+        self.cube_path = cube_path
+        base_path = os.path.splitext(cube_path)[0]
+        self.index_path = base_path + '.json'
+        self.days_path = base_path + '_days.npy'
+        self.index = None
+        self.data = None
+        self.days = None
+
+    def exists(self):
+        """Check if all of the cube files exist"""
+        return all(map(os.path.isfile, [
+            self.cube_path, self.index_path, self.days_path]))
+
+    def create(self, cell_ids, crop_nums, start_dt, end_dt):
+        """Allocate a new cube and write the sidecar index
+
+        An existing cube with the same coordinates is kept so that resumed
+        runs only overwrite their own slices.  If only the end date changed
+        (appended runs), the existing days are copied into the resized cube.
+
+        Args:
+            cell_ids (list): ET cell IDs
+            crop_nums (list): crop numbers
+            start_dt (datetime): first day of the cube
+            end_dt (datetime): last day of the cube
+
+        Returns:
+            bool: True if a new cube was allocated
+        """
+        index = {
+            'cell_ids': sorted(cell_ids),
+            'crop_nums': sorted(map(int, crop_nums)),
+            'start_date': start_dt.strftime('%Y-%m-%d'),
+            'end_date': end_dt.strftime('%Y-%m-%d'),
+            'variables': self.variables,
+            'dims': ['cell', 'crop', 'day', 'variable'],
+            'dtype': self.dtype}
+        prev_index = None
+        if self.exists():
+            prev_index = self.read_index()
+            if prev_index == index:
+                logging.info('  Using existing result cube')
+                return False
+            elif any(prev_index[k] != index[k] for k in index.keys()
+                     if k != 'end_date'):
+                logging.warning(
+                    '  Result cube coordinates changed, '
+                    'allocating a new cube')
+                prev_index = None
+
+        day_count = (end_dt - start_dt).days + 1
+        shape = (
+            len(index['cell_ids']), len(index['crop_nums']), day_count,
+            len(self.variables))
+        logging.info('  Result cube shape: {}'.format(shape))
+
+        if prev_index is None:
+            # The data file is sparse until the slices are written
+            np.lib.format.open_memmap(
+                self.cube_path, mode='w+', dtype=self.dtype, shape=shape)
+            np.lib.format.open_memmap(
+                self.days_path, mode='w+', dtype=np.int32, shape=shape[:2])
+        else:
+            self._resize(shape)
+        with open(self.index_path, 'w') as index_f:
+            json.dump(index, index_f, indent=1)
+        self.index = index
+        return True
+
+    def _resize(self, shape):
+        """Copy the existing cube into a cube with a new day count
+
+        Args:
+            shape (tuple): shape of the new cube
+        """
+        logging.info('  Resizing the existing result cube')
+        temp_path = self.cube_path + '.tmp'
+        prev_data = np.load(self.cube_path, mmap_mode='r')
+        copy_days = min(prev_data.shape[2], shape[2])
+        new_data = np.lib.format.open_memmap(
+            temp_path, mode='w+', dtype=self.dtype, shape=shape)
+        # Copy a cell at a time to limit the memory use
+        for cell_i in range(shape[0]):
+            new_data[cell_i, :, :copy_days, :] = (
+                prev_data[cell_i, :, :copy_days, :])
+        new_data.flush()
+        del new_data, prev_data
+        os.remove(self.cube_path)
+        os.rename(temp_path, self.cube_path)
+
+        # Days past the new end date are no longer in the cube
+        days = np.load(self.days_path, mmap_mode='r+')
+        days[:] = np.minimum(days, shape[2])
+        days.flush()
+        del days
+
+    def read_index(self):
+        """Read the sidecar index"""
+        with open(self.index_path, 'r') as index_f:
+            self.index = json.load(index_f)
+        # JSON strings are read in as unicode
+        self.index['cell_ids'] = map(str, self.index['cell_ids'])
+        self.index['variables'] = map(str, self.index['variables'])
+        for key in ['start_date', 'end_date', 'dtype']:
+            self.index[key] = str(self.index[key])
+        self.index['dims'] = map(str, self.index['dims'])
+        return self.index
+
+    def open(self, mode='r+'):
+        """Memory-map the cube and the written day counts
+
+        Args:
+            mode (str): 'r' for reading or 'r+' for writing slices
+        """
+        if self.index is None:
+            self.read_index()
+        self.data = np.load(self.cube_path, mmap_mode=mode)
+        self.days = np.load(self.days_path, mmap_mode=mode)
+        return self
+
+    def valid_mask(self):
+        """Flag the (cell, crop) slices with all of the days written"""
+        if self.data is None:
+            self.open('r')
+        return np.asarray(self.days) >= self.data.shape[2]
+
+    def dates(self):
+        """Daily datetime64 coordinates of the cube"""
+        return np.arange(
+            np.datetime64(self.index['start_date']),
+            np.datetime64(self.index['end_date']) + np.timedelta64(1, 'D'),
+            dtype='datetime64[D]')
+
+    def cell_index(self, cell_id):
+        """ """
+        return self.index['cell_ids'].index(cell_id)
+
+    def crop_index(self, crop_num):
+        """ """
+        return self.index['crop_nums'].index(int(crop_num))
+
+    def var_index(self, variable):
+        """ """
+        return self.index['variables'].index(variable)
+
+    def write(self, crop_output):
+        """Write the daily results for a single cell/crop into its slice
+
+        Days outside the cube date range are not saved.  The written day
+        count only advances if the new days continue the days already
+        written, so a slice is only valid once all of its days are written.
+
+        Args:
+            crop_output (CropOutput): daily results for the cell/crop
+        """
+        if self.data is None:
+            self.open('r+')
+        try:
+            cell_i = self.cell_index(crop_output.cell_id)
+            crop_i = self.crop_index(crop_output.crop_num)
+        except ValueError:
+            logging.warning(
+                '  {} is not in the result cube, skipping'.format(crop_output))
+            return False
+
+        day_i = (
+            crop_output.date.astype('datetime64[D]') -
+            np.datetime64(self.index['start_date'])).astype(np.int64)
+        day_mask = (day_i >= 0) & (day_i < self.data.shape[2])
+        if not np.all(day_mask):
+            logging.warning(
+                '  {} days are outside the result cube dates'.format(
+                    np.sum(~day_mask)))
+        if not np.any(day_mask):
+            return False
+        # The days are consecutive, so the slice is a single block
+        day_slice = slice(day_i[day_mask][0], day_i[day_mask][-1] + 1)
+
+        cube_slice = np.empty(
+            (day_slice.stop - day_slice.start, len(self.variables)),
+            dtype=self.dtype)
+        for var_i, variable in enumerate(self.variables):
+            if variable == 'season':
+                values = crop_output.season
+            elif variable == 'cutting':
+                values = crop_output.cutting
+            else:
+                values = crop_output.data[variable]
+            cube_slice[:, var_i] = values[day_mask]
+        self.data[cell_i, crop_i, day_slice, :] = cube_slice
+        self.data.flush()
+        if day_slice.start <= self.days[cell_i, crop_i]:
+            self.days[cell_i, crop_i] = max(
+                self.days[cell_i, crop_i], day_slice.stop)
+            self.days.flush()
+        return True
+
+
+def cube_path(data):
+    """Build the result cube file path"""
+    return os.path.join(data.project_ws, data.cube_name + '.npy')
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+import datetime
+import hashlib
+import json
+import logging
+import os
+
+
+class RunManifest():
+    """Record of the (cell, crop) tasks completed by a Crop ET run
+
+    The manifest is a text file in the project folder with one JSON record
+    per line.  The first line is a header and each following line is a
+    completed task.  Records are appended as each task is written so a
+    partial run can be resumed.
+
+    Each task is fingerprinted from its effective inputs (the cell
+    properties, the crop parameters after any spatial overrides, the crop
+    coefficient curve, the RefET/weather files and the INI settings that
+    affect the computation), so editing a single cell or crop only
+    invalidates the tasks that actually depend on it.
+    """
+    # Cell attributes used in the crop computations
+    cell_fields = [
+        'refet_id', 'stn_lat', 'stn_lon', 'stn_elev', 'permeability',
+        'stn_whc', 'stn_soildepth', 'stn_hydrogroup', 'aridity_rating',
+        'irrigation_flag', 'dairy_cuttings', 'beef_cuttings']
+    # Bare soil, mulch and dormant turf parameters are used by every crop
+    #   during the non-growing season
+    winter_crops = [44, 45, 46]
+
+    def __init__(self, data, vb_flag=False,
+                 manifest_name='crop_et_manifest.txt'):
+        """
+
+        Args:
+            data ():
+            vb_flag (bool): If True, mimic calculations in VB version of code
+            manifest_name (str): manifest file name in the project folder
+        """
+        self.manifest_path = os.path.join(data.project_ws, manifest_name)
+
+        # INI settings shared by all of the tasks
+        # The date range and output flags change the written files
+        settings = [
+            data.refet, data.weather, data.start_dt, data.end_dt,
+            data.crop_one_flag, data.crop_one_reducer, data.co2_flag,
+            data.cutting_flag, data.niwr_flag, data.kc_flag,
+            data.output_format, data.output_compression,
+            data.cube_flag, data.output_fields,
+            data.output_precision, data.output_dtype, vb_flag,
+            file_hash(data.refet_ratios_path)]
+        for output_var in ['daily', 'monthly', 'annual', 'gs']:
+            if getattr(data, output_var + '_output_flag'):
+                settings.append(getattr(data, output_var + '_output_ws'))
+            else:
+                settings.append(None)
+        self.settings_fingerprint = hash_list(map(sorted_repr, settings))
+
+        self.refet = data.refet
+        self.weather = data.weather
+        self.completed = dict()
+        self._station_hashes = dict()
+        self._task_fingerprints = dict()
+
+    def set_cell_tasks(self, et_cell):
+        """Fingerprint each of the active crops for a cell
+
+        Cells that share a station will only hash the weather files once
+
+        Args:
+            et_cell ():
+        """
+        if et_cell.refet_id not in self._station_hashes:
+            self._station_hashes[et_cell.refet_id] = hash_list([
+                file_hash(os.path.join(
+                    self.refet['ws'], self.refet['format'] % et_cell.refet_id)),
+                file_hash(os.path.join(
+                    self.weather['ws'],
+                    self.weather['format'] % et_cell.refet_id))])
+        cell_hash = hash_list([
+            self.settings_fingerprint,
+            self._station_hashes[et_cell.refet_id]] + [
+            sorted_repr(getattr(et_cell, field, None))
+            for field in self.cell_fields] + [
+            sorted_repr(vars(et_cell.crop_params[crop_num]))
+            for crop_num in self.winter_crops
+            if crop_num in et_cell.crop_params])
+        for crop_num in et_cell.crop_num_list:
+            crop = et_cell.crop_params[crop_num]
+            try:
+                crop_coeff = et_cell.crop_coeffs[crop.curve_number]
+                curve_str = sorted_repr(
+                    [crop_coeff.curve_type, crop_coeff.data.tolist()])
+            except (KeyError, AttributeError):
+                curve_str = None
+            self._task_fingerprints[(et_cell.cell_id, int(crop_num))] = (
+                hash_list([cell_hash, sorted_repr(vars(crop)), curve_str]))
+
+    def task_fingerprint(self, cell_id, crop_num):
+        """Fingerprint of the inputs for a single cell/crop
+
+        set_cell_tasks() must be called for the cell first
+
+        Args:
+            cell_id (str): ET cell ID
+            crop_num (int): crop number
+
+        Returns:
+            str
+        """
+        return self._task_fingerprints[(cell_id, int(crop_num))]
+
+    def read(self):
+        """Read the completed tasks and fingerprints from a previous run"""
+        self.completed = dict()
+        if not os.path.isfile(self.manifest_path):
+            logging.warning('  Manifest not found, processing all tasks')
+            return False
+        with open(self.manifest_path, 'r') as manifest_f:
+            lines = manifest_f.readlines()
+        for line in lines[1:]:
+            # The last line may be incomplete if the run was killed
+            try:
+                record = json.loads(line)
+                self.completed[(record['cell_id'], int(record['crop_num']))] = (
+                    record['fingerprint'])
+            except (ValueError, KeyError):
+                continue
+        logging.warning('  Manifest tasks completed: {}'.format(
+            len(self.completed)))
+        return True
+
+    def start(self):
+        """Write a new manifest (or rewrite the manifest when resuming)"""
+        with open(self.manifest_path, 'w') as manifest_f:
+            manifest_f.write(json.dumps({
+                'created': datetime.datetime.now().isoformat()}) + '\n')
+            for (cell_id, crop_num), fingerprint in sorted(
+                    self.completed.items()):
+                manifest_f.write(self._record(
+                    cell_id, crop_num, fingerprint) + '\n')
+
+    def is_completed(self, cell_id, crop_num):
+        """Check if a task was completed with the same input fingerprint"""
+        try:
+            fingerprint = self.completed[(cell_id, int(crop_num))]
+        except KeyError:
+            return False
+        return fingerprint == self.task_fingerprint(cell_id, crop_num)
+
+    def add(self, cell_id, crop_num):
+        """Append a completed task to the manifest"""
+        fingerprint = self.task_fingerprint(cell_id, crop_num)
+        self.completed[(cell_id, int(crop_num))] = fingerprint
+        with open(self.manifest_path, 'a') as manifest_f:
+            manifest_f.write(self._record(
+                cell_id, crop_num, fingerprint) + '\n')
+
+    def _record(self, cell_id, crop_num, fingerprint):
+        """ """
+        return json.dumps({
+            'cell_id': cell_id, 'crop_num': int(crop_num),
+            'fingerprint': fingerprint})
+
+
+def file_hash(file_path, block_size=2 ** 20):
+    """Compute the MD5 hash of a file
+
+    Args:
+        file_path (str): file path
+        block_size (int): number of bytes to read at a time
+
+    Returns:
+        str (or None if the file does not exist)
+    """
+    if file_path is None or not os.path.isfile(file_path):
+        return None
+    md5 = hashlib.md5()
+    with open(file_path, 'rb') as input_f:
+        for block in iter(lambda: input_f.read(block_size), b''):
+            md5.update(block)
+    return md5.hexdigest()
+
+
+def sorted_repr(value):
+    """String representation of a value with dictionaries sorted by key"""
+    if isinstance(value, dict):
+        return '{' + ', '.join([
+            '{0!r}: {1}'.format(k, sorted_repr(v))
+            for k, v in sorted(value.items())]) + '}'
+    elif isinstance(value, (list, tuple)):
+        return '[' + ', '.join(map(sorted_repr, value)) + ']'
+    else:
+        return repr(value)
+
+
+def hash_list(value_list):
+    """Combine a list of hashes/strings into a single hash"""
+    return hashlib.md5('|'.join(map(str, value_list)).encode()).hexdigest()
+
+
+if __name__ == '__main__':
+    pass
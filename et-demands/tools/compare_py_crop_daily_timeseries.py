@@ -7,53 +7,72 @@
 #--------------------------------
 
 import argparse
+from collections import OrderedDict
+import csv
 import datetime as dt
+import json
 import logging
+import multiprocessing as mp
 import os
+import re
 import sys
 
 import numpy as np
 import pandas as pd
 
+import util
 
-def main(project_ws, crop_str=''):
+
+# Output file formats (see the output_format INI parameter)
+#   Binary output files can also be compared to the baseline CSV files
+output_ext_list = ['.csv', '.parquet', '.h5']
+# Compressed CSV files (see the output_compression INI parameter)
+compress_ext_list = ['.gz', '.zst']
+# Key fields used to match the rows of the test and base files
+key_field_list = ['Date', 'Year']
+# Fields that are not compared
+skip_field_list = ['DATE', 'DOY', 'YEAR', 'MONTH', 'DAY']
+
+
+def main(project_ws, crop_str='', test_folder='daily_stats',
+         base_folder='daily_baseline', atol=1E-6, rtol=0, report_path=None,
+         mp_procs=1, partial_flag=False):
     """Compare ET-Demands output to baseline files
 
-    For now, scipt will assume it is run in the project/basin folder and will
-        look for a PMData sub-folder
+    The test and base folders are searched recursively and the files are
+    matched by their relative path (ignoring the format and compression
+    extensions), so whole output trees (daily, monthly, annual, ...) can
+    be compared at once.  The rows are matched by date (or year).
+    Baseline files without a test file and baseline fields missing from
+    a test file are failures unless partial_flag is set.
 
     Args:
         project_ws (str): Project workspace
         crop_str (str): comma separate list or range of crops to compare
+        test_folder (str): test output folder (relative to project_ws)
+        base_folder (str): baseline output folder (relative to project_ws)
+        atol (float): absolute tolerance
+        rtol (float): relative tolerance (of the base values)
+        report_path (str): JSON (.json) or CSV (.csv) report file path
+        mp_procs (int): number of cores to use for multiprocessing
+        partial_flag (bool): if True, only compare the files and fields
+            in the test folder
 
     Returns:
-        None
+        bool: True if all of the baseline files were matched and are
+            within the tolerances
     """
     logging.info('\nCompare ET-Demands output to test files')
 
-    # Dataframe parameters
-    test_sep = ','
-    test_header = 0
-    test_comment = '#'
-    test_date_field = 'Date'
-    test_ext = '.csv'
-
-    # Dataframe parameters
-    base_sep = ','
-    # base_sep = r'\s*'
-    base_header = 0
-    base_comment = '#'
-    base_date_field = 'Date'
-    base_ext = '.csv'
-
     # Only process a subset of the crops
     crop_list = list(parse_int_set(crop_str))
 
     # Input workspaces
-    test_ws = os.path.join(project_ws, 'daily_stats')
-    base_ws = os.path.join(project_ws, 'daily_baseline')
+    test_ws = os.path.join(project_ws, test_folder)
+    base_ws = os.path.join(project_ws, base_folder)
     logging.info('  Test Folder: {0}'.format(test_ws))
     logging.info('  Base Folder: {0}'.format(base_ws))
+    logging.info('  Tolerance:   {0} + {1} * |base|'.format(atol, rtol))
 
     # Check workspaces
     if not os.path.isdir(test_ws):
@@ -66,114 +85,309 @@ def main(project_ws, crop_str=''):
         sys.exit()
 
     # Get list of available files
-    test_name_list = [
-        item for item in os.listdir(test_ws)
-        if (os.path.isfile(os.path.join(test_ws, item)) and
-            item.endswith(test_ext.lower()))]
-    base_name_list = [
-        item for item in os.listdir(base_ws)
-        if (os.path.isfile(os.path.join(base_ws, item)) and
-            item.endswith(base_ext.lower()))]
-
-    # For each file in etc, try to find a baseline one
-    for test_name in test_name_list:
-        # Get crop number from file
-        test_crop = int(os.path.splitext(test_name)[0].split('crop_')[-1])
-        if crop_list and test_crop not in crop_list:
-            logging.debug('File: {}\n  Skipping crop...'.format(test_name))
-            continue
-        else:
-            logging.warning('File: {}'.format(test_name))
-            logging.debug('  Crop: {}'.format(test_crop))
-
-        # Try to find a matching file
-        base_name = os.path.splitext(test_name)[0] + base_ext
-        logging.debug('  {}'.format(base_name))
-        if base_name not in base_name_list:
-            logging.warning('  No matching files in {}'.format(base_ws))
-            continue
+    test_path_dict = output_path_dict(test_ws)
+    base_path_dict = output_path_dict(base_ws)
 
-        # Try to open both of the files
-        test_path = os.path.join(test_ws, test_name)
-        base_path = os.path.join(base_ws, base_name)
-        try:
-            test_df = pd.read_table(
-                test_path, engine='python', sep=test_sep, header=test_header,
-                comment=test_comment)
-        except:
-            logging.warning('  Pandas could not open the test file')
+    def crop_skip(file_root):
+        """Check the crop number of the file against the crop list"""
+        crop_match = re.search('crop_(\d+)$', file_root)
+        return bool(crop_list and (
+            not crop_match or int(crop_match.group(1)) not in crop_list))
+
+    # For each test file, try to find a baseline one
+    file_args_list = []
+    unmatched_test_list = []
+    for file_root, test_path in sorted(test_path_dict.items()):
+        if crop_skip(file_root):
+            logging.debug('File: {}\n  Skipping crop...'.format(file_root))
             continue
         try:
-            base_df = pd.read_table(
-                base_path, engine='python', sep=base_sep, header=base_header,
-                comment=base_comment)
-        except:
-            logging.warning('  Pandas could not open the base file')
+            base_path = base_path_dict[file_root]
+        except KeyError:
+            logging.warning('File: {}\n  No matching files in {}'.format(
+                os.path.relpath(test_path, test_ws), base_ws))
+            unmatched_test_list.append(os.path.relpath(test_path, test_ws))
             continue
+        file_args_list.append(
+            [test_path, base_path, atol, rtol, partial_flag])
+    unmatched_base_list = [
+        os.path.relpath(base_path, base_ws)
+        for file_root, base_path in sorted(base_path_dict.items())
+        if file_root not in test_path_dict and not crop_skip(file_root)]
+    for base_path in unmatched_base_list:
+        logging.warning('File: {}\n  No matching files in {}'.format(
+            base_path, test_ws))
+    logging.info('  Matched files: {}'.format(len(file_args_list)))
+
+    # Compare each pair of files
+    if mp_procs > 1 and len(file_args_list) > 1:
+        pool = mp.Pool(min(mp_procs, len(file_args_list)))
+        results = pool.imap(
+            compare_files_mp, file_args_list,
+            chunksize=max(1, len(file_args_list) // (4 * mp_procs)))
+        pool.close()
+    else:
+        results = (compare_files(*args) for args in file_args_list)
+
+    file_list = []
+    for file_result in results:
+        file_result['test_path'] = os.path.relpath(
+            file_result['test_path'], test_ws)
+        file_result['base_path'] = os.path.relpath(
+            file_result['base_path'], base_ws)
+        log_file_result(file_result)
+        file_list.append(file_result)
+
+    summary = {
+        'files': len(file_list),
+        'passed': sum(f['status'] == 'pass' for f in file_list),
+        'failed': sum(f['status'] == 'fail' for f in file_list),
+        'errors': sum(f['status'] == 'error' for f in file_list),
+        'unmatched_test': len(unmatched_test_list),
+        'unmatched_base': len(unmatched_base_list)}
+    logging.info(
+        '\nFiles: {files}  Passed: {passed}  Failed: {failed}  '
+        'Errors: {errors}  Unmatched Base: {unmatched_base}'.format(
+            **summary))
+
+    if report_path:
+        logging.info('Report: {}'.format(report_path))
+        report = {
+            'test_folder': test_ws, 'base_folder': base_ws,
+            'atol': atol, 'rtol': rtol, 'summary': summary,
+            'files': file_list, 'unmatched_test': unmatched_test_list,
+            'unmatched_base': unmatched_base_list}
+        write_report(report_path, report)
+
+    return (
+        summary['failed'] == 0 and summary['errors'] == 0 and
+        (partial_flag or summary['unmatched_base'] == 0))
 
-        # Check the columns
-        # Remove columns that are not common to both dataframes
-        test_fields = test_df.columns.values
-        base_fields = base_df.columns.values
-        missing_test_fields = list(
-            set(test_fields).difference(set(base_fields)))
-        missing_base_fields = list(
-            set(base_fields).difference(set(test_fields)))
-        for field in missing_test_fields:
-            logging.warning(
-                '  {} is not in the base file, skipping'.format(field))
-            del test_df[field]
-        for field in missing_base_fields:
-            logging.warning(
-                '  {} is not in the ETc file, skipping'.format(field))
-            del base_df[field]
-
-        # Convert the dates to datetimes
-        test_df[test_date_field] = pd.to_datetime(test_df[test_date_field])
-        base_df[base_date_field] = pd.to_datetime(base_df[base_date_field])
-
-        # Check the dateranges
-        missing_base_dates = list(
-            set(test_df[test_date_field]) - set(base_df[base_date_field]))
-        missing_test_dates = list(
-            set(base_df[base_date_field]) - set(test_df[test_date_field]))
-
-        if missing_base_dates:
-            logging.warning('  {} dates are not in the base file'.format(
-                len(missing_base_dates)))
-            missing_base_mask = ~test_df[test_date_field].isin(pd.Series(missing_base_dates))
-            test_df = test_df[missing_base_mask].reindex()
-            for missing_date in missing_base_dates:
-                logging.debug('    {}'.format(missing_date.date()))
-        if missing_test_dates:
-            logging.warning('  {} dates are not in the test file'.format(
-                len(missing_test_dates)))
-            missing_test_mask = ~base_df[base_date_field].isin(pd.Series(missing_test_dates))
-            base_df = base_df[missing_test_dates].reindex()
-            for missing_date in missing_test_dates:
-                logging.debug('    {}'.format(missing_date.date()))
-
-        # For each column, count the number of values that are exactly the same
-        diff_values = [0.0001, 0.001, 0.01, 0.1, 1]
-        log_str = '{0:>10s} {1}\n'.format(
-            '', ' '.join(['{0:>8}'.format(x) for x in diff_values]))
-        # logging.info('{0:>10s} {1}'.format(
-        #    '', ' '.join(['{0:>8}'.format(x) for x in diff_values])))
-        log_list = []
-        for field in test_df.columns.values:
-            if field.upper() in [test_date_field.upper(), 'DOY', 'YEAR', 'MONTH', 'DAY']:
+
+def output_path_dict(workspace):
+    """Find all of the output files in the folder and its sub-folders
+
+    Args:
+        workspace (str): output folder
+
+    Returns:
+        dict of the file paths keyed by the relative path without the
+            format and compression extensions
+    """
+    path_dict = dict()
+    for root, dirs, files in os.walk(workspace):
+        dirs.sort()
+        for item in sorted(files):
+            file_root, file_ext = os.path.splitext(item)
+            if file_ext.lower() in compress_ext_list:
+                file_root, file_ext = os.path.splitext(file_root)
+            if file_ext.lower() not in output_ext_list:
                 continue
-            diff_array = np.abs(test_df[field].values - base_df[field].values)
-            diff_list = [np.sum(diff_array <= v) for v in diff_values]
-            log_list += diff_list
-            log_str += '{0:>10s} {1}\n'.format(
-                field, ' '.join(['{0:>8}'.format(x) for x in diff_list]))
-            # logging.info('{0:>10s} {1}'.format(
-            #     , ' '.join(['{0:>8}'.format(x) for x in diff_list])))
-        if len(set(log_list)) <= 1:
-            logging.debug(log_str)
-        else:
-            logging.info(log_str)
+            rel_root = os.path.relpath(
+                os.path.join(root, file_root), workspace)
+            # Prefer the uncompressed CSV files if there are duplicates
+            if rel_root in path_dict and item.lower().endswith(
+                    tuple(compress_ext_list)):
+                continue
+            path_dict[rel_root] = os.path.join(root, item)
+    return path_dict
+
+
+def read_output_file(file_path, sep=','):
+    """Read a (possibly compressed or binary) output file into a DataFrame
+
+    The comment lines (crop name, growing season means) are skipped
+    """
+    return util.read_output_frame(file_path, sep=sep)[1]
+
+
+def key_array(input_df):
+    """Row keys (dates or years) of the output data frame"""
+    for key_field in key_field_list:
+        if key_field not in input_df.columns:
+            continue
+        if key_field == 'Date':
+            return key_field, pd.to_datetime(
+                input_df[key_field]).values.astype('datetime64[D]')
+        return key_field, input_df[key_field].values.astype(np.int64)
+    # Compare the rows in order
+    return None, np.arange(len(input_df.index))
+
+
+def key_str(key_value):
+    """JSON friendly date/year string"""
+    if isinstance(key_value, np.datetime64):
+        return str(key_value.astype('datetime64[D]'))
+    return str(key_value)
+
+
+def compare_files_mp(tup):
+    """Pool multiprocessing friendly compare_files function"""
+    return compare_files(*tup)
+
+
+def compare_files(test_path, base_path, atol=1E-6, rtol=0,
+                  partial_flag=False):
+    """Compare a test output file to a baseline file
+
+    The rows are matched by date (or year) and the values of each common
+    numeric field are compared with vectorized operations.  A value
+    diverges if the absolute difference is larger than
+    atol + rtol * |base| or if only one of the values is missing.
+    Baseline fields that are not in the test file are failures unless
+    partial_flag is set.
+
+    Args:
+        test_path (str): test file path
+        base_path (str): baseline file path
+        atol (float): absolute tolerance
+        rtol (float): relative tolerance
+        partial_flag (bool): if True, ignore the missing test fields
+
+    Returns:
+        dict of the file comparison (status is 'pass', 'fail' or 'error')
+    """
+    file_result = {
+        'test_path': test_path, 'base_path': base_path, 'status': 'error',
+        'rows': 0, 'missing_test_rows': 0, 'missing_base_rows': 0,
+        'missing_test_fields': [], 'missing_base_fields': [],
+        'first_divergence': None, 'fields': OrderedDict()}
+
+    # Try to open both of the files
+    try:
+        test_df = read_output_file(test_path)
+    except Exception as e:
+        file_result['error'] = 'Test file could not be read: {}'.format(e)
+        return file_result
+    try:
+        base_df = read_output_file(base_path)
+    except Exception as e:
+        file_result['error'] = 'Base file could not be read: {}'.format(e)
+        return file_result
+
+    # Check the columns
+    test_fields = list(test_df.columns.values)
+    base_fields = list(base_df.columns.values)
+    file_result['missing_base_fields'] = [
+        f for f in test_fields if f not in base_fields]
+    file_result['missing_test_fields'] = [
+        f for f in base_fields if f not in test_fields]
+
+    # Match the rows by date/year
+    # Files without unique dates/years (i.e. multiple cells) are compared
+    #   row by row
+    test_key_field, test_keys = key_array(test_df)
+    base_key_field, base_keys = key_array(base_df)
+    if test_key_field != base_key_field:
+        file_result['error'] = 'Date/Year fields do not match'
+        return file_result
+    if (len(np.unique(test_keys)) != len(test_keys) or
+            len(np.unique(base_keys)) != len(base_keys)):
+        test_keys = np.arange(len(test_keys))
+        base_keys = np.arange(len(base_keys))
+    common_keys, test_i, base_i = np.intersect1d(
+        test_keys, base_keys, assume_unique=True, return_indices=True)
+    file_result['rows'] = len(common_keys)
+    file_result['missing_base_rows'] = len(test_keys) - len(common_keys)
+    file_result['missing_test_rows'] = len(base_keys) - len(common_keys)
+
+    # Compare the common numeric fields
+    first_i = None
+    for field in test_fields:
+        if (field.upper() in skip_field_list or field not in base_fields or
+                test_df[field].dtype.kind not in 'iufb' or
+                base_df[field].dtype.kind not in 'iufb'):
+            continue
+        test_array = test_df[field].values[test_i].astype(np.float64)
+        base_array = base_df[field].values[base_i].astype(np.float64)
+        test_nan = np.isnan(test_array)
+        base_nan = np.isnan(base_array)
+        diff_array = np.abs(test_array - base_array)
+        diff_array[test_nan & base_nan] = 0
+        diverge_mask = (
+            (diff_array > atol + rtol * np.abs(base_array)) |
+            (test_nan != base_nan))
+        valid_diff = diff_array[~(test_nan | base_nan)]
+        field_result = {
+            'max_abs_diff': float(valid_diff.max()) if valid_diff.size else 0.0,
+            'mean_abs_diff': (
+                float(valid_diff.mean()) if valid_diff.size else 0.0),
+            'diverged': int(np.count_nonzero(diverge_mask)),
+            'first_divergence': None}
+        if field_result['diverged']:
+            field_i = int(np.argmax(diverge_mask))
+            field_result['first_divergence'] = key_str(common_keys[field_i])
+            if first_i is None or field_i < first_i:
+                first_i = field_i
+        file_result['fields'][field] = field_result
+
+    if first_i is not None:
+        file_result['first_divergence'] = key_str(common_keys[first_i])
+    if (first_i is not None or file_result['missing_test_rows'] or
+            file_result['missing_base_rows'] or
+            (file_result['missing_test_fields'] and not partial_flag)):
+        file_result['status'] = 'fail'
+    else:
+        file_result['status'] = 'pass'
+    return file_result
+
+
+def log_file_result(file_result):
+    """Log the comparison of a single file"""
+    logging.info('File: {}  {}'.format(
+        file_result['test_path'], file_result['status'].upper()))
+    if file_result['status'] == 'error':
+        logging.warning('  {}'.format(file_result['error']))
+        return
+    for field in file_result['missing_base_fields']:
+        logging.warning(
+            '  {} is not in the base file, skipping'.format(field))
+    for field in file_result['missing_test_fields']:
+        logging.warning('  {} is not in the test file'.format(field))
+    if file_result['missing_base_rows']:
+        logging.warning('  {} dates are not in the base file'.format(
+            file_result['missing_base_rows']))
+    if file_result['missing_test_rows']:
+        logging.warning('  {} dates are not in the test file'.format(
+            file_result['missing_test_rows']))
+
+    # Only show the field differences of the failed files
+    log_str = '{0:>10s} {1:>12s} {2:>12s} {3:>8s} {4:>12s}\n'.format(
+        '', 'Max Diff', 'Mean Diff', 'Diverged', 'First')
+    for field, field_result in file_result['fields'].items():
+        log_str += '{0:>10s} {1:>12.6f} {2:>12.6f} {3:>8d} {4:>12s}\n'.format(
+            field, field_result['max_abs_diff'],
+            field_result['mean_abs_diff'], field_result['diverged'],
+            field_result['first_divergence'] or '')
+    if file_result['status'] == 'pass':
+        logging.debug(log_str)
+    else:
+        logging.info(log_str)
+
+
+def write_report(report_path, report):
+    """Write the comparison report as JSON or CSV (one row per field)"""
+    if report_path.lower().endswith('.csv'):
+        report_fields = [
+            'test_path', 'base_path', 'status', 'rows', 'missing_test_rows',
+            'missing_base_rows', 'field', 'max_abs_diff', 'mean_abs_diff',
+            'diverged', 'first_divergence', 'error']
+        with open(report_path, 'wb') as report_f:
+            report_csv = csv.writer(report_f)
+            report_csv.writerow(report_fields)
+            for file_result in report['files']:
+                field_items = file_result['fields'].items() or [
+                    ('', {})]
+                for field, field_result in field_items:
+                    row = dict(file_result)
+                    row.update(field_result)
+                    row['field'] = field
+                    report_csv.writerow([
+                        '' if row.get(f) is None else row.get(f, '')
+                        for f in report_fields])
+    else:
+        with open(report_path, 'w') as report_f:
+            json.dump(report, report_f, indent=1)
 
 
 def parse_int_set(nputstr=""):
@@ -221,6 +435,28 @@ def parse_args():
     parser.add_argument(
         '-c', '--crops', default='', type=str,
         help='Comma separate list or range of crops to compare')
+    parser.add_argument(
+        '--test', default='daily_stats', metavar='FOLDER',
+        help='Test output folder (relative to the project folder)')
+    parser.add_argument(
+        '--base', default='daily_baseline', metavar='FOLDER',
+        help='Baseline output folder (relative to the project folder)')
+    parser.add_argument(
+        '--atol', default=1E-6, type=float,
+        help='Absolute tolerance')
+    parser.add_argument(
+        '--rtol', default=0, type=float,
+        help='Relative tolerance (of the baseline values)')
+    parser.add_argument(
+        '--report', default=None, metavar='PATH',
+        help='JSON (.json) or CSV (.csv) comparison report file path')
+    parser.add_argument(
+        '--partial', default=False, action='store_true',
+        help='Only compare the files and fields in the test folder')
+    parser.add_argument(
+        '-mp', '--multiprocessing', default=1, type=int,
+        metavar='N', nargs='?', const=mp.cpu_count(),
+        help='Number of processers to use')
     parser.add_argument(
         '--debug', default=logging.INFO, const=logging.DEBUG,
         help='Debug level logging', action="store_const", dest="loglevel")
@@ -235,7 +471,7 @@ def parse_args():
 if __name__ == '__main__':
     args = parse_args()
 
-    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    logging.basicConfig(level=args.loglevel, format='%(message)s')
     logging.info('\n{0}'.format('#'*80))
     log_f = '{0:<20s} {1}'
     logging.info(log_f.format(
@@ -243,4 +479,10 @@ if __name__ == '__main__':
     logging.info(log_f.format('Current Directory:', args.workspace))
     logging.info(log_f.format('Script:', os.path.basename(sys.argv[0])))
 
-    main(project_ws=args.workspace, crop_str=args.crops)
+    passed = main(
+        project_ws=args.workspace, crop_str=args.crops,
+        test_folder=args.test, base_folder=args.base, atol=args.atol,
+        rtol=args.rtol, report_path=args.report,
+        mp_procs=args.multiprocessing, partial_flag=args.partial)
+    # Non-zero exit code if any of the files diverged or are missing
+    sys.exit(0 if passed else 1)
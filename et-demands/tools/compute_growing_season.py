@@ -11,18 +11,18 @@ import argparse
 import csv
 import datetime as dt
 import logging
+import multiprocessing as mp
 import os
 import re
 import sys
 
 import numpy as np
-import pandas as pd
 
 import util
 
 
 def main(ini_path, start_date=None, end_date=None, crop_str='',
-         overwrite_flag=False):
+         overwrite_flag=False, mp_procs=1):
     """Compuate Growing Season Statistics
 
     Args:
@@ -31,19 +31,12 @@ def main(ini_path, start_date=None, end_date=None, crop_str='',
         end_date (str): ISO format date string (YYYY-MM-DD)
         crop_str (str): comma separate list or range of crops to compare
         overwrite_flag (bool): If True, overwrite existing files
+        mp_procs (int): number of cores to use for multiprocessing
 
     Returns:
         None
     """
 
-    # Field names
-    date_field = 'Date'
-    doy_field = 'DOY'
-    year_field = 'Year'
-    # month_field = 'Month'
-    # day_field   = 'Day'
-    season_field = 'Season'
-
     # Output file/folder names
     gs_summary_name = 'growing_season_full_summary.csv'
     gs_mean_annual_name = 'growing_season_mean_annual.csv'
@@ -142,13 +135,10 @@ def main(ini_path, start_date=None, end_date=None, crop_str='',
     #     item for item in os.listdir(daily_stats_ws)
     #     if re.match('\w+_daily_crop_\d{2}.csv$', item)])
 
-    # Initialize output data arrays and open bad data log file
-    gs_summary_data = []
-    gs_mean_annual_data = []
-    baddata_file = open(baddata_path, 'w')
-
     # Regular expressions
-    data_re = re.compile('(?P<CELLID>\w+)_daily_crop_(?P<CROP>\d+).csv$', re.I)
+    data_re = re.compile(
+        '(?P<CELLID>\w+)_daily_crop_(?P<CROP>\d+)' +
+        '.(csv|csv.gz|csv.zst|parquet|h5)$', re.I)
 
     # Build list of all data files
     data_file_list = sorted(
@@ -161,193 +151,42 @@ def main(ini_path, start_date=None, end_date=None, crop_str='',
             '  ERROR: Check the folder_name parameters\n')
         sys.exit()
 
-    # Process each file
+    # Station and crop number are parsed from the file name
+    file_args_list = []
     for file_path in data_file_list:
-        file_name = os.path.basename(file_path)
-        logging.debug('')
-        logging.info('  {0}'.format(file_name))
-
-        station, crop_num = os.path.splitext(file_name)[0].split('_daily_crop_')
-        crop_num = int(crop_num)
-        logging.debug('    Station:         {0}'.format(station))
-        logging.debug('    Crop Num:        {0}'.format(crop_num))
+        file_match = data_re.match(os.path.basename(file_path))
+        station = file_match.group('CELLID')
         if station == 'temp':
-            logging.debug('      Skipping')
+            logging.debug('  {0}\n    Skipping'.format(file_path))
             continue
+        file_args_list.append([
+            file_path, station, int(file_match.group('CROP')),
+            year_start, year_end, sep])
 
-        # Get crop name
-        with open(file_path, 'r') as file_f:
-            crop_name = file_f.readline().split('-', 1)[1].strip()
-            logging.debug('    Crop:            {0}'.format(crop_name))
-
-        # Read data from file into record array (structured array)
-        daily_df = pd.read_table(file_path, header=0, comment='#', sep=sep)
-        logging.debug('    Fields: {0}'.format(
-            ', '.join(daily_df.columns.values)))
-        daily_df[date_field] = pd.to_datetime(daily_df[date_field])
-        daily_df.set_index(date_field, inplace=True)
-        daily_df[year_field] = daily_df.index.year
-        # daily_df[year_field] = daily_df[date_field].map(lambda x: x.year)
-
-        # Build list of unique years
-        year_array = np.sort(np.unique(
-            np.array(daily_df[year_field]).astype(np.int)))
-        logging.debug('    All Years: {0}'.format(
-            ', '.join(list(util.ranges(year_array.tolist())))))
-        # logging.debug('    All Years: {0}'.format(
-        #    ','.join(map(str, year_array.tolist()))))
-
-        # Don't include the first year in the stats
-        crop_year_start = min(daily_df[year_field])
-        logging.debug('    Skipping {}, first year'.format(crop_year_start))
-        daily_df = daily_df[daily_df[year_field] > crop_year_start]
-
-        # Check if start and end years have >= 365 days
-        crop_year_start = min(daily_df[year_field])
-        crop_year_end = max(daily_df[year_field])
-        if sum(daily_df[year_field] == crop_year_start) < 365:
-            logging.debug('    Skipping {}, missing days'.format(
-                crop_year_start))
-            daily_df = daily_df[daily_df[year_field] > crop_year_start]
-        if sum(daily_df[year_field] == crop_year_end) < 365:
-            logging.debug('    Skipping {}, missing days'.format(
-                crop_year_end))
-            daily_df = daily_df[daily_df[year_field] < crop_year_end]
-        del crop_year_start, crop_year_end
-
-        # Only keep years between year_start and year_end
-        if year_start:
-            daily_df = daily_df[daily_df[year_field] >= year_start]
-        if year_end:
-            daily_df = daily_df[daily_df[year_field] <= year_end]
-
-        year_sub_array = np.sort(np.unique(np.array(daily_df[year_field]).astype(np.int)))
-        logging.debug('    Plot Years: {0}'.format(
-            ', '.join(list(util.ranges(year_sub_array.tolist())))))
-        # logging.debug('    Plot Years: {0}'.format(
-        #    ','.join(map(str, year_sub_array.tolist()))))
-
-        # Get separate date related fields
-        date_array = daily_df.index.date
-        year_array = daily_df[year_field].values.astype(np.int)
-        doy_array = daily_df[doy_field].values.astype(np.int)
-
-        # Remove leap days
-        # leap_array = (doy_array == 366)
-        # doy_sub_array = np.delete(doy_array, np.where(leap_array)[0])
-
-        # Build separate arrays for each set of crop specific fields
-        season_array = np.array(daily_df[season_field])
-
-        # # Original code from growing_season script
-        # Initialize mean annual growing season length variables
-        gs_sum, gs_cnt, gs_mean = 0, 0, 0
-        start_sum, start_cnt, start_mean = 0, 0, 0
-        end_sum, end_cnt, end_mean = 0, 0, 0
-
-        # Process each year
-        for year_i, year in enumerate(year_sub_array):
-            year_crop_str = "Crop: {0:2d} {1:32s}  Year: {2}".format(
-                crop_num, crop_name, year)
-            logging.debug(year_crop_str)
-
-            # Extract data for target year
-            year_mask = (year_array == year)
-            date_sub_array = date_array[year_mask]
-            doy_sub_array = doy_array[year_mask]
-            season_sub_mask = season_array[year_mask]
-
-            # Look for transitions in season value
-            # Start transitions up the day before the actual start
-            # End transitions down on the end date
-            try:
-                start_i = np.where(np.diff(season_sub_mask) == 1)[0][0] + 1
-            except:
-                start_i = None
-            try:
-                end_i = np.where(np.diff(season_sub_mask) == -1)[0][0]
-            except:
-                end_i = None
-
-            # If start transition is not found, season starts on DOY 1
-            if start_i is None and end_i is not None:
-                start_i = 0
-            # If end transition is not found, season ends on DOY 365/366
-            elif start_i is not None and end_i is None:
-                end_i = -1
-            # If neither transition is found, season is always on
-            # elif start_i is None and end_i is None:
-            #     , end_i = 0, -1
-
-            # Calculate start and stop day of year
-            # Set start/end to 0 if season never gets set to 1
-            if not np.any(season_sub_mask):
-                skip_str = "  Skipping, season flag was never set to 1"
-                logging.debug(skip_str)
-                baddata_file.write(
-                    '{0}  {1} {2}\n'.format(station, year_crop_str, skip_str))
-                start_doy, end_doy = 0, 0
-                start_date, end_date = "", ""
-            elif np.all(season_sub_mask):
-                start_doy, end_doy = doy_sub_array[0], doy_sub_array[-1]
-                start_date = date_sub_array[0].isoformat()
-                end_date = date_sub_array[-1].isoformat()
-            else:
-                start_doy, end_doy = doy_sub_array[start_i], doy_sub_array[end_i]
-                start_date = date_sub_array[start_i].isoformat()
-                end_date = date_sub_array[end_i].isoformat()
-            gs_length = sum(season_sub_mask)
-            logging.debug("Start: {0} ({1})  End: {2} ({3})".format(
-                start_doy, start_date, end_doy, end_date))
-
-            # Track growing season length and mean annual g.s. length
-            if start_doy > 0 and end_doy > 0 and year_i != 0:
-                start_sum += start_doy
-                end_sum += end_doy
-                gs_sum += gs_length
-                start_cnt += 1
-                end_cnt += 1
-                gs_cnt += 1
-
-            # Append data to list
-            gs_summary_data.append(
-                [station, crop_num, crop_name, year,
-                 start_doy, end_doy, start_date, end_date, gs_length])
-
-            # Cleanup
-            del year_mask, doy_sub_array, season_sub_mask
-            del start_doy, end_doy, start_date, end_date, gs_length
-
-        # Calculate mean annual growing season start/end/length
-        if gs_cnt > 0:
-            mean_start_doy = int(round(float(start_sum) / start_cnt))
-            mean_end_doy = int(round(float(end_sum) / end_cnt))
-            mean_length = int(round(float(gs_sum) / gs_cnt))
-            mean_start_date = util.doy_2_date(year, mean_start_doy)
-            mean_end_date = util.doy_2_date(year, mean_end_doy)
-        else:
-            mean_start_doy, mean_end_doy, mean_length = 0, 0, 0
-            mean_start_date, mean_end_date = "", ""
-
-        # Append mean annual growing season data to list
-        gs_mean_annual_data.append(
-            [station, crop_num, crop_name,
-             mean_start_doy, mean_end_doy,
-             mean_start_date, mean_end_date, mean_length])
-
-        # Cleanup
-        del season_array
-        del gs_sum, gs_cnt, gs_mean
-        del start_sum, start_cnt, start_mean
-        del end_sum, end_cnt, end_mean
-        del mean_start_doy, mean_end_doy, mean_length
-        del mean_start_date, mean_end_date
-        del year_array, year_sub_array, doy_array
-        del daily_df
-        logging.debug("")
-
-    # Close bad data file log
+    # Process each file
+    # Files are processed in parallel, but the results are kept in order
+    if mp_procs > 1:
+        pool = mp.Pool(mp_procs)
+        results = pool.imap(
+            file_growing_season_mp, file_args_list,
+            chunksize=max(1, len(file_args_list) // (4 * mp_procs)))
+        pool.close()
+    else:
+        results = (file_growing_season(*args) for args in file_args_list)
+
+    # Merge the results and write the bad data log file
+    gs_summary_data = []
+    gs_mean_annual_data = []
+    baddata_file = open(baddata_path, 'w')
+    for summary_rows, mean_annual_row, baddata_lines in results:
+        gs_summary_data.extend(summary_rows)
+        gs_mean_annual_data.append(mean_annual_row)
+        baddata_file.writelines(baddata_lines)
     baddata_file.close()
+    if mp_procs > 1:
+        pool.join()
+        del pool
+    del results
 
     # Build output record array file
     gs_summary_csv = csv.writer(open(gs_summary_path, 'wb'))
@@ -370,6 +209,178 @@ def main(ini_path, start_date=None, end_date=None, crop_str='',
     del gs_mean_annual_csv, gs_mean_annual_data
 
 
+def file_growing_season_mp(tup):
+    """Pool multiprocessing friendly file_growing_season function"""
+    return file_growing_season(*tup)
+
+
+def file_growing_season(file_path, station, crop_num, year_start=None,
+                        year_end=None, sep=','):
+    """Compute the growing season statistics for a single daily file
+
+    Only the Date, DOY and Season columns are read
+
+    Args:
+        file_path (str): daily output file path
+        station (str): ET cell ID
+        crop_num (int): crop number
+        year_start (int): first year to include
+        year_end (int): last year to include
+        sep (str): CSV file delimiter
+
+    Returns:
+        tuple of the annual summary rows, the mean annual row
+            and the bad data log lines
+    """
+    # Field names
+    date_field = 'Date'
+    doy_field = 'DOY'
+    season_field = 'Season'
+
+    logging.debug('')
+    logging.info('  {0}'.format(os.path.basename(file_path)))
+    logging.debug('    Station:         {0}'.format(station))
+    logging.debug('    Crop Num:        {0}'.format(crop_num))
+
+    # Get crop name from the file header/metadata
+    crop_name, daily_df = util.read_crop_output(
+        file_path, sep=sep, usecols=[date_field, doy_field, season_field])
+    logging.debug('    Crop:            {0}'.format(crop_name))
+    date_array = daily_df[date_field].values.astype('datetime64[D]')
+    year_array = date_array.astype('datetime64[Y]').astype(np.int) + 1970
+    doy_array = daily_df[doy_field].values.astype(np.int)
+    season_array = daily_df[season_field].values.astype(np.int)
+    del daily_df
+    logging.debug('    All Years: {0}'.format(
+        ', '.join(list(util.ranges(np.unique(year_array).tolist())))))
+
+    # Don't include the first year in the stats
+    year_mask = year_array > year_array.min()
+    logging.debug('    Skipping {}, first year'.format(year_array.min()))
+
+    # Check if start and end years have >= 365 days
+    if np.any(year_mask):
+        crop_year_start = year_array[year_mask].min()
+        crop_year_end = year_array[year_mask].max()
+        if np.sum(year_mask & (year_array == crop_year_start)) < 365:
+            logging.debug('    Skipping {}, missing days'.format(
+                crop_year_start))
+            year_mask &= year_array > crop_year_start
+        if np.sum(year_mask & (year_array == crop_year_end)) < 365:
+            logging.debug('    Skipping {}, missing days'.format(
+                crop_year_end))
+            year_mask &= year_array < crop_year_end
+
+    # Only keep years between year_start and year_end
+    if year_start:
+        year_mask &= year_array >= year_start
+    if year_end:
+        year_mask &= year_array <= year_end
+    date_array = date_array[year_mask]
+    year_array = year_array[year_mask]
+    doy_array = doy_array[year_mask]
+    season_array = season_array[year_mask]
+    logging.debug('    Plot Years: {0}'.format(
+        ', '.join(list(util.ranges(np.unique(year_array).tolist())))))
+
+    # Season start/end index of all years
+    year_sub_array, start_i, end_i, gs_length = season_transitions(
+        year_array, season_array)
+
+    summary_rows = []
+    baddata_lines = []
+    start_doy_list, end_doy_list, gs_length_list = [], [], []
+    for year_i, year in enumerate(year_sub_array.tolist()):
+        year_crop_str = "Crop: {0:2d} {1:32s}  Year: {2}".format(
+            crop_num, crop_name, year)
+        # Set start/end to 0 if season never gets set to 1
+        if start_i[year_i] < 0:
+            skip_str = "  Skipping, season flag was never set to 1"
+            logging.debug(year_crop_str + skip_str)
+            baddata_lines.append(
+                '{0}  {1} {2}\n'.format(station, year_crop_str, skip_str))
+            start_doy, end_doy = 0, 0
+            start_date, end_date = "", ""
+        else:
+            start_doy = int(doy_array[start_i[year_i]])
+            end_doy = int(doy_array[end_i[year_i]])
+            start_date = str(date_array[start_i[year_i]])
+            end_date = str(date_array[end_i[year_i]])
+        summary_rows.append(
+            [station, crop_num, crop_name, year, start_doy, end_doy,
+             start_date, end_date, int(gs_length[year_i])])
+
+        # Track growing season length and mean annual g.s. length
+        if start_doy > 0 and end_doy > 0 and year_i != 0:
+            start_doy_list.append(start_doy)
+            end_doy_list.append(end_doy)
+            gs_length_list.append(int(gs_length[year_i]))
+
+    # Calculate mean annual growing season start/end/length
+    if gs_length_list:
+        mean_start_doy = int(round(
+            float(sum(start_doy_list)) / len(start_doy_list)))
+        mean_end_doy = int(round(float(sum(end_doy_list)) / len(end_doy_list)))
+        mean_length = int(round(
+            float(sum(gs_length_list)) / len(gs_length_list)))
+        mean_start_date = util.doy_2_date(year, mean_start_doy)
+        mean_end_date = util.doy_2_date(year, mean_end_doy)
+    else:
+        mean_start_doy, mean_end_doy, mean_length = 0, 0, 0
+        mean_start_date, mean_end_date = "", ""
+    mean_annual_row = [
+        station, crop_num, crop_name, mean_start_doy, mean_end_doy,
+        mean_start_date, mean_end_date, mean_length]
+    return summary_rows, mean_annual_row, baddata_lines
+
+
+def season_transitions(year_array, season_array):
+    """Find the growing season start and end of every year at once
+
+    The season starts the day after the first 0 to 1 transition and ends
+    on the day of the first 1 to 0 transition within each year.  If only
+    one of the transitions is found, the season starts on the first day
+    or ends on the last day of the year.  If the season flag is always
+    set, the season is the full year.
+
+    Args:
+        year_array (array): year of each day (sorted)
+        season_array (array): season flag of each day
+
+    Returns:
+        tuple of the years, the start and end day indices of the season
+            (-1 if the season flag was never set) and the season length
+    """
+    if not len(year_array):
+        empty = np.array([], dtype=np.int)
+        return empty, empty, empty, empty
+    year_start_i = np.concatenate(
+        [[0], np.flatnonzero(year_array[1:] != year_array[:-1]) + 1])
+    year_end_i = np.append(year_start_i[1:], len(year_array)) - 1
+    gs_length = np.add.reduceat(season_array, year_start_i)
+
+    # Transitions are only counted within each year
+    season_diff = np.diff(season_array)
+    same_year = year_array[1:] == year_array[:-1]
+
+    def first_transition(diff_value):
+        """Index of the first transition of each year (-1 if none)"""
+        diff_i = np.flatnonzero((season_diff == diff_value) & same_year)
+        diff_year_i = np.searchsorted(year_start_i, diff_i, side='right') - 1
+        first_i = np.full(len(year_start_i), -1, dtype=np.int)
+        unique_year_i, unique_i = np.unique(diff_year_i, return_index=True)
+        first_i[unique_year_i] = diff_i[unique_i]
+        return first_i
+    up_i = first_transition(1)
+    down_i = first_transition(-1)
+
+    start_i = np.where(up_i >= 0, up_i + 1, year_start_i)
+    end_i = np.where(down_i >= 0, down_i, year_end_i)
+    start_i[gs_length == 0] = -1
+    end_i[gs_length == 0] = -1
+    return year_array[year_start_i], start_i, end_i, gs_length
+
+
 def parse_args():
     """"""
     parser = argparse.ArgumentParser(
@@ -390,6 +401,10 @@ def parse_args():
     parser.add_argument(
         '-o', '--overwrite', default=None, action="store_true",
         help='Force overwrite of existing files')
+    parser.add_argument(
+        '-mp', '--multiprocessing', default=1, type=int,
+        metavar='N', nargs='?', const=mp.cpu_count(),
+        help='Number of processers to use')
     parser.add_argument(
         '--debug', default=logging.INFO, const=logging.DEBUG,
         help='Debug level logging', action="store_const", dest="loglevel")
@@ -430,4 +445,5 @@ if __name__ == '__main__':
     logging.info(log_f.format('Script:', os.path.basename(sys.argv[0])))
 
     main(ini_path, start_date=args.start, end_date=args.end,
-         crop_str=args.crops, overwrite_flag=args.overwrite)
+         crop_str=args.crops, overwrite_flag=args.overwrite,
+         mp_procs=args.multiprocessing)
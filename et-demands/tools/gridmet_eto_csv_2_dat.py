@@ -6,21 +6,49 @@
 # Python:       2.7
 #--------------------------------
 
+import argparse
 import datetime as dt
 import logging
 import math
+import multiprocessing as mp
 import os
 import sys
 
 import numpy as np
 import pandas as pd
 
-
-def main(project_ws):
+# GRIDMET datarod CSV field names and the RefET field names
+# Year, Month, Day, DOY, Tmin(K), Tmax(K), Specific Humidity(kg kg-1),
+# Wind @ 10m (m s-1), Solar Radiation (W m-2), Precipitation (mm),
+# ETo @ 2m (mm day-1), ETr @ 2m(mm day-1)
+gridmet_fields = [
+    ('Tmax(K)', 'TMax'),
+    ('Tmin(K)', 'TMin'),
+    ('Precipitation (mm)', 'Precip'),
+    ('Solar Radiation (W m-2)', 'EstRs'),
+    ('Wind @ 10m (m s-1)', 'EsWind'),
+    ('Specific Humidity(kg kg-1)', 'EsTDew'),
+    ('ETr @ 2m(mm day-1)', 'ASCEr'),
+    ('ETo @ 2m (mm day-1)', 'ASCEg')]
+
+# Output field order (the extra RefET fields are set to 0)
+output_fields = [
+    'Date', 'TMax', 'TMin', 'Precip', 'Snow', 'SDep', 'EstRs', 'EsWind',
+    'EsTDew', 'Penm48', 'PreTay', 'ASCEr', 'ASCEg', '85Harg']
+
+# Output file extension of each output format
+output_ext = {'dat': '.dat', 'parquet': '.parquet'}
+
+
+def main(project_ws, output_format='dat', mp_procs=1):
     """Convert GRIDMET 4km datarods to RefET output format for CropET
 
     Args:
         project_ws (str):
+        output_format (str): 'dat' (tab delimited) or 'parquet'
+            The Parquet files can be read directly by CropET
+            (set the name_format extension to .parquet in the INI file)
+        mp_procs (int): number of cores to use for multiprocessing
 
     Returns:
         None
@@ -48,6 +76,17 @@ def main(project_ws):
             "\nERROR: The station file {} does not exist.\n".format(
                     station_path))
         sys.exit()
+    if output_format not in output_ext.keys():
+        logging.error(
+            "\nERROR: Unsupported output format {}\n".format(output_format))
+        sys.exit()
+    elif output_format == 'parquet':
+        try:
+            import pyarrow
+        except ImportError:
+            logging.error(
+                '\nERROR: The pyarrow module is needed for Parquet output\n')
+            sys.exit()
 
     # Get the station elevations
     station_array = np.loadtxt(station_path, delimiter='\t', dtype='str')
@@ -58,70 +97,98 @@ def main(project_ws):
     for row in station_array[1:]:
         station_elev_dict[row[station_i]] = float(row[elev_i]) * 0.3048
 
-    # Process each ETo file
-    for item in os.listdir(eto_ws):
+    # Build the list of ETo files to convert
+    convert_list = []
+    for item in sorted(os.listdir(eto_ws)):
         if not item.endswith('.csv'):
             continue
-        print item
 
         # Get the GRIDMET cell ID
         station_id = item.split('.')[0].split('_')[1]
+        if station_id not in station_elev_dict.keys():
+            logging.warning(
+                '  {} - station {} is not in the station file, '
+                'skipping'.format(item, station_id))
+            continue
 
         input_csv = os.path.join(eto_ws, item)
-        output_dat = os.path.join(eto_ws, '{0}.dat'.format(station_id))
-
-        # Read input GRIDMET datarod CSV
-        data_df = pd.read_csv(
-            input_csv, sep=',', parse_dates=[[0, 1, 2]],
-            date_parser=lambda *columns: dt.date(*map(int, columns)))
-
-        # Remove extra columns
-        data_df = data_df.drop('DOY', 1)
-
-        # Add extra columns (using RefET column names)
-        data_df['Snow'] = pd.Series(0, index=data_df.index)
-        data_df['SDep'] = pd.Series(0, index=data_df.index)
-        data_df['Penm48'] = pd.Series(0, index=data_df.index)
-        data_df['PreTay'] = pd.Series(0, index=data_df.index)
-        data_df['85Harg'] = pd.Series(0, index=data_df.index)
-
-        # Year, Month, Day, DOY, Tmin(K), Tmax(K), Specific Humidity(kg kg-1),
-        # Wind @ 10m (m s-1), Solar Radiation (W m-2), Precipitation (mm),
-        # ETo @ 2m (mm day-1), ETr @ 2m(mm day-1)
-
-        # Rename columns
-        data_df.rename(columns={'Year_Month_Day':'Date'}, inplace=True)
-        data_df.rename(columns={'Tmax(K)':'TMax'}, inplace=True)
-        data_df.rename(columns={'Tmin(K)':'TMin'}, inplace=True)
-        data_df.rename(columns={'Wind @ 10m (m s-1)':'EsWind'}, inplace=True)
-        data_df.rename(columns={'Solar Radiation (W m-2)':'EstRs'}, inplace=True)
-        data_df.rename(columns={'Precipitation (mm)':'Precip'}, inplace=True)
-        data_df.rename(columns={'Specific Humidity(kg kg-1)':'EsTDew'}, inplace=True)
-        data_df.rename(columns={'ETo @ 2m (mm day-1)':'ASCEg'}, inplace=True)
-        data_df.rename(columns={'ETr @ 2m(mm day-1)':'ASCEr'}, inplace=True)
-
-        # Reorder columns
-        data_df = data_df.loc[:,['Date', 'TMax', 'TMin', 'Precip', 'Snow', 'SDep',
-                                 'EstRs', 'EsWind', 'EsTDew', 'Penm48', 'PreTay',
-                                 'ASCEr', 'ASCEg', '85Harg']]
-
-        # Convert temperature from K to C
-        data_df['TMax'] -= 273.15
-        data_df['TMin'] -= 273.15
-
-        # Convert W/m2 to MJ/m2
-        data_df['EstRs'] *= 0.0864
-
-        # Scale wind from 10m to 2m
-        data_df['EsWind'] *= 4.87 / math.log(67.8 * 10 - 5.42)
-
-        # Convert specific humidity to Tdew
-        pair_array = pair_func(0.3048 * station_elev_dict[station_id])
-        ea_array = ea_from_q(pair_array, data_df['EsTDew'])
-        data_df['EsTDew'] = tdew_from_ea(ea_array)
+        output_path = os.path.join(
+            eto_ws, station_id + output_ext[output_format])
+        convert_list.append([
+            input_csv, output_path, station_elev_dict[station_id],
+            output_format])
+
+    # Process each ETo file
+    if mp_procs > 1 and len(convert_list) > 1:
+        pool = mp.Pool(mp_procs)
+        results = pool.imap(
+            convert_file_mp, convert_list,
+            chunksize=max(1, len(convert_list) // (4 * mp_procs)))
+        pool.close()
+    else:
+        results = (convert_file(*args) for args in convert_list)
+    for input_csv, row_count in results:
+        logging.info('  {}  ({} days)'.format(
+            os.path.basename(input_csv), row_count))
+
+
+def convert_file_mp(tup):
+    """Pool multiprocessing friendly convert_file function"""
+    return convert_file(*tup)
 
+
+def convert_file(input_csv, output_path, station_elev, output_format='dat'):
+    """Convert a single GRIDMET datarod CSV file
+
+    Args:
+        input_csv (str): GRIDMET datarod CSV file path
+        output_path (str): output file path
+        station_elev (float): station elevation
+        output_format (str): 'dat' (tab delimited) or 'parquet'
+
+    Returns:
+        tuple of the input file path and the number of days
+    """
+    # Read input GRIDMET datarod CSV
+    data_df = pd.read_csv(input_csv, sep=',')
+    row_count = len(data_df.index)
+
+    # Build the dates from the year, month and day columns
+    output_df = pd.DataFrame({
+        'Date': pd.to_datetime(dict(
+            year=data_df.iloc[:, 0], month=data_df.iloc[:, 1],
+            day=data_df.iloc[:, 2]))})
+    for gridmet_field, output_field in gridmet_fields:
+        output_df[output_field] = data_df[gridmet_field].values
+
+    # Add extra columns (using RefET column names)
+    for output_field in ['Snow', 'SDep', 'Penm48', 'PreTay', '85Harg']:
+        output_df[output_field] = 0
+    output_df = output_df[output_fields]
+
+    # Convert temperature from K to C
+    output_df['TMax'] -= 273.15
+    output_df['TMin'] -= 273.15
+
+    # Convert W/m2 to MJ/m2
+    output_df['EstRs'] *= 0.0864
+
+    # Scale wind from 10m to 2m
+    output_df['EsWind'] *= 4.87 / math.log(67.8 * 10 - 5.42)
+
+    # Convert specific humidity to Tdew
+    pair_array = pair_func(0.3048 * station_elev)
+    ea_array = ea_from_q(pair_array, output_df['EsTDew'].values)
+    output_df['EsTDew'] = tdew_from_ea(ea_array)
+
+    if output_format == 'parquet':
+        output_df.to_parquet(output_path, index=False)
+    else:
         # Write to tab delimited file
-        data_df.to_csv(output_dat, '\t', index=False)
+        output_df.to_csv(
+            output_path, sep='\t', index=False, date_format='%Y-%m-%d')
+    return input_csv, row_count
+
 
 def pair_func(elevation):
     """Calculates air pressure as a function of elevation
@@ -158,5 +225,42 @@ def tdew_from_ea(ea):
     return (237.3 * np.log(ea / 0.6108)) / (17.27 - np.log(ea / 0.6108))
 
 
+def parse_args():
+    """"""
+    parser = argparse.ArgumentParser(
+        description='Convert GRIDMET Datarods to RefET Format',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        'workspace', nargs='?', default=os.getcwd(),
+        help='Project Folder', metavar='FOLDER')
+    parser.add_argument(
+        '--format', default='dat', choices=['dat', 'parquet'],
+        help='Output file format')
+    parser.add_argument(
+        '-mp', '--multiprocessing', default=1, type=int,
+        metavar='N', nargs='?', const=mp.cpu_count(),
+        help='Number of processers to use')
+    parser.add_argument(
+        '--debug', default=logging.INFO, const=logging.DEBUG,
+        help='Debug level logging', action="store_const", dest="loglevel")
+    args = parser.parse_args()
+
+    # Convert project folder to an absolute path if necessary
+    if args.workspace and os.path.isdir(os.path.abspath(args.workspace)):
+        args.workspace = os.path.abspath(args.workspace)
+    return args
+
+
 if __name__ == '__main__':
-    main(os.getcwd())
+    args = parse_args()
+
+    logging.basicConfig(level=args.loglevel, format='%(message)s')
+    logging.info('\n{0}'.format('#'*80))
+    log_f = '{0:<20s} {1}'
+    logging.info(log_f.format(
+        'Run Time Stamp:', dt.datetime.now().isoformat(' ')))
+    logging.info(log_f.format('Current Directory:', args.workspace))
+    logging.info(log_f.format('Script:', os.path.basename(sys.argv[0])))
+
+    main(args.workspace, output_format=args.format,
+         mp_procs=args.multiprocessing)
@@ -11,13 +11,14 @@ import argparse
 import datetime as dt
 import gc
 import logging
+import multiprocessing as mp
 import os
 import re
 import sys
 
 from bokeh.plotting import figure, output_file, save, show
 from bokeh.layouts import column
-from bokeh.models import Range1d
+from bokeh.models import ColumnDataSource, CustomJS, Range1d
 import numpy as np
 import pandas as pd
 
@@ -26,7 +27,8 @@ import util
 
 def main(ini_path, figure_show_flag=False, figure_save_flag=True,
          figure_size=(1000, 300), start_date=None, end_date=None,
-         crop_str='', overwrite_flag=False):
+         crop_str='', overwrite_flag=False, lod_method='minmax',
+         mp_procs=1):
     """Plot full daily data by crop
 
     Args:
@@ -38,6 +40,9 @@ def main(ini_path, figure_show_flag=False, figure_save_flag=True,
         end_date (str): ISO format date string (YYYY-MM-DD)
         crop_str (str): comma separate list or range of crops to compare
         overwrite_flag (bool): If True, overwrite existing files
+        lod_method (str): 'minmax' or 'lttb' to downsample the lines
+            or 'none' to plot the full daily record
+        mp_procs (int): number of cores to use for multiprocessing
 
     Returns:
         None
@@ -52,38 +57,6 @@ def main(ini_path, figure_show_flag=False, figure_save_flag=True,
     # These crops will not be processed (if set)
     crop_skip_list = [44, 45, 46]
 
-    # Input field names
-    date_field = 'Date'
-    doy_field = 'DOY'
-    year_field = 'Year'
-    # month_field = 'Month'
-    # day_field = 'Day'
-    pmeto_field = 'PMETo'
-    precip_field = 'PPT'
-    # t30_field = 'T30'
-
-    etact_field = 'ETact'
-    etpot_field = 'ETpot'
-    etbas_field = 'ETbas'
-    irrig_field = 'Irrigation'
-    season_field = 'Season'
-    runoff_field = 'Runoff'
-    dperc_field = 'DPerc'
-    # niwr_field = 'NIWR'
-
-    # Number of header lines in data file
-    # header_lines = 2
-
-    # Additional figure controls
-    # figure_dynamic_size = False
-    figure_ylabel_size = '12pt'
-
-    # Delimiter
-    sep = ','
-    # sep = r"\s*"
-
-    sub_x_range_flag = True
-
     logging.info('\nPlot mean daily data by crop')
     logging.info('  INI: {}'.format(ini_path))
 
@@ -153,7 +126,9 @@ def main(ini_path, figure_show_flag=False, figure_save_flag=True,
     #        figure_height = 300
 
     # Regular expressions
-    data_re = re.compile('(?P<CELLID>\w+)_daily_crop_(?P<CROP>\d+).csv$', re.I)
+    data_re = re.compile(
+        '(?P<CELLID>\w+)_daily_crop_(?P<CROP>\d+)' +
+        '.(csv|csv.gz|csv.zst|parquet|h5)$', re.I)
 
     # Build list of all data files
     data_file_list = sorted(
@@ -165,203 +140,545 @@ def main(ini_path, figure_show_flag=False, figure_save_flag=True,
             '  ERROR: Check the folder_name parameters\n')
         sys.exit()
 
-    # Process each file
+    # Build the list of files to plot
+    file_args_list = []
     for file_path in data_file_list:
         file_name = os.path.basename(file_path)
-        logging.debug('')
-        logging.info('  {0}'.format(file_name))
-
-        station, crop_num = os.path.splitext(file_name)[0].split('_daily_crop_')
+        station, crop_num = data_re.match(file_name).group('CELLID', 'CROP')
         crop_num = int(crop_num)
-        logging.debug('    Station:         {0}'.format(station))
-        logging.debug('    Crop Num:        {0}'.format(crop_num))
         if station == 'temp':
-            logging.debug('      Skipping')
+            logging.debug('  {0}\n    Skipping'.format(file_name))
             continue
         elif crop_skip_list and crop_num in crop_skip_list:
-            logging.debug('    Skipping, crop number in crop_skip_list')
+            logging.debug(
+                '  {0}\n    Skipping, crop number in crop_skip_list'.format(
+                    file_name))
             continue
         elif crop_keep_list and crop_num not in crop_keep_list:
-            logging.debug('    Skipping, crop number not in crop_keep_list')
+            logging.debug(
+                '  {0}\n    Skipping, crop number not in crop_keep_list'.format(
+                    file_name))
             continue
+        file_args_list.append([
+            file_path, output_ws, station, crop_num, figure_show_flag,
+            figure_save_flag, figure_size, year_start, year_end,
+            overwrite_flag, lod_method])
 
-        # Get crop name
-        with open(file_path, 'r') as file_f:
-            crop_name = file_f.readline().split('-', 1)[1].strip()
-            logging.debug('    Crop:            {0}'.format(crop_name))
-
-        # Read data from file into record array (structured array)
-        daily_df = pd.read_table(file_path, header=0, comment='#', sep=sep)
-        logging.debug('    Fields: {0}'.format(
-            ', '.join(daily_df.columns.values)))
-        daily_df[date_field] = pd.to_datetime(daily_df[date_field])
-        daily_df.set_index(date_field, inplace=True)
-        daily_df[year_field] = daily_df.index.year
-        # daily_df[year_field] = daily_df[date_field].map(lambda x: x.year)
-
-        # Build list of unique years
-        year_array = np.sort(np.unique(
-            np.array(daily_df[year_field]).astype(np.int)))
-        logging.debug('    All Years: {0}'.format(
-            ', '.join(list(util.ranges(year_array.tolist())))))
-        # logging.debug('    All Years: {0}'.format(
-        #    ','.join(map(str, year_array.tolist()))))
-
-        # Don't include the first year in the stats
-        crop_year_start = min(daily_df[year_field])
-        logging.debug('    Skipping {}, first year'.format(crop_year_start))
-        daily_df = daily_df[daily_df[year_field] > crop_year_start]
+    # Process each file
+    # Figures can't be shown from the worker processes
+    if figure_show_flag and mp_procs > 1:
+        logging.warning('  Show flag is set, disabling multiprocessing')
+        mp_procs = 1
+    if mp_procs > 1 and len(file_args_list) > 1:
+        pool = mp.Pool(min(mp_procs, len(file_args_list)))
+        pool.map(plot_daily_file_mp, file_args_list, chunksize=1)
+        pool.close()
+        pool.join()
+        del pool
+    else:
+        for file_args in file_args_list:
+            plot_daily_file(*file_args)
 
-        # Check if start and end years have >= 365 days
-        crop_year_start = min(daily_df[year_field])
-        crop_year_end = max(daily_df[year_field])
-        if sum(daily_df[year_field] == crop_year_start) < 365:
-            logging.debug(
-                '    Skipping {}, missing days'.format(crop_year_start))
-            daily_df = daily_df[daily_df[year_field] > crop_year_start]
-        if sum(daily_df[year_field] == crop_year_end) < 365:
-            logging.debug(
-                '    Skipping {}, missing days'.format(crop_year_end))
-            daily_df = daily_df[daily_df[year_field] < crop_year_end]
-
-        # Only keep years between year_start and year_end
-        # Adjust crop years
-        if year_start:
-            daily_df = daily_df[daily_df[year_field] >= year_start]
-            crop_year_start = max(year_start, crop_year_start)
-        if year_end:
-            daily_df = daily_df[daily_df[year_field] <= year_end]
-            crop_year_end = min(year_end, crop_year_end)
-
-        year_sub_array = np.sort(
-            np.unique(np.array(daily_df[year_field]).astype(np.int)))
-        logging.debug('    Plot Years: {0}'.format(
-            ', '.join(list(util.ranges(year_sub_array.tolist())))))
-        # logging.debug('    Plot Years: {0}'.format(
-        #    ','.join(map(str, year_sub_array.tolist()))))
-
-        # Initial range of timeseries to show
-        # For now default to last ~8 year
-        if sub_x_range_flag:
-            x_range = Range1d(
-                np.datetime64(dt.datetime(
-                    max(crop_year_end - 9, crop_year_start), 1, 1), 's'),
-                np.datetime64(dt.datetime(crop_year_end + 1, 1, 1), 's'),
-                bounds=(
-                    np.datetime64(dt.datetime(crop_year_start, 1, 1), 's'),
-                    np.datetime64(dt.datetime(crop_year_end + 1, 1, 1), 's')))
-        else:
-            x_range = Range1d(
+
+def plot_daily_file_mp(tup):
+    """Pool multiprocessing friendly plot_daily_file function"""
+    return plot_daily_file(*tup)
+
+
+def plot_daily_file(file_path, output_ws, station, crop_num,
+                    figure_show_flag=False, figure_save_flag=True,
+                    figure_size=(1000, 300), year_start=None, year_end=None,
+                    overwrite_flag=False, lod_method='minmax'):
+    """Plot the daily timeseries figures of a single daily output file
+
+    Args:
+        file_path (str): daily output file path
+        output_ws (str): output plots folder
+        station (str): ET cell ID
+        crop_num (int): crop number
+        figure_show_flag (bool): if True, show figures
+        figure_save_flag (bool): if True, save figures
+        figure_size (tuple): width, height of figure in pixels
+        year_start (int): first year to plot
+        year_end (int): last year to plot
+        overwrite_flag (bool): If True, overwrite existing files
+        lod_method (str): 'minmax' or 'lttb' to downsample the lines
+            or 'none' to plot the full daily record
+
+    Returns:
+        str of the output file path
+    """
+    # Input field names
+    date_field = 'Date'
+    doy_field = 'DOY'
+    year_field = 'Year'
+    # month_field = 'Month'
+    # day_field = 'Day'
+    pmeto_field = 'PMETo'
+    precip_field = 'PPT'
+    # t30_field = 'T30'
+
+    etact_field = 'ETact'
+    etpot_field = 'ETpot'
+    etbas_field = 'ETbas'
+    irrig_field = 'Irrigation'
+    season_field = 'Season'
+    runoff_field = 'Runoff'
+    dperc_field = 'DPerc'
+    # niwr_field = 'NIWR'
+
+    # Additional figure controls
+    # figure_dynamic_size = False
+    figure_ylabel_size = '12pt'
+
+    # Delimiter
+    sep = ','
+    # sep = r"\s*"
+
+    sub_x_range_flag = True
+
+    file_name = os.path.basename(file_path)
+    logging.debug('')
+    logging.info('  {0}'.format(file_name))
+    logging.debug('    Station:         {0}'.format(station))
+    logging.debug('    Crop Num:        {0}'.format(crop_num))
+
+    # Read data from file into record array (structured array)
+    # Get crop name from the file header/metadata
+    crop_name, daily_df = util.read_crop_output(file_path, sep=sep)
+    logging.debug('    Crop:            {0}'.format(crop_name))
+    logging.debug('    Fields: {0}'.format(
+        ', '.join(daily_df.columns.values)))
+    daily_df[date_field] = pd.to_datetime(daily_df[date_field])
+    daily_df.set_index(date_field, inplace=True)
+    daily_df[year_field] = daily_df.index.year
+    # daily_df[year_field] = daily_df[date_field].map(lambda x: x.year)
+
+    # Build list of unique years
+    year_array = np.sort(np.unique(
+        np.array(daily_df[year_field]).astype(np.int)))
+    logging.debug('    All Years: {0}'.format(
+        ', '.join(list(util.ranges(year_array.tolist())))))
+    # logging.debug('    All Years: {0}'.format(
+    #    ','.join(map(str, year_array.tolist()))))
+
+    # Don't include the first year in the stats
+    crop_year_start = min(daily_df[year_field])
+    logging.debug('    Skipping {}, first year'.format(crop_year_start))
+    daily_df = daily_df[daily_df[year_field] > crop_year_start]
+
+    # Check if start and end years have >= 365 days
+    crop_year_start = min(daily_df[year_field])
+    crop_year_end = max(daily_df[year_field])
+    if sum(daily_df[year_field] == crop_year_start) < 365:
+        logging.debug(
+            '    Skipping {}, missing days'.format(crop_year_start))
+        daily_df = daily_df[daily_df[year_field] > crop_year_start]
+    if sum(daily_df[year_field] == crop_year_end) < 365:
+        logging.debug(
+            '    Skipping {}, missing days'.format(crop_year_end))
+        daily_df = daily_df[daily_df[year_field] < crop_year_end]
+
+    # Only keep years between year_start and year_end
+    # Adjust crop years
+    if year_start:
+        daily_df = daily_df[daily_df[year_field] >= year_start]
+        crop_year_start = max(year_start, crop_year_start)
+    if year_end:
+        daily_df = daily_df[daily_df[year_field] <= year_end]
+        crop_year_end = min(year_end, crop_year_end)
+
+    year_sub_array = np.sort(
+        np.unique(np.array(daily_df[year_field]).astype(np.int)))
+    logging.debug('    Plot Years: {0}'.format(
+        ', '.join(list(util.ranges(year_sub_array.tolist())))))
+    # logging.debug('    Plot Years: {0}'.format(
+    #    ','.join(map(str, year_sub_array.tolist()))))
+
+    # Initial range of timeseries to show
+    # For now default to last ~8 year
+    if sub_x_range_flag:
+        x_range = Range1d(
+            np.datetime64(dt.datetime(
+                max(crop_year_end - 9, crop_year_start), 1, 1), 's'),
+            np.datetime64(dt.datetime(crop_year_end + 1, 1, 1), 's'),
+            bounds=(
                 np.datetime64(dt.datetime(crop_year_start, 1, 1), 's'),
-                np.datetime64(dt.datetime(crop_year_end + 1, 1, 1), 's'))
-
-        # Build separate arrays for each field of non-crop specific data
-        dt_array = daily_df.index.date
-        doy_array = daily_df[doy_field].values.astype(np.int)
-        pmeto_array = daily_df[pmeto_field].values
-        precip_array = daily_df[precip_field].values
-
-        # Remove leap days
-        # leap_array = (doy_array == 366)
-        # doy_sub_array = np.delete(doy_array, np.where(leap_array)[0])
-
-        # Build separate arrays for each set of crop specific fields
-        etact_array = daily_df[etact_field].values
-        etpot_array = daily_df[etpot_field].values
-        etbas_array = daily_df[etbas_field].values
-        irrig_array = daily_df[irrig_field].values
-        season_array = daily_df[season_field].values
-        runoff_array = daily_df[runoff_field].values
-        dperc_array = daily_df[dperc_field].values
-        kc_array = etact_array / pmeto_array
-        kcb_array = etbas_array / pmeto_array
-
-        # NIWR is ET - precip + runoff + deep percolation
-        # Don't include deep percolation when irrigating
-        # niwr_array = etact_array - (precip_array - runoff_array)
-        # niwr_array[irrig_array==0] += dperc_array[irrig_array == 0]
-
-        # Remove leap days
-        # etact_sub_array = np.delete(etact_array, np.where(leap_array)[0])
-        # niwr_sub_array = np.delete(niwr_array, np.where(leap_array)[0])
-
-        # Timeseries figures of daily data
-        output_name = '{0}_crop_{1:02d}_{2}-{3}'.format(
-            station, int(crop_num), crop_year_start, crop_year_end)
-        output_path = os.path.join(output_ws, output_name + '.html')
-        if overwrite_flag and os.path.isfile(output_path):
-            os.remove(output_path)
-        f = output_file(output_path, title=output_name)
-        TOOLS = 'xpan,xwheel_zoom,box_zoom,reset,save'
-
-        f1 = figure(
-            x_axis_type='datetime', x_range=x_range,
-            width=figure_size[0], height=figure_size[1],
-            tools=TOOLS, toolbar_location="right",
-            active_scroll="xwheel_zoom")
-            # title='Evapotranspiration', x_axis_type='datetime',
+                np.datetime64(dt.datetime(crop_year_end + 1, 1, 1), 's')))
+    else:
+        x_range = Range1d(
+            np.datetime64(dt.datetime(crop_year_start, 1, 1), 's'),
+            np.datetime64(dt.datetime(crop_year_end + 1, 1, 1), 's'))
+
+    # Build separate arrays for each field of non-crop specific data
+    dt_array = daily_df.index.date
+    doy_array = daily_df[doy_field].values.astype(np.int)
+    pmeto_array = daily_df[pmeto_field].values
+    precip_array = daily_df[precip_field].values
+
+    # Remove leap days
+    # leap_array = (doy_array == 366)
+    # doy_sub_array = np.delete(doy_array, np.where(leap_array)[0])
+
+    # Build separate arrays for each set of crop specific fields
+    etact_array = daily_df[etact_field].values
+    etpot_array = daily_df[etpot_field].values
+    etbas_array = daily_df[etbas_field].values
+    irrig_array = daily_df[irrig_field].values
+    season_array = daily_df[season_field].values
+    runoff_array = daily_df[runoff_field].values
+    dperc_array = daily_df[dperc_field].values
+    kc_array = etact_array / pmeto_array
+    kcb_array = etbas_array / pmeto_array
+
+    # NIWR is ET - precip + runoff + deep percolation
+    # Don't include deep percolation when irrigating
+    # niwr_array = etact_array - (precip_array - runoff_array)
+    # niwr_array[irrig_array==0] += dperc_array[irrig_array == 0]
+
+    # Remove leap days
+    # etact_sub_array = np.delete(etact_array, np.where(leap_array)[0])
+    # niwr_sub_array = np.delete(niwr_array, np.where(leap_array)[0])
+
+    # Level of detail lines
+    # Each line only has the downsampled values of the visible window and
+    #   the full resolution values are resampled as the x range changes
+    if lod_method != 'none':
+        lod = LevelOfDetail(
+            daily_df.index.values, x_range, figure_size[0], lod_method)
+
+    # Timeseries figures of daily data
+    output_name = '{0}_crop_{1:02d}_{2}-{3}'.format(
+        station, int(crop_num), crop_year_start, crop_year_end)
+    output_path = os.path.join(output_ws, output_name + '.html')
+    if overwrite_flag and os.path.isfile(output_path):
+        os.remove(output_path)
+    f = output_file(output_path, title=output_name)
+    TOOLS = 'xpan,xwheel_zoom,box_zoom,reset,save'
+
+    f1 = figure(
+        x_axis_type='datetime', x_range=x_range,
+        width=figure_size[0], height=figure_size[1],
+        tools=TOOLS, toolbar_location="right",
+        active_scroll="xwheel_zoom")
+        # title='Evapotranspiration', x_axis_type='datetime',
+    if lod_method == 'none':
         f1.line(dt_array, etact_array, color='blue', legend='ETact')
         f1.line(dt_array, etbas_array, color='green', legend='ETbas')
         f1.line(dt_array, pmeto_array, color='black', legend='ETos',
                 line_dash="dotted")
                 # line_dash="dashdot")
-        # f1.title = 'Evapotranspiration [mm]'
-        f1.grid.grid_line_alpha = 0.3
-        f1.yaxis.axis_label = 'Evapotranspiration [mm]'
-        f1.yaxis.axis_label_text_font_size = figure_ylabel_size
-        # f1.xaxis.bounds = x_bounds
-
-        f2 = figure(
-            x_axis_type="datetime", x_range=f1.x_range,
-            width=figure_size[0], height=figure_size[1],
-            tools=TOOLS, toolbar_location="right",
-            active_scroll="xwheel_zoom")
+    else:
+        lod.line(f1, etact_array, color='blue', legend='ETact')
+        lod.line(f1, etbas_array, color='green', legend='ETbas')
+        lod.line(f1, pmeto_array, color='black', legend='ETos',
+                 line_dash="dotted")
+    # f1.title = 'Evapotranspiration [mm]'
+    f1.grid.grid_line_alpha = 0.3
+    f1.yaxis.axis_label = 'Evapotranspiration [mm]'
+    f1.yaxis.axis_label_text_font_size = figure_ylabel_size
+    # f1.xaxis.bounds = x_bounds
+
+    f2 = figure(
+        x_axis_type="datetime", x_range=f1.x_range,
+        width=figure_size[0], height=figure_size[1],
+        tools=TOOLS, toolbar_location="right",
+        active_scroll="xwheel_zoom")
+    if lod_method == 'none':
         f2.line(dt_array, kc_array, color='blue', legend='Kc')
         f2.line(dt_array, kcb_array, color='green', legend='Kcb')
         f2.line(dt_array, season_array, color='black', legend='Season',
                 line_dash="dashed")
-        # f2.title = 'Kc and Kcb (dimensionless)'
-        f2.grid.grid_line_alpha = 0.3
-        f2.yaxis.axis_label = 'Kc and Kcb (dimensionless)'
-        f2.yaxis.axis_label_text_font_size = figure_ylabel_size
-
-        f3 = figure(
-            x_axis_type="datetime", x_range=f1.x_range,
-            width=figure_size[0], height=figure_size[1],
-            tools=TOOLS, toolbar_location="right",
-            active_scroll="xwheel_zoom")
+    else:
+        lod.line(f2, kc_array, color='blue', legend='Kc')
+        lod.line(f2, kcb_array, color='green', legend='Kcb')
+        lod.line(f2, season_array, color='black', legend='Season',
+                 line_dash="dashed")
+    # f2.title = 'Kc and Kcb (dimensionless)'
+    f2.grid.grid_line_alpha = 0.3
+    f2.yaxis.axis_label = 'Kc and Kcb (dimensionless)'
+    f2.yaxis.axis_label_text_font_size = figure_ylabel_size
+
+    f3 = figure(
+        x_axis_type="datetime", x_range=f1.x_range,
+        width=figure_size[0], height=figure_size[1],
+        tools=TOOLS, toolbar_location="right",
+        active_scroll="xwheel_zoom")
+    if lod_method == 'none':
         f3.line(dt_array, precip_array, color='blue', legend='PPT')
         f3.line(dt_array, irrig_array, color='black', legend='Irrigation',
                 line_dash="dotted")
-        # f3.title = 'PPT and Irrigation [mm]'
-        f3.grid.grid_line_alpha = 0.3
-        # f3.xaxis.axis_label = 'Date'
-        f3.yaxis.axis_label = 'PPT and Irrigation [mm]'
-        f3.yaxis.axis_label_text_font_size = figure_ylabel_size
-
-        if figure_show_flag:
-            # Open in a browser
-            show(column([f1, f2, f3], sizing_mode='stretch_both'))
-            # show(vplot(f1, f2, f3))
-        if figure_save_flag:
-            save(column([f1, f2, f3], sizing_mode='stretch_both'))
-            # save(vplot(f1, f2, f3))
-        del f1, f2, f3, f
-
-        # Cleanup
-        del etact_array, etpot_array, etbas_array
-        del irrig_array, season_array
-        del runoff_array, dperc_array
-        del kc_array, kcb_array
-        # del niwr_array
-        # del etact_sub_array, niwr_sub_array
-
-        # Cleanup
-        del file_path, daily_df
-        del dt_array, year_array, year_sub_array, doy_array
-        del pmeto_array
-        del precip_array
-        gc.collect()
+    else:
+        lod.line(f3, precip_array, color='blue', legend='PPT')
+        lod.line(f3, irrig_array, color='black', legend='Irrigation',
+                 line_dash="dotted")
+    # f3.title = 'PPT and Irrigation [mm]'
+    f3.grid.grid_line_alpha = 0.3
+    # f3.xaxis.axis_label = 'Date'
+    f3.yaxis.axis_label = 'PPT and Irrigation [mm]'
+    f3.yaxis.axis_label_text_font_size = figure_ylabel_size
+
+    if lod_method != 'none':
+        lod.link()
+
+    if figure_show_flag:
+        # Open in a browser
+        show(column([f1, f2, f3], sizing_mode='stretch_both'))
+        # show(vplot(f1, f2, f3))
+    if figure_save_flag:
+        save(column([f1, f2, f3], sizing_mode='stretch_both'))
+        # save(vplot(f1, f2, f3))
+    del f1, f2, f3, f
+    if lod_method != 'none':
+        del lod
+
+    # Cleanup
+    del etact_array, etpot_array, etbas_array
+    del irrig_array, season_array
+    del runoff_array, dperc_array
+    del kc_array, kcb_array
+    # del niwr_array
+    # del etact_sub_array, niwr_sub_array
+
+    # Cleanup
+    del daily_df
+    del dt_array, year_array, year_sub_array, doy_array
+    del pmeto_array
+    del precip_array
+    gc.collect()
+    return output_path
+
+
+def minmax_indices(y, n_buckets):
+    """Indices of the minimum and maximum value of each bucket
+
+    The values are split into equal size buckets (one per pixel) and the
+    first and last values are always kept.  Missing values are skipped
+    unless all of the values in the bucket are missing.
+
+    Args:
+        y (array): values
+        n_buckets (int): number of buckets
+
+    Returns:
+        array of the sorted indices
+    """
+    n = len(y)
+    if n <= 2 * n_buckets:
+        return np.arange(n)
+    size = int(np.ceil(float(n) / n_buckets))
+    n_buckets = int(np.ceil(float(n) / size))
+    bucket_array = np.full(n_buckets * size, np.nan)
+    bucket_array[:n] = y
+    bucket_array = bucket_array.reshape(n_buckets, size)
+    nan_mask = np.isnan(bucket_array)
+    offset = np.arange(n_buckets) * size
+    min_i = np.argmin(np.where(nan_mask, np.inf, bucket_array), axis=1)
+    max_i = np.argmax(np.where(nan_mask, -np.inf, bucket_array), axis=1)
+    return np.unique(np.concatenate(
+        [[0, n - 1], min_i + offset, max_i + offset]))
+
+
+def lttb_indices(x, y, n_out):
+    """Indices of the largest-triangle-three-buckets downsampled values
+
+    The first and last values are always kept and one value is selected
+    from each of the n_out - 2 buckets in between.  The selected value has
+    the largest triangle area with the previously selected value and the
+    mean of the next bucket.
+
+    Args:
+        x (array): numeric x values
+        y (array): values
+        n_out (int): number of values to select
+
+    Returns:
+        array of the sorted indices
+    """
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    index_array = np.empty(n_out, dtype=np.int64)
+    index_array[0], index_array[-1] = 0, n - 1
+    a = 0
+    for b in range(n_out - 2):
+        b0, b1 = edges[b], edges[b + 1]
+        # Mean of the next bucket (or the last value)
+        c0 = b1
+        c1 = edges[b + 2] if b + 2 < len(edges) else n
+        next_mask = ~np.isnan(y[c0:c1])
+        if np.any(next_mask):
+            cx = x[c0:c1][next_mask].mean()
+            cy = y[c0:c1][next_mask].mean()
+        else:
+            cx, cy = x[c0], y[a]
+        area = np.abs(
+            (x[a] - cx) * (y[b0:b1] - y[a]) -
+            (x[a] - x[b0:b1]) * (cy - y[a]))
+        area[np.isnan(area)] = -1
+        a = b0 + int(np.argmax(area))
+        index_array[b + 1] = a
+    return index_array
+
+
+# JavaScript callback that resamples the level of detail lines when the
+#   x range changes (see LevelOfDetail)
+lod_callback_code = """
+var start = x_range.start;
+var end = x_range.end;
+var pad = end - start;
+function bisect(x, v) {
+    var lo = 0, hi = x.length;
+    while (lo < hi) {
+        var mid = (lo + hi) >> 1;
+        if (x[mid] < v) { lo = mid + 1; } else { hi = mid; }
+    }
+    return lo;
+}
+function minmax(y, i0, i1, n_buckets) {
+    var index = [i0];
+    var size = Math.ceil((i1 - i0) / n_buckets);
+    for (var b = i0; b < i1; b += size) {
+        var min_i = b, max_i = b;
+        for (var i = b; i < Math.min(b + size, i1); i++) {
+            if (isNaN(y[i])) { continue; }
+            if (isNaN(y[min_i]) || y[i] < y[min_i]) { min_i = i; }
+            if (isNaN(y[max_i]) || y[i] > y[max_i]) { max_i = i; }
+        }
+        index.push(Math.min(min_i, max_i), Math.max(min_i, max_i));
+    }
+    index.push(i1 - 1);
+    return index;
+}
+function lttb(x, y, i0, i1, n_out) {
+    var n = i1 - i0;
+    var index = [i0];
+    var a = i0;
+    var step = (n - 2) / (n_out - 2);
+    for (var b = 0; b < n_out - 2; b++) {
+        var b0 = i0 + 1 + Math.floor(b * step);
+        var b1 = i0 + 1 + Math.floor((b + 1) * step);
+        var c0 = b1;
+        var c1 = (b + 2 < n_out - 1) ?
+            i0 + 1 + Math.floor((b + 2) * step) : i1;
+        var cx = 0, cy = 0, cn = 0;
+        for (var i = c0; i < c1; i++) {
+            if (!isNaN(y[i])) { cx += x[i]; cy += y[i]; cn++; }
+        }
+        if (cn > 0) { cx /= cn; cy /= cn; } else { cx = x[c0]; cy = y[a]; }
+        var max_area = -1, max_i = b0;
+        for (var i = b0; i < b1; i++) {
+            var area = Math.abs(
+                (x[a] - cx) * (y[i] - y[a]) - (x[a] - x[i]) * (cy - y[a]));
+            if (area > max_area) { max_area = area; max_i = i; }
+        }
+        a = max_i;
+        index.push(a);
+    }
+    index.push(i1 - 1);
+    return index;
+}
+var x = full.data['x'];
+var i0 = bisect(x, start - pad);
+var i1 = Math.min(bisect(x, end + pad) + 1, x.length);
+for (var s = 0; s < sources.length; s++) {
+    var y = full.data[fields[s]];
+    var index;
+    if (i1 - i0 <= 6 * n_buckets) {
+        index = [];
+        for (var i = i0; i < i1; i++) { index.push(i); }
+    } else if (method == 'lttb') {
+        index = lttb(x, y, i0, i1, 6 * n_buckets);
+    } else {
+        index = minmax(y, i0, i1, 3 * n_buckets);
+    }
+    var new_x = new Float64Array(index.length);
+    var new_y = new Float64Array(index.length);
+    for (var i = 0; i < index.length; i++) {
+        new_x[i] = x[index[i]];
+        new_y[i] = y[index[i]];
+    }
+    sources[s].data = {'x': new_x, 'y': new_y};
+}
+"""
+
+
+class LevelOfDetail():
+    """Downsampled Bokeh lines with the full resolution data for zooming
+
+    The full resolution values of all of the lines are saved once (as
+    binary arrays) in a single data source.  Each line is drawn from its
+    own small data source with the values of the visible window plus one
+    window on each side (for panning).  When the window has more than a
+    few values per pixel, the values are downsampled (min/max per pixel
+    or largest-triangle-three-buckets), otherwise the full resolution
+    values are drawn.  A JavaScript callback resamples the lines when the
+    x range changes, so no Bokeh server is needed.
+    """
+    def __init__(self, date_array, x_range, width, method='minmax'):
+        """
+
+        Args:
+            date_array (array): datetime64 x values
+            x_range (Range1d): shared x range of the figures
+            width (int): figure width in pixels (one bucket per pixel)
+            method (str): 'minmax' or 'lttb'
+        """
+        self.x_range = x_range
+        self.n_buckets = int(width)
+        self.method = method
+        # Bokeh datetime values are milliseconds since the epoch
+        self.x = date_array.astype('datetime64[ms]').astype(np.float64)
+        self.full = ColumnDataSource(data={'x': self.x})
+        self.sources = []
+        self.fields = []
+
+        # Initial window
+        start, end = [
+            np.datetime64(v).astype('datetime64[ms]').astype(np.float64)
+            for v in [x_range.start, x_range.end]]
+        pad = end - start
+        self.i0 = int(np.searchsorted(self.x, start - pad))
+        self.i1 = min(
+            int(np.searchsorted(self.x, end + pad)) + 1, len(self.x))
+
+    def line(self, fig, y_array, **kwargs):
+        """Add a downsampled line to the figure
+
+        Args:
+            fig (figure): Bokeh figure
+            y_array (array): full resolution values
+            kwargs: Bokeh line keyword arguments
+        """
+        field = 'y{}'.format(len(self.fields))
+        y_array = np.asarray(y_array, dtype=np.float32)
+        self.full.data[field] = y_array
+
+        x_sub = self.x[self.i0:self.i1]
+        y_sub = y_array[self.i0:self.i1].astype(np.float64)
+        if len(x_sub) <= 6 * self.n_buckets:
+            index_array = np.arange(len(x_sub))
+        elif self.method == 'lttb':
+            index_array = lttb_indices(x_sub, y_sub, 6 * self.n_buckets)
+        else:
+            index_array = minmax_indices(y_sub, 3 * self.n_buckets)
+        source = ColumnDataSource(data={
+            'x': x_sub[index_array], 'y': y_sub[index_array]})
+        fig.line('x', 'y', source=source, **kwargs)
+        self.sources.append(source)
+        self.fields.append(field)
+
+    def link(self):
+        """Resample the lines whenever the x range changes"""
+        callback = CustomJS(
+            args=dict(
+                x_range=self.x_range, full=self.full, sources=self.sources,
+                fields=self.fields, n_buckets=self.n_buckets,
+                method=self.method),
+            code=lod_callback_code)
+        self.x_range.js_on_change('start', callback)
+        self.x_range.js_on_change('end', callback)
 
 
 def parse_args():
@@ -394,6 +711,14 @@ def parse_args():
     parser.add_argument(
         '-o', '--overwrite', default=None, action="store_true",
         help='Force overwrite of existing files')
+    parser.add_argument(
+        '--lod', default='minmax', choices=['minmax', 'lttb', 'none'],
+        help='Downsampling method of the timeseries lines ' +
+             '(none plots the full daily record)')
+    parser.add_argument(
+        '-mp', '--multiprocessing', default=1, type=int,
+        metavar='N', nargs='?', const=mp.cpu_count(),
+        help='Number of processers to use')
     parser.add_argument(
         '--debug', default=logging.INFO, const=logging.DEBUG,
         help='Debug level logging', action="store_const", dest="loglevel")
@@ -435,4 +760,5 @@ if __name__ == '__main__':
     main(ini_path, figure_show_flag=args.show,
          figure_save_flag=args.no_save, figure_size=args.size,
          start_date=args.start, end_date=args.end, crop_str=args.crops,
-         overwrite_flag=args.overwrite)
+         overwrite_flag=args.overwrite, lod_method=args.lod,
+         mp_procs=args.multiprocessing)
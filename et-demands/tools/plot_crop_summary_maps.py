@@ -11,6 +11,7 @@ from collections import defaultdict
 import datetime as dt
 import gc
 import logging
+import multiprocessing as mp
 import os
 import re
 import sys
@@ -21,7 +22,7 @@ import matplotlib
 import matplotlib.pyplot as plt
 import matplotlib.cm as cm
 import matplotlib.colors as colors
-# from matplotlib.collections import PatchCollection
+from matplotlib.collections import PatchCollection
 import numpy as np
 import pandas as pd
 from shapely.geometry import MultiPolygon, Polygon, shape
@@ -45,7 +46,8 @@ matplotlib.rc('font', family='sans-serif')
 
 def main(ini_path, show_flag=False, save_flag=True, label_flag=False,
          figure_size=(12, 12), figure_dpi=300, start_date=None, end_date=None,
-         crop_str='', simplify_tol=None, area_threshold=0):
+         crop_str='', simplify_tol=None, area_threshold=0, mp_procs=1,
+         summary_flag=False):
     """Plot crop summary maps using daily output files
 
     Args:
@@ -59,6 +61,9 @@ def main(ini_path, show_flag=False, save_flag=True, label_flag=False,
         crop_str (str): comma separate list or range of crops to compare
         simplify_tol (float): simplify tolerance [in the units of ET Cells]
         area_threshold (float): CDL area threshold [acres]
+        mp_procs (int): number of cores to use for reading the daily files
+            and rendering the maps
+        summary_flag (bool): if True, only build the crop summary table
 
     Returns:
         None
@@ -68,33 +73,13 @@ def main(ini_path, show_flag=False, save_flag=True, label_flag=False,
     cell_id_field = 'CELL_ID'
     crop_area_field = 'AG_ACRES'
 
-    # Input field names
-    date_field = 'Date'
-    doy_field = 'DOY'
-    year_field = 'Year'
-    # month_field = 'Month'
-    # day_field = 'Day'
-    # pmeto_field = 'PMETo'
-    # precip_field = 'PPT'
-    # t30_field = 'T30'
-    etact_field = 'ETact'
-    # etpot_field = 'ETpot'
-    # etbas_field = 'ETbas'
-    # irrig_field = 'Irrigation'
-    season_field = 'Season'
-    cutting_field = 'Cutting'
-    # runoff_field = 'Runoff'
-    # dperc_field = 'DPerc'
-    # niwr_field = 'NIWR'
-    # kc_field = 'Kc'
-    # kcb_field = 'Kcb'
-
     # Output field names
     annual_et_field = 'Annual_ET'
     seasonal_et_field = 'Seasonal_ET'
     gs_start_doy_field = 'Start_DOY'
     gs_end_doy_field = 'End_DOY'
     gs_length_field = 'GS_Length'
+    cutting_field = 'Cutting'
 
     # Number of header lines in data file
     # header_lines = 2
@@ -108,7 +93,8 @@ def main(ini_path, show_flag=False, save_flag=True, label_flag=False,
     # sep = r"\s*"
 
     daily_input_re = re.compile(
-        '(?P<cell_id>\w+)_daily_crop_(?P<crop_num>\d{2}).csv', re.I)
+        '(?P<cell_id>\w+)_daily_crop_(?P<crop_num>\d{2})' +
+        '.(csv|csv.gz|csv.zst|parquet|h5)$', re.I)
     # gs_input_re = re.compile(
     #     '(?P<cell_id>\w+)_gs_crop_(?P<crop_num>\d{2}).csv', re.I)
 
@@ -239,48 +225,40 @@ def main(ini_path, show_flag=False, save_flag=True, label_flag=False,
         sys.exit()
 
     # Read ET Cells into memory with fiona and shapely
-    # Convert multi-polygons to list of polygons
-    cell_geom_dict = defaultdict(list)
-    cell_data_dict = dict()
-    cell_extent = []
-    with fiona.open(cells_path, "r") as cell_f:
-        cell_extent = cell_f.bounds[:]
-        # Fiona is printing a debug statement here "Index: N"
-        for item in cell_f:
-            cell_id = item['properties'][cell_id_field]
-            cell_data_dict[cell_id] = item['properties']
-
-            # Simplify the geometry
-            if simplify_tol is not None:
-                item_geom = shape(item['geometry']).simplify(
-                    simplify_tol, preserve_topology=False)
-            else:
-                item_geom = shape(item['geometry'])
-
-            # Unpack multipolygons to lists of polygons
-            if item_geom.is_empty:
-                continue
-            elif item_geom.geom_type == 'MultiPolygon':
-                # Order the geometries from largest to smallest area
-                item_geom_list = sorted(
-                    [[g.area, g] for g in item_geom if not g.is_empty],
-                    reverse=True)
-                for item_area, item_poly in item_geom_list:
-                    cell_geom_dict[cell_id].append(item_poly)
-            elif item_geom.geom_type == 'Polygon':
-                cell_geom_dict[cell_id].append(item_geom)
-            else:
-                logging.error('Invalid geometry type')
-                continue
+    # The simplified polygons are cached for each shapefile and tolerance
+    cell_geom_dict, cell_data_dict, cell_extent = util.read_cell_geometry(
+        cells_path, cell_id_field, simplify_tol=simplify_tol,
+        cache_ws=os.path.join(output_ws, 'cache'))
     if not cell_geom_dict:
         logging.error('ET Cell shapefile not read in')
         sys.exit()
 
+    # Summarize the daily files of the cells with a crop area above the
+    #   threshold, the summaries are cached in the crop summary table
+    logging.info('\nReading daily files')
+    daily_path_list = [
+        [cell_id, crop_num, input_path]
+        for crop_num, crop_path_dict in sorted(daily_path_dict.items())
+        for cell_id, input_path in sorted(crop_path_dict.items())
+        if (cell_id in cell_data_dict.keys() and
+            cell_data_dict[cell_id]['CROP_{0:02d}'.format(crop_num)] >
+            area_threshold)]
+    summary_df = crop_summary_table(
+        os.path.join(output_ws, 'crop_summary.csv'), daily_path_list,
+        year_start=year_start, year_end=year_end, sep=sep,
+        mp_procs=mp_procs)
+    if summary_flag:
+        return True
+
+    # The maps are all drawn after the values are computed
+    # Maps can't be shown from the rendering processes
+    if show_flag and mp_procs > 1:
+        logging.warning('  Show flag is set, disabling multiprocessing')
+        mp_procs = 1
+    map_list = []
+
     # Plot keyword arguments
     plot_kwargs = {
-        'extent': cell_extent,
-        'fig_size': figure_size,
-        'fig_dpi': figure_dpi,
         'save_flag': save_flag,
         'show_flag': show_flag,
         'label_flag': label_flag,
@@ -291,11 +269,11 @@ def main(ini_path, show_flag=False, save_flag=True, label_flag=False,
     cell_id_dict = {
         k: k.replace(' ', '\n') for k in cell_data_dict.iterkeys()}
     # cell_id_dict = {k:k for k in cell_data_dict.iterkeys()}
-    cell_plot_func(
+    map_list.append(map_args(
         os.path.join(output_ws, 'cell_id.png'),
-        cell_geom_dict, cell_id_dict, cmap=None,
+        cell_id_dict, cmap=None,
         title_str='CELL_ID', clabel_str='',
-        label_size=6, **plot_kwargs)
+        label_size=6, **plot_kwargs))
 
     # Plot total CDL crop acreages
     logging.info('\nPlotting total crop acreage')
@@ -304,21 +282,21 @@ def main(ini_path, show_flag=False, save_flag=True, label_flag=False,
     # crop_area_dict = {
     #     :v[crop_area_field] for k,v in cell_data_dict.iteritems()
     #      v[crop_area_field] > area_threshold}
-    cell_plot_func(
+    map_list.append(map_args(
         os.path.join(output_ws, 'total_crop_acreage.png'),
-        cell_geom_dict, crop_area_dict, cmap=cm.YlGn,
+        crop_area_dict, cmap=cm.YlGn,
         title_str='Total CDL Crop Area', clabel_str='acres',
-        label_size=6, **plot_kwargs)
+        label_size=6, **plot_kwargs))
 
     # Plot PMETo
     # pmeto_dict = {
     #     :v[crop_area_field]
     #      k,v in cell_data_dict.iteritems()}
-    # cell_plot_func(
+    # map_list.append(map_args(
     #     .path.join(output_ws, 'eto.png'),
     #     , pmeto_dict, cmap=cm.YlGn,
     #     ='Reference ET', clabel_str='mm',
-    #     =8, **plot_kwargs)
+    #     =8, **plot_kwargs))
 
     # Build an empty dataframe to write the total area weighted ET
     # columns_dict = {cell_id_field:sorted(cell_data_dict.keys())}
@@ -345,157 +323,15 @@ def main(ini_path, show_flag=False, save_flag=True, label_flag=False,
         #     k: v[crop_column] for k,v in cell_data_dict.iteritems()
         #     if k in daily_path_dict[crop_num].keys()}
 
-        # Build an empty dataframe to write to
-        crop_output_df = pd.DataFrame({
-            cell_id_field: sorted(list(
-                set(daily_path_dict[crop_num].keys()) &
-                set(crop_area_dict.keys()))),
-            annual_et_field: None,
-            seasonal_et_field: None,
-            gs_start_doy_field: None,
-            gs_end_doy_field: None,
-            gs_length_field: None,
-            cutting_field: None})
-        crop_output_df.set_index(cell_id_field, inplace=True)
-
-        # Process each cell
-        for cell_id, input_path in sorted(daily_path_dict[crop_num].items()):
-            logging.debug('  Cell ID:   {0}'.format(cell_id))
-
-            # Skip if crop area is below threshold
-            if cell_id not in crop_area_dict.keys():
-                logging.debug('    Area below threshold, skipping')
-                continue
-
-            # Get crop name from the first line of the output file
-            # DEADBEEF - This may not exist in the output file...
-            with open(input_path, 'r') as file_f:
-                crop_name = file_f.readline().split('-', 1)[1].strip()
-                crop_name = crop_name.replace('--', ' - ')
-                crop_name = crop_name.replace(' (', ' - ').replace(')', '')
-                logging.debug('  Crop:      {0}'.format(crop_name))
-            logging.debug('    {0}'.format(os.path.basename(input_path)))
-
-            # Read data from file into record array (structured array)
-            daily_df = pd.read_table(
-                input_path, header=0, comment='#', sep=sep)
-            logging.debug(
-                '    Fields: {0}'.format(', '.join(daily_df.columns.values)))
-            daily_df[date_field] = pd.to_datetime(daily_df[date_field])
-            daily_df.set_index(date_field, inplace=True)
-
-            # Build list of unique years
-            year_array = np.sort(
-                np.unique(np.array(daily_df[year_field]).astype(np.int)))
-            logging.debug('    All Years: {0}'.format(
-                ', '.join(list(util.ranges(year_array.tolist())))))
-            # logging.debug('    All Years: {0}'.format(
-            #    ','.join(map(str, year_array.tolist()))))
-
-            # Don't include the first year in the stats
-            crop_year_start = min(daily_df[year_field])
-            logging.debug(
-                '    Skipping {}, first year'.format(crop_year_start))
-            daily_df = daily_df[daily_df[year_field] > crop_year_start]
-
-            # Check if start and end years have >= 365 days
-            crop_year_start = min(daily_df[year_field])
-            crop_year_end = max(daily_df[year_field])
-            if sum(daily_df[year_field] == crop_year_start) < 365:
-                logging.debug(
-                    '    Skipping {}, missing days'.format(crop_year_start))
-                daily_df = daily_df[daily_df[year_field] > crop_year_start]
-            if sum(daily_df[year_field] == crop_year_end) < 365:
-                logging.debug(
-                    '    Skipping {}, missing days'.format(crop_year_end))
-                daily_df = daily_df[daily_df[year_field] < crop_year_end]
-            del crop_year_start, crop_year_end
-
-            # Only keep years between year_start and year_end
-            if year_start:
-                daily_df = daily_df[daily_df[year_field] >= year_start]
-            if year_end:
-                daily_df = daily_df[daily_df[year_field] <= year_end]
-
-            year_sub_array = np.sort(
-                np.unique(np.array(daily_df[year_field]).astype(np.int)))
-            logging.debug('    Plot Years: {0}'.format(
-                ', '.join(list(util.ranges(year_sub_array.tolist())))))
-            # logging.debug('    Plot Years: {0}'.format(
-            #    ','.join(map(str, year_sub_array.tolist()))))
-
-            # Seasonal/Annual ET
-            crop_seasonal_et_df = daily_df[daily_df[season_field] > 0].resample(
-                'AS', how={etact_field: np.sum})
-            crop_annual_et_df = daily_df.resample(
-                'AS', how={etact_field: np.sum})
-
-            crop_output_df.set_value(
-                cell_id, seasonal_et_field, float(crop_seasonal_et_df.mean()))
-            crop_output_df.set_value(
-                cell_id, annual_et_field, float(crop_annual_et_df.mean()))
-            del crop_seasonal_et_df, crop_annual_et_df
-
-            # Compute growing season start and end DOY from dailies
-            crop_gs_df = daily_df[[year_field, season_field]].resample(
-                'AS', how={year_field: np.mean})
-            crop_gs_df[gs_start_doy_field] = None
-            crop_gs_df[gs_end_doy_field] = None
-
-            crop_gs_fields = [year_field, doy_field, season_field]
-            crop_gs_groupby = daily_df[crop_gs_fields].groupby([year_field])
-            for year, group in crop_gs_groupby:
-                if not np.any(group[season_field].values):
-                    logging.debug('  Skipping, season flag was never set to 1')
-                    continue
-
-                # Identify "changes" in season flag
-                season_diff = np.diff(group[season_field].values)
-
-                # Growing season start
-                try:
-                    start_i = np.where(season_diff == 1)[0][0] + 1
-                    gs_start_doy = float(group.ix[start_i, doy_field])
-                except:
-                    gs_start_doy = float(min(group[doy_field].values))
-                crop_gs_df.set_value(
-                    group.index[0], gs_start_doy_field, gs_start_doy)
-
-                # Growing season end
-                try:
-                    end_i = np.where(season_diff == -1)[0][0] + 1
-                    gs_end_doy = float(group.ix[end_i, doy_field])
-                except:
-                    gs_end_doy = float(max(group[doy_field].values))
-                crop_gs_df.set_value(
-                    group.index[0], gs_end_doy_field, gs_end_doy)
-                del season_diff
-
-            # Write mean growing season start and end DOY
-            crop_output_df.set_value(
-                cell_id, gs_start_doy_field,
-                int(round(crop_gs_df[gs_start_doy_field].mean(), 0)))
-            crop_output_df.set_value(
-                cell_id, gs_end_doy_field,
-                int(round(crop_gs_df[gs_end_doy_field].mean(), 0)))
-
-            # Growing season length
-            crop_output_df.set_value(
-                cell_id, gs_length_field,
-                int(round(crop_gs_groupby[season_field].sum().mean(), 0)))
-
-            # Crop cuttings
-            # Maybe only sum cuttings that are in season
-            if (cutting_field in list(daily_df.columns.values) and
-                np.any(daily_df[cutting_field].values)):
-                gs_input_fields = [year_field, cutting_field]
-                crop_gs_groupby = daily_df[gs_input_fields].groupby([year_field])
-                crop_output_df.set_value(
-                    cell_id, cutting_field,
-                    int(round(crop_gs_groupby[cutting_field].sum().mean(), 0)))
-
-            # Cleanup
-            del crop_gs_groupby, crop_gs_df, crop_gs_fields
+        # Mean annual values of each cell from the crop summary table
+        crop_output_df = summary_df[
+            summary_df.index.get_level_values('CROP_NUM') == crop_num]
+        crop_output_df = crop_output_df.reset_index('CROP_NUM', drop=True)
+        crop_output_df.index.name = cell_id_field
+        if len(crop_output_df.index):
+            crop_name = crop_output_df['CROP_NAME'].values[-1]
+        else:
+            crop_name = ''
 
         # Make the maps
         logging.debug('')
@@ -503,86 +339,65 @@ def main(ini_path, show_flag=False, save_flag=True, label_flag=False,
             crop_num, crop_name, '{}')
 
         # Crop acreages
-        cell_plot_func(
+        map_list.append(map_args(
             os.path.join(
                 output_ws, 'crop_{0:02d}_cdl_acreage.png'.format(crop_num)),
-            cell_geom_dict, crop_area_dict, cmap=cm.YlGn, clabel_str='acres',
-            title_str=title_fmt.format('CDL Area'), **plot_kwargs)
+            crop_area_dict, cmap=cm.YlGn, clabel_str='acres',
+            title_str=title_fmt.format('CDL Area'), **plot_kwargs))
 
         # Annual/Seasonal ET
-        cell_plot_func(
+        map_list.append(map_args(
             os.path.join(
                 output_ws, 'crop_{0:02d}_et_actual.png'.format(crop_num)),
-            cell_geom_dict, crop_output_df[annual_et_field].to_dict(),
+            crop_output_df[annual_et_field].to_dict(),
             cmap=cm.YlGn, clabel_str='mm',
             title_str=title_fmt.format('Annual Evapotranspiration'),
-            **plot_kwargs)
-        cell_plot_func(
+            **plot_kwargs))
+        map_list.append(map_args(
             os.path.join(
                 output_ws, 'crop_{0:02d}_et_seasonal.png'.format(crop_num)),
-            cell_geom_dict, crop_output_df[seasonal_et_field].to_dict(),
+            crop_output_df[seasonal_et_field].to_dict(),
             cmap=cm.YlGn, clabel_str='mm',
             title_str=title_fmt.format('Seasonal Evapotranspiration'),
-            **plot_kwargs)
+            **plot_kwargs))
 
         # Growing Season Start/End/Length
-        cell_plot_func(
+        map_list.append(map_args(
             os.path.join(
                 output_ws, 'crop_{0:02d}_gs_start_doy.png'.format(crop_num)),
-            cell_geom_dict, crop_output_df[gs_start_doy_field].to_dict(),
+            crop_output_df[gs_start_doy_field].to_dict(),
             cmap=cm.RdYlBu, clabel_str='Day of Year',
             title_str=title_fmt.format('Growing Season Start'),
-            **plot_kwargs)
-        cell_plot_func(
+            **plot_kwargs))
+        map_list.append(map_args(
             os.path.join(
                 output_ws, 'crop_{0:02d}_gs_end_doy.png'.format(crop_num)),
-            cell_geom_dict, crop_output_df[gs_end_doy_field].to_dict(),
+            crop_output_df[gs_end_doy_field].to_dict(),
             cmap=cm.RdYlBu_r, clabel_str='Day of Year',
             title_str=title_fmt.format('Growing Season End'),
-            **plot_kwargs)
-        cell_plot_func(
+            **plot_kwargs))
+        map_list.append(map_args(
             os.path.join(
                 output_ws, 'crop_{0:02d}_gs_length.png'.format(crop_num)),
-            cell_geom_dict, crop_output_df[gs_length_field].to_dict(),
+            crop_output_df[gs_length_field].to_dict(),
             cmap=cm.RdYlBu_r, clabel_str='Days',
             title_str=title_fmt.format('Growing Season Length'),
-            **plot_kwargs)
+            **plot_kwargs))
 
         # Crop cuttings
-        if np.any(crop_output_df[cutting_field].values):
-            cell_plot_func(
+        if crop_output_df[cutting_field].notnull().any():
+            map_list.append(map_args(
                 os.path.join(
                     output_ws, 'crop_{0:02d}_cuttings.png'.format(crop_num)),
-                cell_geom_dict, crop_output_df[cutting_field].to_dict(),
+                crop_output_df[cutting_field].dropna().to_dict(),
                 cmap=cm.RdYlBu_r, clabel_str='Cuttings',
-                title_str=title_fmt.format('Crop Cuttings'), **plot_kwargs)
+                title_str=title_fmt.format('Crop Cuttings'), **plot_kwargs))
 
         # Crop area weighted ET
         crop_area_df[crop_column] = pd.Series(crop_area_dict)
         annual_et_df[crop_column] = crop_output_df[annual_et_field]
         seasonal_et_df[crop_column] = crop_output_df[seasonal_et_field]
 
-        # Compute and plot crop weighted average ET
-        annual_et = (
-            (annual_et_df * crop_area_df).sum(axis=1) /
-            crop_area_df.sum(axis=1))
-        seasonal_et = (
-            (seasonal_et_df * crop_area_df).sum(axis=1) /
-            crop_area_df.sum(axis=1))
-        cell_plot_func(
-            os.path.join(output_ws, 'et_actual.png'),
-            cell_geom_dict, annual_et[annual_et.notnull()].to_dict(),
-            cmap=cm.YlGn, clabel_str='mm',
-            title_str='Crop Area Weighted Annual Evapotranspiration',
-            **plot_kwargs)
-        cell_plot_func(
-            os.path.join(output_ws, 'et_seasonal.png'),
-            cell_geom_dict, seasonal_et[seasonal_et.notnull()].to_dict(),
-            cmap=cm.YlGn, clabel_str='mm',
-            title_str='Crop Area Weighted Seasonal Evapotranspiration',
-            **plot_kwargs)
-        del annual_et, seasonal_et
-
         # Cleanup
         del crop_output_df
         gc.collect()
@@ -594,20 +409,458 @@ def main(ini_path, show_flag=False, save_flag=True, label_flag=False,
     seasonal_et_df = seasonal_et_df.sum(axis=1) / crop_area_df.sum(axis=1)
     annual_et_df = annual_et_df[annual_et_df.notnull()]
     seasonal_et_df = seasonal_et_df[seasonal_et_df.notnull()]
-    cell_plot_func(
+    map_list.append(map_args(
         os.path.join(output_ws, 'et_actual.png'),
-        cell_geom_dict, annual_et_df.to_dict(), cmap=cm.YlGn, clabel_str='mm',
+        annual_et_df.to_dict(), cmap=cm.YlGn, clabel_str='mm',
         title_str='Crop Area Weighted Annual Evapotranspiration',
-        **plot_kwargs)
-    cell_plot_func(
+        **plot_kwargs))
+    map_list.append(map_args(
         os.path.join(output_ws, 'et_seasonal.png'),
-        cell_geom_dict, seasonal_et_df.to_dict(),
+        seasonal_et_df.to_dict(),
         cmap=cm.YlGn, clabel_str='mm',
         title_str='Crop Area Weighted Seasonal Evapotranspiration',
-        **plot_kwargs)
+        **plot_kwargs))
+
+    # Draw all of the maps
+    logging.info('\nDrawing maps')
+    render_maps(
+        map_list, cell_geom_dict, cell_extent, fig_size=figure_size,
+        fig_dpi=figure_dpi, mp_procs=mp_procs)
 
     # Cleanup
-    del crop_area_df, annual_et_df, seasonal_et_df
+    del crop_area_df, annual_et_df, seasonal_et_df, map_list, summary_df
+
+
+def crop_summary_table(summary_path, daily_path_list, year_start=None,
+                       year_end=None, sep=',', mp_procs=1):
+    """Build or update the crop summary table of the daily files
+
+    Each row of the table is the summary of a single daily file.  The rows
+    are keyed by the file name, size and modified time and by the year
+    range, so only new or modified daily files are read again.
+
+    Args:
+        summary_path (str): summary table (CSV) file path
+        daily_path_list (list): cell ID, crop number, daily file path tuples
+        year_start (int): first year to include
+        year_end (int): last year to include
+        sep (str): CSV file delimiter
+        mp_procs (int): number of cores to use for multiprocessing
+
+    Returns:
+        DataFrame indexed by the cell ID and crop number
+    """
+    index_fields = ['CELL_ID', 'CROP_NUM']
+    year_range = [year_start or 0, year_end or 0]
+
+    # Read the existing summary table
+    cache_dict = dict()
+    if os.path.isfile(summary_path):
+        try:
+            cache_df = pd.read_csv(
+                summary_path, sep=',', float_precision='round_trip',
+                dtype={'CELL_ID': str, 'FILE_NAME': str, 'CROP_NAME': str})
+            for row in cache_df.to_dict('records'):
+                cache_dict[row['FILE_NAME']] = row
+            del cache_df
+        except Exception:
+            logging.warning('  The crop summary table could not be read')
+
+    summary_rows = []
+    file_args_list = []
+    for cell_id, crop_num, input_path in daily_path_list:
+        input_stat = os.stat(input_path)
+        file_key = {
+            'CELL_ID': cell_id, 'CROP_NUM': crop_num,
+            'FILE_NAME': os.path.basename(input_path),
+            'FILE_SIZE': int(input_stat.st_size),
+            'FILE_MTIME': int(round(input_stat.st_mtime * 1000)),
+            'YEAR_START': year_range[0], 'YEAR_END': year_range[1]}
+        cache_row = cache_dict.pop(file_key['FILE_NAME'], None)
+        if (cache_row is not None and
+                all(cache_row[k] == v for k, v in file_key.items())):
+            summary_rows.append(cache_row)
+        else:
+            file_args_list.append([input_path, file_key, sep])
+    logging.info('  Daily files: {} cached, {} to read'.format(
+        len(summary_rows), len(file_args_list)))
+
+    # Read the new or modified daily files
+    if mp_procs > 1 and len(file_args_list) > 1:
+        pool = mp.Pool(min(mp_procs, len(file_args_list)))
+        results = pool.imap_unordered(
+            cell_crop_summary_mp, file_args_list,
+            chunksize=max(1, len(file_args_list) // (4 * mp_procs)))
+        pool.close()
+    else:
+        results = (cell_crop_summary_mp(args) for args in file_args_list)
+    summary_rows.extend(results)
+
+    # The rows of the files that weren't requested are kept in the table
+    summary_columns = index_fields + [
+        'CROP_NAME', 'Annual_ET', 'Seasonal_ET', 'Start_DOY', 'End_DOY',
+        'GS_Length', 'Cutting', 'FILE_NAME', 'FILE_SIZE', 'FILE_MTIME',
+        'YEAR_START', 'YEAR_END']
+    if file_args_list:
+        table_df = pd.DataFrame(
+            summary_rows + cache_dict.values(), columns=summary_columns)
+        table_df.sort_values(index_fields + ['FILE_NAME'], inplace=True)
+        # The floats are written with repr() so the cached values are exact
+        table_df.to_csv(
+            summary_path, sep=',', float_format='%r', index=False)
+        del table_df
+    summary_df = pd.DataFrame(summary_rows, columns=summary_columns)
+    return summary_df.set_index(index_fields).sort_index()
+
+
+def cell_crop_summary_mp(tup):
+    """Pool multiprocessing friendly cell_crop_summary function"""
+    input_path, file_key, sep = tup
+    summary_row = dict(file_key)
+    summary_row.update(cell_crop_summary(
+        input_path, file_key['YEAR_START'], file_key['YEAR_END'], sep))
+    return summary_row
+
+
+def cell_crop_summary(input_path, year_start=None, year_end=None, sep=','):
+    """Compute the annual/seasonal ET and growing season of a daily file
+
+    Args:
+        input_path (str): daily output file path
+        year_start (int): first year to include
+        year_end (int): last year to include
+        sep (str): CSV file delimiter
+
+    Returns:
+        dict of the crop name and the mean annual values
+    """
+    # Input field names
+    date_field = 'Date'
+    doy_field = 'DOY'
+    year_field = 'Year'
+    etact_field = 'ETact'
+    season_field = 'Season'
+    cutting_field = 'Cutting'
+
+    logging.info('  {0}'.format(os.path.basename(input_path)))
+
+    # Get crop name from the first line of the output file
+    crop_name, daily_df = util.read_crop_output(input_path, sep=sep)
+    crop_name = crop_name.replace('--', ' - ')
+    crop_name = crop_name.replace(' (', ' - ').replace(')', '')
+    logging.debug('  Crop:      {0}'.format(crop_name))
+    logging.debug(
+        '    Fields: {0}'.format(', '.join(daily_df.columns.values)))
+    date_array = pd.to_datetime(daily_df[date_field]).values
+    year_array = daily_df[year_field].values.astype(np.int)
+    doy_array = daily_df[doy_field].values.astype(np.int)
+    etact_array = daily_df[etact_field].values
+    season_array = daily_df[season_field].values
+    if cutting_field in list(daily_df.columns.values):
+        cutting_array = daily_df[cutting_field].values
+    else:
+        cutting_array = None
+    del daily_df
+    logging.debug('    All Years: {0}'.format(
+        ', '.join(list(util.ranges(np.unique(year_array).tolist())))))
+
+    # Don't include the first year in the stats
+    year_mask = year_array > year_array.min()
+    logging.debug('    Skipping {}, first year'.format(year_array.min()))
+
+    # Check if start and end years have >= 365 days
+    if np.any(year_mask):
+        crop_year_start = year_array[year_mask].min()
+        crop_year_end = year_array[year_mask].max()
+        if np.sum(year_mask & (year_array == crop_year_start)) < 365:
+            logging.debug('    Skipping {}, missing days'.format(
+                crop_year_start))
+            year_mask &= year_array > crop_year_start
+        if np.sum(year_mask & (year_array == crop_year_end)) < 365:
+            logging.debug('    Skipping {}, missing days'.format(
+                crop_year_end))
+            year_mask &= year_array < crop_year_end
+
+    # Only keep years between year_start and year_end
+    if year_start:
+        year_mask &= year_array >= year_start
+    if year_end:
+        year_mask &= year_array <= year_end
+    date_array = date_array[year_mask]
+    year_array = year_array[year_mask]
+    doy_array = doy_array[year_mask]
+    etact_array = etact_array[year_mask]
+    season_array = season_array[year_mask]
+    if cutting_array is not None:
+        cutting_array = cutting_array[year_mask]
+    logging.debug('    Plot Years: {0}'.format(
+        ', '.join(list(util.ranges(np.unique(year_array).tolist())))))
+
+    # Seasonal/Annual ET
+    # Sum the daily values for each year using the year start indices
+    year_start_i = util.period_starts(date_array, 'year')[0]
+    season_mask = season_array > 0
+    crop_annual_et = util.period_sum(etact_array, year_start_i)
+    crop_seasonal_et = util.period_sum(
+        np.where(season_mask, etact_array, 0), year_start_i)
+    # Only average the years with a season (years without any season days
+    #   are skipped, not counted as zero)
+    gs_length = util.period_sum(season_mask.astype(np.int64), year_start_i)
+    season_years = np.flatnonzero(gs_length)
+    if season_years.size:
+        crop_seasonal_et = crop_seasonal_et[season_years]
+    else:
+        crop_seasonal_et = np.array([np.nan])
+
+    # Growing season start and end DOY of the years with a season
+    # The start/end is the first change in the season flag in the year
+    #   or the first/last DOY if the flag never changes
+    year_end_i = np.append(year_start_i[1:], len(year_array))
+    gs_start_doy, gs_end_doy = [], []
+    for year_i in season_years:
+        year_slice = slice(year_start_i[year_i], year_end_i[year_i])
+        season_diff = np.diff(season_array[year_slice])
+        year_doy = doy_array[year_slice]
+        start_i = np.flatnonzero(season_diff == 1)
+        end_i = np.flatnonzero(season_diff == -1)
+        gs_start_doy.append(
+            year_doy[start_i[0] + 1] if start_i.size else year_doy.min())
+        gs_end_doy.append(
+            year_doy[end_i[0] + 1] if end_i.size else year_doy.max())
+
+    def mean_int(values):
+        """Mean rounded to a whole day (NaN if there are no values)"""
+        if len(values) == 0:
+            return np.nan
+        return int(round(np.mean(values), 0))
+
+    # Crop cuttings
+    # Maybe only sum cuttings that are in season
+    if cutting_array is not None and np.any(cutting_array):
+        cuttings = mean_int(util.period_sum(
+            cutting_array.astype(np.int64), year_start_i))
+    else:
+        cuttings = np.nan
+
+    return {
+        'CROP_NAME': crop_name,
+        'Annual_ET': float(crop_annual_et.mean()),
+        'Seasonal_ET': float(crop_seasonal_et.mean()),
+        'Start_DOY': mean_int(gs_start_doy),
+        'End_DOY': mean_int(gs_end_doy),
+        'GS_Length': mean_int(gs_length),
+        'Cutting': cuttings}
+
+
+def map_args(output_path, data_dict, title_str, clabel_str, cmap=None,
+             v_min=None, v_max=None, label_flag=False, save_flag=True,
+             show_flag=False, label_size=8):
+    """Build the arguments for drawing a single map later
+
+    The colormap is saved by name so that the arguments can be passed to
+    the rendering processes (see CellMapRenderer.draw())
+    """
+    return {
+        'output_path': output_path, 'data_dict': dict(data_dict),
+        'title_str': title_str, 'clabel_str': clabel_str,
+        'cmap': cmap.name if cmap is not None else None,
+        'v_min': v_min, 'v_max': v_max, 'label_flag': label_flag,
+        'save_flag': save_flag, 'show_flag': show_flag,
+        'label_size': label_size}
+
+
+def render_maps(map_list, geom_dict, extent, fig_size=(12, 12), fig_dpi=150,
+                mp_procs=1):
+    """Draw a list of maps, in parallel if mp_procs > 1
+
+    The maps are split between the processes and each process draws all
+    of its maps with a single CellMapRenderer
+
+    Args:
+        map_list (list): map_args() of each map
+        geom_dict (dict): id, list of shapely polygons
+        extent (list): extent of all geometry objects [minx, miny, maxx, maxy]
+        fig_size (tuple): figure size in inches (width, height)
+        fig_dpi (int): Figure dots per square inch
+        mp_procs (int): number of cores to use for multiprocessing
+    """
+    mp_procs = max(1, min(mp_procs, len(map_list)))
+    if mp_procs > 1:
+        pool = mp.Pool(mp_procs)
+        pool.map(render_maps_mp, [
+            [map_list[i::mp_procs], geom_dict, extent, fig_size, fig_dpi]
+            for i in range(mp_procs)])
+        pool.close()
+        pool.join()
+        del pool
+    elif map_list:
+        render_maps_mp([map_list, geom_dict, extent, fig_size, fig_dpi])
+
+
+def render_maps_mp(tup):
+    """Pool multiprocessing friendly map rendering function"""
+    map_list, geom_dict, extent, fig_size, fig_dpi = tup
+    renderer = CellMapRenderer(
+        geom_dict, extent, fig_size=fig_size, fig_dpi=fig_dpi)
+    for kwargs in map_list:
+        renderer.draw(**kwargs)
+    renderer.close()
+    return len(map_list)
+
+
+class CellMapRenderer():
+    """Draw cell value maps with descartes and matplotlib
+
+    The figure, axes and a single patch collection of all of the cell
+    polygons are built once.  For each map only the patch colors, the
+    labels, the title and the colorbar are updated.
+    """
+    def __init__(self, geom_dict, extent, fig_size=(12, 12), fig_dpi=150):
+        """
+
+        Args:
+            geom_dict (dict): id, list of shapely polygons
+            extent (list): extent of all geometry objects
+                [minx, miny, maxx, maxy]
+            fig_size (tuple): figure size in inches (width, height)
+            fig_dpi (int): Figure dots per square inch
+        """
+        self.fig_dpi = fig_dpi
+        self.fig = plt.figure(figsize=fig_size)
+        self.ax = self.fig.add_axes([0.05, 0.05, 0.9, 0.9])
+
+        # Assume extent was saved when geometries were read in
+        # It could be recomputed from the individual geometries also
+        minx, miny, maxx, maxy = extent
+        w, h = maxx - minx, maxy - miny
+        self.ax.set_xlim(minx - 0.05 * w, maxx + 0.05 * w)
+        self.ax.set_ylim(miny - 0.05 * h, maxy + 0.05 * h)
+        self.ax.set_aspect(1)
+        self.ax.set_xticks([])
+        self.ax.set_yticks([])
+
+        # Patch ID of each polygon and the label location of each ID
+        self.patch_ids = []
+        self.label_xy = dict()
+        patches = []
+        for id, geom_list in geom_dict.items():
+            for geom_i, geom in enumerate(geom_list):
+                patches.append(PolygonPatch(geom))
+                self.patch_ids.append(id)
+                if geom_i == 0:
+                    self.label_xy[id] = list(geom.centroid.coords)[0]
+        self.collection = PatchCollection(patches, linewidths=0.7)
+        self.ax.add_collection(self.collection)
+        self.labels = []
+        self.cbax = None
+
+    def draw(self, output_path, data_dict, title_str, clabel_str, cmap=None,
+             v_min=None, v_max=None, label_flag=False, save_flag=True,
+             show_flag=False, label_size=8):
+        """Draw the cell values for a single field
+
+        Args:
+            output_path (str): output file path
+            data_dict (dict): id, map value
+            title_str (str): Text at the top of the figure/map
+            clabel_str (str): Text to display next to the colorbar
+            cmap (str): colormap name
+            v_min ():
+            v_max ():
+            label_flag (bool): If True, label figures with id
+            save_flag (bool): If True, save the figure
+            show_flag (bool): If True, show the figure
+            label_size (int): Label text font size
+        """
+        logging.info('  {}'.format(output_path))
+        font = matplotlib.font_manager.FontProperties(
+            family='Tahoma', weight='semibold', size=label_size)
+        self.ax.set_title(title_str)
+
+        # Build colormap
+        m = None
+        if cmap:
+            cmap = cm.get_cmap(cmap)
+            if v_min is None:
+                v_min = min(data_dict.values())
+                logging.debug('    v_min={}'.format(v_min))
+            if v_max is None:
+                v_max = max(data_dict.values())
+                logging.debug('    v_max={}'.format(v_max))
+            norm = colors.Normalize(vmin=v_min, vmax=v_max)
+            m = cm.ScalarMappable(norm=norm, cmap=cmap)
+
+            # If all values are the same
+            #   don't color the patches or draw a colorbar
+            # DEADBEEF - If the colorbar values were normalized for all crops
+            #   this wouldn't be applicable
+            if abs(v_max - v_min) <= 1.:
+                cmap, m = None, None
+
+        # Patch colors and labels
+        color_dict = dict()
+        for label in self.labels:
+            label.remove()
+        self.labels = []
+        for id, (cx, cy) in self.label_xy.items():
+            value_str = ''
+            color = '#EFEFEF'
+            try:
+                value = data_dict[id]
+            except KeyError:
+                # Key (CELL_ID) is not in data dictionary
+                value = None
+            if value is None:
+                pass
+            elif isinstance(value, basestring):
+                # Value is a string (not a float/int)
+                value_str = value
+            elif np.isnan(value):
+                # Cells with NaN values are not drawn
+                color = 'none'
+            elif m is None:
+                # Min and max values are identical
+                value_str = '{}'.format(int(round(value, 0)))
+                color = (1.0, 1.0, 0.745, 1.0)
+            else:
+                value_str = '{}'.format(int(round(value, 0)))
+                color = m.to_rgba(value)
+            color_dict[id] = color
+
+            # Label the patch with the value
+            if label_flag and value_str:
+                self.labels.append(self.ax.annotate(
+                    value_str, xy=(cx, cy), ha='center', va='center',
+                    color='#262626', fontproperties=font))
+        self.collection.set_facecolors(
+            [color_dict[id] for id in self.patch_ids])
+        self.collection.set_edgecolors([
+            'none' if color_dict[id] == 'none' else '#808080'
+            for id in self.patch_ids])
+
+        # Colorbar
+        if self.cbax is not None:
+            self.fig.delaxes(self.cbax)
+            self.cbax = None
+        if cmap:
+            m.set_array(np.array([v_min, v_max]))
+            self.cbax = self.fig.add_axes([0.085, 0.09, 0.03, 0.30])
+            cbar = self.fig.colorbar(m, cax=self.cbax, orientation='vertical')
+            cbar.ax.tick_params(labelsize=10)
+            cbar.locator = matplotlib.ticker.MaxNLocator(integer=True)
+            cbar.update_ticks()
+            cbar.set_label(clabel_str)
+
+        if save_flag:
+            self.fig.savefig(output_path, dpi=self.fig_dpi)
+        if show_flag:
+            plt.show()
+
+    def close(self):
+        """ """
+        self.fig.clf()
+        plt.close(self.fig)
+        gc.collect()
 
 
 def cell_plot_func(output_path, geom_dict, data_dict, title_str, clabel_str,
@@ -633,114 +886,16 @@ def cell_plot_func(output_path, geom_dict, data_dict, title_str, clabel_str,
         show_flag (bool): If True, show the figure
         label_size (int): Label text font size
     """
-    logging.info('  {}'.format(output_path))
-    # font = matplotlib.font_manager.FontProperties(
-    #     ='Comic Sans MS', weight='semibold', size=8)
-    font = matplotlib.font_manager.FontProperties(
-        family='Tahoma', weight='semibold', size=label_size)
-    # font = matplotlib.font_manager.FontProperties(
-    #     ='Consolas', weight='semibold', size=7)
-
-    fig = plt.figure(figsize=fig_size)
-    ax = fig.add_axes([0.05, 0.05, 0.9, 0.9])
-    plt.title(title_str)
-
-    # Assume extent was saved when geometries were read in
-    # It could be recomputed from the individual geometries also
-    if extent is not None:
-        minx, miny, maxx, maxy = extent
-        w, h = maxx - minx, maxy - miny
-        ax.set_xlim(minx - 0.05 * w, maxx + 0.05 * w)
-        ax.set_ylim(miny - 0.05 * h, maxy + 0.05 * h)
-        ax.set_aspect(1)
-    else:
+    if extent is None:
         logging.debug('  extent not set')
         return False
-
-    # Build colormap
-    if cmap:
-        if v_min is None:
-            v_min = min(data_dict.values())
-            logging.debug('    v_min={}'.format(v_min))
-        if v_max is None:
-            v_max = max(data_dict.values())
-            logging.debug('    v_max={}'.format(v_max))
-        norm = colors.Normalize(vmin=v_min, vmax=v_max)
-        m = cm.ScalarMappable(norm=norm, cmap=cmap)
-
-        # If all values are the same
-        #   don't color the patches or draw a colorbar
-        # DEADBEEF - If the colorbar values were normalized for all crops
-        #   this wouldn't be applicable
-        if abs(v_max - v_min) <= 1.:
-            cmap, m = None, None
-
-    # Draw patches
-    for id, geom_list in geom_dict.items():
-        value_str = ''
-        hatch = ''
-        color = '#EFEFEF'
-        try:
-            value_str = '{}'.format(int(round(data_dict[id], 0)))
-            color = m.to_rgba(data_dict[id])
-        except KeyError:
-            # Key (CELL_ID) is not in data dictionary
-            pass
-            # hatch = '/'
-        # except ValueError:
-        #      Value is NaN
-        #
-        except TypeError:
-            # Value is a string (not a float/int)
-            value_str = data_dict[id]
-        except AttributeError:
-            # Min and max values are identical
-            value_str = '{}'.format(int(round(data_dict[id], 0)))
-            color = (1.0, 1.0, 0.745, 1.0)
-            # color = '#CCCCCC'
-            # Display "yellow" color at middle of RdYlBu_r
-            # print cm.ScalarMappable(
-            #     norm=colors.Normalize(vmin=-1, vmax=1),
-            #     cmap=cm.RdYlBu_r).to_rgba(0)
-        except:
-            print 'Unknown error'
-            print id, data_dict[id], '{}'.format(int(round(data_dict[id], 0)))
-            print m.to_rgba(data_dict[id])
-            continue
-
-        # Write the geometry to the map/figure
-        for geom_i, geom in enumerate(geom_list):
-            p = ax.add_patch(PolygonPatch(
-                geom, fc=color, ec='#808080', lw=0.7, hatch=hatch))
-
-            # Label the patch with the value
-            if geom_i == 0 and label_flag and value_str:
-                cx, cy = list(geom.centroid.coords)[0]
-                ax.annotate(
-                    value_str, xy=(cx, cy), ha='center', va='center',
-                    color='#262626', fontproperties=font)
-    ax.set_xticks([])
-    ax.set_yticks([])
-
-    # Colorbar
-    if cmap:
-        plt.imshow(np.array([[v_min, v_max]]), cmap=cmap)
-        cbax = plt.axes([0.085, 0.09, 0.03, 0.30])
-        cbar = plt.colorbar(cax=cbax, orientation='vertical')
-        cbar.ax.tick_params(labelsize=10)
-        cbar.locator = matplotlib.ticker.MaxNLocator(integer=True)
-        cbar.update_ticks()
-        # cbar.ax.set_major_locator(MaxNLocator(integer=True))
-        cbar.set_label(clabel_str)
-
-    if save_flag:
-        plt.savefig(output_path, dpi=fig_dpi)
-    if show_flag:
-        plt.show()
-
-    fig.clf()
-    plt.close()
-    gc.collect()
+    renderer = CellMapRenderer(
+        geom_dict, extent, fig_size=fig_size, fig_dpi=fig_dpi)
+    renderer.draw(**map_args(
+        output_path, data_dict, title_str, clabel_str, cmap=cmap,
+        v_min=v_min, v_max=v_max, label_flag=label_flag,
+        save_flag=save_flag, show_flag=show_flag, label_size=label_size))
+    renderer.close()
 
     # Plot with shapely/fiona/matplotlib
     # https://gist.github.com/urschrei/6442846
@@ -907,6 +1062,14 @@ def parse_args():
     parser.add_argument(
         '--area', default=None, type=float,
         help='Crop area threshold [acres]')
+    parser.add_argument(
+        '-mp', '--multiprocessing', default=1, type=int,
+        metavar='N', nargs='?', const=mp.cpu_count(),
+        help='Number of processers to use for reading the daily files ' +
+             'and drawing the maps')
+    parser.add_argument(
+        '--summary', default=False, action='store_true',
+        help='Only build the crop summary table (no maps)')
     parser.add_argument(
         '--debug', default=logging.INFO, const=logging.DEBUG,
         help='Debug level logging', action="store_const", dest="loglevel")
@@ -948,4 +1111,5 @@ if __name__ == '__main__':
     main(ini_path, show_flag=args.show, save_flag=args.no_save,
          figure_size=args.size, figure_dpi=args.dpi, label_flag=args.label,
          start_date=args.start, end_date=args.end, crop_str=args.crops,
-         simplify_tol=args.simp, area_threshold=args.area)
+         simplify_tol=args.simp, area_threshold=args.area,
+         mp_procs=args.multiprocessing, summary_flag=args.summary)
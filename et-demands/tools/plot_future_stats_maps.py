@@ -8,16 +8,15 @@
 
 # plot_future_stats_maps.py
 import argparse
-from collections import defaultdict
 import datetime as dt
 import logging
 import math
+import multiprocessing as mp
 import os
 # import re
 import sys
 
 from descartes import PolygonPatch
-import fiona
 # import matplotlib
 import matplotlib.pyplot as plt
 import matplotlib.cm as cm
@@ -25,17 +24,20 @@ import matplotlib.colors as colors
 import matplotlib.ticker as ticker
 import numpy as np
 import pandas as pd
-from shapely.geometry import MultiPolygon, Polygon, shape
+from shapely.geometry import MultiPolygon, Polygon, box
 
 import util
 
 
 def main(ini_path, show_flag=False, save_flag=True,
          full_size=(3.2, 4.0), sub_size=(6.5, 8.0),
-         full_dpi=300, sub_dpi=200, simplify_tol=None, states_flag=False):
+         full_dpi=300, sub_dpi=200, simplify_tol=None, states_flag=False,
+         mp_procs=1):
     """Plot future statistic maps
 
     For now, data is stored in excel files in stats_tables folder
+    The workbook tabs and the geometries are cached in the stats_maps/cache
+        folder so they are only read once
 
     Args:
         ini_path (str): file path of the project INI file
@@ -45,6 +47,7 @@ def main(ini_path, show_flag=False, save_flag=True,
         figure_dpi (int): figure dots per inch
         simplify_tol (float):
         states_flag (bool): if True, draw state boundaries
+        mp_procs (int): number of cores to use for multiprocessing
 
     Returns:
         None
@@ -227,40 +230,38 @@ def main(ini_path, show_flag=False, save_flag=True,
 
     # Read ET Cells into memory with fiona and shapely
     # Convert multi-polygons to list of polygons
+    # The (simplified) polygons are cached for each shapefile and tolerance
     logging.info('\nReading ET cells shapefile')
-    cell_geom_dict = read_cell_geometries(
-        cells_path, cell_id_field, simplify_tol)
-    cell_extent = read_cell_extent(cells_path)
+    cache_ws = os.path.join(output_ws, 'cache')
+    cell_geom_dict, cell_data_dict, cell_extent = util.read_cell_geometry(
+        cells_path, cell_id_field, simplify_tol, cache_ws=cache_ws)
     if not cell_geom_dict:
         logging.error('  ET Cell shapefile not read in, exiting')
         return False
 
     # Read in state geometries
+    # The states near the cells are clipped once and cached
     state_geom_dict = {}
     if states_flag:
         logging.info('\nReading state shapefile')
         try:
-            state_geom_dict = read_cell_geometries(states_path, states_field)
+            state_geom_dict = read_state_geometries(
+                states_path, states_field, cell_extent, cache_ws=cache_ws)
         except:
             logging.error('  State geometries not read in, ignoring')
 
-        # Remove state features that don't intersect the cells extent
-        for k, geom_list in state_geom_dict.items():
-            geom_list = [
-                g for g in geom_list
-                if extents_overlap(list(g.bounds), cell_extent)]
-            if geom_list:
-                state_geom_dict[k] = geom_list
-            else:
-                del state_geom_dict[k]
+    # Geometry keyword arguments to plotting functions
+    # These are only passed once to each rendering process
+    geom_kwargs = {
+        'state_geom_dict': state_geom_dict,
+        'cell_geom_dict': cell_geom_dict,
+        'cell_extent': cell_extent
+    }
 
     # Keyword arguments to plotting functions
     full_kwargs = {
         'table_id_field': table_id_field,
         'scenario_field': scenario_fields[50],
-        'state_geom_dict': state_geom_dict,
-        'cell_geom_dict': cell_geom_dict,
-        'cell_extent': cell_extent,
         'figure_size': full_size,
         'figure_dpi': full_dpi,
         'save_flag': save_flag,
@@ -272,78 +273,78 @@ def main(ini_path, show_flag=False, save_flag=True,
         'table_id_field': table_id_field,
         'period_field': period_field,
         'scenario_fields': scenario_fields,
-        'state_geom_dict': state_geom_dict,
-        'cell_geom_dict': cell_geom_dict,
-        'cell_extent': cell_extent,
         'figure_size': sub_size,
         'figure_dpi': sub_dpi,
         'save_flag': save_flag,
         'show_flag': show_flag
     }
 
+    # The plots are drawn after all of the tables are read
+    # Each group of plots (a variable) is drawn by a single process
+    # Maps can't be shown from the rendering processes
+    if show_flag and mp_procs > 1:
+        logging.warning('  Show flag is set, disabling multiprocessing')
+        mp_procs = 1
+    plot_groups = []
+
     # Plot the crop area
     var = 'area'
     logging.info('\nVariable: {}'.format(var))
-    cell_area_dict = read_cell_data(cells_path, cell_id_field, ag_acres_field)
+    cell_area_dict = {
+        k: v[ag_acres_field] for k, v in cell_data_dict.iteritems()}
     # Convert the crop area dictionary to dataframe even though it
     #   immediatly gets converted back to a dict in full_plot()
     # For simplicity, set column names to match excel file column names
     cell_area_df = pd.DataFrame(
         cell_area_dict.items(), columns=[table_id_field, scenario_fields[50]])
-    full_plot(
-        os.path.join(
+    plot_groups.append([(full_plot, dict(
+        output_path=os.path.join(
             output_ws,
             'fullplot_{}_value.{}'.format(output_var[var], image_ext)),
-        cell_area_df, caption=value_text[var],
+        data_df=cell_area_df, caption=value_text[var],
         cmap_name=cmap_names[var]['value'],
-        v_min=0, v_max=max(cell_area_dict.values()), **full_kwargs)
+        v_min=0, v_max=max(cell_area_dict.values()), **full_kwargs))])
 
     # Build master type list
     type_list = sorted(set(full_value_list + sub_value_list + sub_delta_list))
 
     # Read in all tables
+    # The tabs and their value ranges are cached for each workbook
     for var in type_list:
         logging.info('\nVariable: {}'.format(var))
         full_table_name = full_table_fmt.format(
             basin_id=basin_id, var=var)
         logging.info('  {}'.format(full_table_name))
-        full_value_df = pd.read_excel(
-            os.path.join(stats_ws, full_table_name),
-            sheetname=full_value_tab, skiprows=1)
-        full_value_df[table_id_field] = full_value_df[table_id_field].astype('str')
+        full_tab_dict, full_range_dict = read_workbook_tabs(
+            os.path.join(stats_ws, full_table_name), [full_value_tab],
+            table_id_field, scenario_fields.values(), cache_ws=cache_ws)
+        full_value_df = full_tab_dict[full_value_tab]
         logging.debug('  {}'.format(full_value_tab))
         logging.debug(str(full_value_df.head()) + '\n')
 
+        # The value and delta tabs are read with a single workbook open
         sub_table_name = sub_table_fmt.format(
             basin_id=basin_id, var=var)
         logging.info('  {}'.format(sub_table_name))
-        sub_value_df = pd.read_excel(
+        sub_delta_tab = sub_delta_tabs[delta_type[var]]
+        sub_tab_dict, sub_range_dict = read_workbook_tabs(
             os.path.join(stats_ws, sub_table_name),
-            sheetname=sub_value_tab, skiprows=1)
-        sub_value_df[table_id_field] = sub_value_df[table_id_field].astype('str')
+            [sub_value_tab, sub_delta_tab],
+            table_id_field, scenario_fields.values(), cache_ws=cache_ws)
+        sub_value_df = sub_tab_dict[sub_value_tab]
         logging.debug('  {}'.format(sub_value_tab))
         logging.debug(str(sub_value_df.head()) + '\n')
-
-        # Switch tabs
-        sub_delta_df = pd.read_excel(
-            os.path.join(stats_ws, sub_table_name),
-            sheetname=sub_delta_tabs[delta_type[var]], skiprows=1)
-        sub_delta_df[table_id_field] = sub_delta_df[table_id_field].astype('str')
-        logging.debug('  {}'.format(sub_delta_tabs[delta_type[var]]))
+        sub_delta_df = sub_tab_dict[sub_delta_tab]
+        logging.debug('  {}'.format(sub_delta_tab))
         logging.debug(str(sub_delta_df.head()) + '\n')
 
         # Build colorbar ranges
         logging.info('\n  Computing colorbar ranges')
 
-        # Calculate min/max value
-        # DEADBEEF - Make this a separate function
-        f = scenario_fields.values()
-        full_value_min = min(full_value_df[f].values.flatten())
-        full_value_max = max(full_value_df[f].values.flatten())
-        sub_value_min = min(sub_value_df[f].values.flatten())
-        sub_value_max = max(sub_value_df[f].values.flatten())
-        sub_delta_min = min(sub_delta_df[f].values.flatten())
-        sub_delta_max = max(sub_delta_df[f].values.flatten())
+        # Min/max values of the scenario fields (from the cache)
+        full_value_min, full_value_max = full_range_dict[full_value_tab]
+        sub_value_min, sub_value_max = sub_range_dict[sub_value_tab]
+        sub_delta_min, sub_delta_max = sub_range_dict[sub_delta_tab]
 
         # Adjust very small negative min deltas
         # if delta_min_negative_override < sub_delta_min < 0:
@@ -389,38 +390,84 @@ def main(ini_path, show_flag=False, save_flag=True,
             sub_value_round_max = max(
                 full_value_round_max, sub_value_round_max)
 
+        plot_list = []
+
         # Build full value plots
         if var in full_value_list:
             output_name = 'fullplot_{}_value.{}'.format(
                 output_var[var], image_ext)
             output_path = os.path.join(output_ws, output_name)
-            full_plot(
-                output_path, full_value_df, caption=value_text[var],
+            plot_list.append((full_plot, dict(
+                output_path=output_path, data_df=full_value_df,
+                caption=value_text[var],
                 cmap_name=cmap_names[var]['value'],
                 v_min=full_value_round_min, v_max=full_value_round_max,
-                **full_kwargs)
+                **full_kwargs)))
 
         # Build sub value plots
         if var in sub_value_list:
             output_name = 'subplot_{}_value.{}'.format(
                 output_var[var], image_ext)
             output_path = os.path.join(output_ws, output_name)
-            sub_plot(
-                output_path, sub_value_df, caption=value_text[var],
+            plot_list.append((sub_plot, dict(
+                output_path=output_path, data_df=sub_value_df,
+                caption=value_text[var],
                 cmap_name=cmap_names[var]['value'],
                 v_min=sub_value_round_min, v_max=sub_value_round_max,
-                **sub_kwargs)
+                **sub_kwargs)))
 
         # Build sub delta plots
         if var in sub_delta_list:
             output_name = 'subplot_{}_delta.{}'.format(
                 output_var[var], image_ext)
             output_path = os.path.join(output_ws, output_name)
-            sub_plot(
-                output_path, sub_delta_df, caption=delta_text[var],
+            plot_list.append((sub_plot, dict(
+                output_path=output_path, data_df=sub_delta_df,
+                caption=delta_text[var],
                 cmap_name=cmap_names[var]['delta'],
                 v_min=sub_delta_round_min, v_max=sub_delta_round_max,
-                **sub_kwargs)
+                **sub_kwargs)))
+        if plot_list:
+            plot_groups.append(plot_list)
+
+    # Draw the plots
+    logging.info('\nDrawing plots')
+    render_plots(plot_groups, geom_kwargs, mp_procs=mp_procs)
+
+
+def render_plots(plot_groups, geom_kwargs, mp_procs=1):
+    """Draw groups of plots, in parallel if mp_procs > 1
+
+    The groups are split between the processes and the geometries are only
+    passed once to each process
+
+    Args:
+        plot_groups (list): lists of (plot function, keyword arguments)
+        geom_kwargs (dict): geometry keyword arguments of the plot functions
+        mp_procs (int): number of cores to use for multiprocessing
+    """
+    mp_procs = max(1, min(mp_procs, len(plot_groups)))
+    if mp_procs > 1:
+        pool = mp.Pool(mp_procs)
+        pool.map(render_plots_mp, [
+            [plot_groups[i::mp_procs], geom_kwargs] for i in range(mp_procs)])
+        pool.close()
+        pool.join()
+        del pool
+    elif plot_groups:
+        render_plots_mp([plot_groups, geom_kwargs])
+
+
+def render_plots_mp(tup):
+    """Pool multiprocessing friendly plot rendering function"""
+    plot_groups, geom_kwargs = tup
+    for plot_list in plot_groups:
+        for plot_func, plot_kwargs in plot_list:
+            logging.info('  {}'.format(
+                os.path.basename(plot_kwargs['output_path'])))
+            plot_kwargs = dict(plot_kwargs, **geom_kwargs)
+            plot_func(**plot_kwargs)
+    return len(plot_groups)
 
 
 def full_plot(output_path, data_df, caption, cmap_name, v_min, v_max,
@@ -700,58 +747,108 @@ def percent_func(min_value, max_value, test_value=0):
         return (float(test_value - min_value) / (max_value - min_value))
 
 
-def read_cell_geometries(cells_path, cell_id_field, simplify_tol=None):
-    """"""
-    cell_geom_dict = defaultdict(list)
-    # cell_data_dict = dict()
-    with fiona.open(cells_path, "r") as cell_f:
-        # Fiona is printing a debug statement here "Index: N"
-        for item in cell_f:
-            cell_id = item['properties'][cell_id_field]
-            # cell_data_dict[cell_id] = item['properties']
-
-            # Simplify the geometry
-            if simplify_tol is not None:
-                item_geom = shape(item['geometry']).simplify(
-                    simplify_tol, preserve_topology=False)
-            else:
-                item_geom = shape(item['geometry'])
-
-            # Unpack multipolygons to lists of polygons
-            if item_geom.is_empty:
-                continue
-            elif item_geom.geom_type == 'MultiPolygon':
-                # Order the geometries from largest to smallest area
-                item_geom_list = sorted(
-                    [[g.area, g] for g in item_geom if not g.is_empty],
-                    reverse=True)
-                for item_area, item_poly in item_geom_list:
-                    cell_geom_dict[cell_id].append(item_poly)
-            elif item_geom.geom_type == 'Polygon':
-                cell_geom_dict[cell_id].append(item_geom)
-            else:
-                logging.error('Invalid geometry type')
+def read_state_geometries(states_path, states_field, cell_extent,
+                          cache_ws=None):
+    """Read the state polygons that overlap the cells and clip them
+
+    The polygons are clipped to the cell extent padded by the largest
+    dimension of the cells (on each side) so the boundaries still reach
+    the edges of the maps after the extent is adjusted to the axes.
+    The clipped polygons are cached for each states shapefile and extent.
+
+    Args:
+        states_path (str): states shapefile path
+        states_field (str): state name field
+        cell_extent (list): extent of the cells [minx, miny, maxx, maxy]
+        cache_ws (str): cache folder (if not set, the cache is not used)
+
+    Returns:
+        dict of the state name and the list of clipped polygons
+    """
+    cache_key = util.file_cache_key(states_path, ['.shp', '.dbf']) + [
+        states_field, list(cell_extent)]
+    if cache_ws is not None:
+        state_cache_path = util.cache_path(
+            cache_ws, 'state_geometry', cache_key)
+        state_geom_dict = util.read_cache(state_cache_path, cache_key)
+        if state_geom_dict is not None:
+            logging.debug('  Reading cached state geometry')
+            return state_geom_dict
+
+    minx, miny, maxx, maxy = cell_extent
+    pad = max(maxx - minx, maxy - miny)
+    clip_geom = box(minx - pad, miny - pad, maxx + pad, maxy + pad)
+
+    state_geom_dict = dict()
+    for k, geom_list in util.read_cell_geometry(
+            states_path, states_field)[0].items():
+        clip_list = []
+        # Remove state features that don't intersect the cells extent
+        for geom in geom_list:
+            if not extents_overlap(list(geom.bounds), cell_extent):
                 continue
-    return cell_geom_dict
+            geom = geom.intersection(clip_geom)
+            if geom.geom_type == 'Polygon':
+                clip_list.append(geom)
+            elif geom.geom_type in ['MultiPolygon', 'GeometryCollection']:
+                clip_list.extend([
+                    g for g in geom
+                    if g.geom_type == 'Polygon' and not g.is_empty])
+        if clip_list:
+            state_geom_dict[k] = clip_list
 
+    if cache_ws is not None:
+        util.write_cache(state_cache_path, cache_key, state_geom_dict)
+    return state_geom_dict
 
-def read_cell_extent(cells_path):
-    """"""
-    cell_extent = []
-    with fiona.open(cells_path, "r") as cell_f:
-        cell_extent = cell_f.bounds[:]
-    return cell_extent
 
+def read_workbook_tabs(workbook_path, tab_list, table_id_field, value_fields,
+                       cache_ws=None):
+    """Read tabs of a stats workbook
 
-def read_cell_data(cells_path, cell_id_field, data_field):
-    """"""
-    cell_data_dict = dict()
-    with fiona.open(cells_path, "r") as cell_f:
-        # Fiona is printing a debug statement here "Index: N"
-        for item in cell_f:
-            cell_id = item['properties'][cell_id_field]
-            cell_data_dict[cell_id] = item['properties'][data_field]
-    return cell_data_dict
+    The tabs are converted once to data frames and pickled along with the
+    min/max of the value fields (for the colorbar ranges).  The cache is
+    rebuilt if the workbook is modified.
+
+    Args:
+        workbook_path (str): Excel workbook path
+        tab_list (list): tab names
+        table_id_field (str): ID field name (converted to strings)
+        value_fields (list): field names of the min/max values
+        cache_ws (str): cache folder (if not set, the cache is not used)
+
+    Returns:
+        tuple of the data frame and the (min, max) dictionaries of the tabs
+    """
+    # The cache is keyed by the workbook modified time and size
+    # There is a single cache file for each workbook
+    cache_key = util.file_cache_key(workbook_path) + [
+        table_id_field, sorted(value_fields)]
+    cache = None
+    if cache_ws is not None:
+        tab_cache_path = os.path.join(cache_ws, '{}.pkl'.format(
+            os.path.splitext(os.path.basename(workbook_path))[0]))
+        cache = util.read_cache(tab_cache_path, cache_key)
+    if cache is None:
+        cache = {'tabs': {}, 'ranges': {}}
+
+    # Only read the tabs that aren't in the cache (with one workbook open)
+    read_tabs = [tab for tab in tab_list if tab not in cache['tabs'].keys()]
+    if read_tabs:
+        logging.debug('    Reading tabs: {}'.format(', '.join(read_tabs)))
+        tab_dfs = pd.read_excel(workbook_path, read_tabs, skiprows=1)
+        for tab, tab_df in tab_dfs.items():
+            tab_df[table_id_field] = tab_df[table_id_field].astype('str')
+            tab_values = tab_df[value_fields].values.flatten()
+            cache['tabs'][tab] = tab_df
+            cache['ranges'][tab] = (min(tab_values), max(tab_values))
+        if cache_ws is not None:
+            util.write_cache(tab_cache_path, cache_key, cache)
+    else:
+        logging.debug('    Reading cached tabs')
+    return (
+        dict((tab, cache['tabs'][tab]) for tab in tab_list),
+        dict((tab, cache['ranges'][tab]) for tab in tab_list))
 
 
 def adjust_extent_to_axes(cell_extent, ax, pad=0):
@@ -926,6 +1023,10 @@ def parse_args():
     # parser.add_argument(
     #     '--area', default=None, type=float,
     #     help='Crop area threshold [acres]')
+    parser.add_argument(
+        '-mp', '--multiprocessing', default=1, type=int,
+        metavar='N', nargs='?', const=mp.cpu_count(),
+        help='Number of processers to use')
     parser.add_argument(
         '--debug', default=logging.INFO, const=logging.DEBUG,
         help='Debug level logging', action="store_const", dest="loglevel")
@@ -968,4 +1069,5 @@ if __name__ == '__main__':
     main(ini_path, show_flag=args.show, save_flag=args.no_save,
          full_size=args.full_size, sub_size=args.sub_size,
          full_dpi=args.full_dpi, sub_dpi=args.sub_dpi,
-         simplify_tol=args.simp, states_flag=args.states)
+         simplify_tol=args.simp, states_flag=args.states,
+         mp_procs=args.multiprocessing)
@@ -8,7 +8,9 @@
 
 import argparse
 import logging
+import multiprocessing as mp
 import os
+import sys
 from time import clock
 
 import matplotlib.pyplot as plt
@@ -20,7 +22,8 @@ import emprso_w_tr
 
 def main(file_name=None, station_elev=None,
          station_lat=None, station_lon=None,
-         comparison_flag=False, mc_iterations=None, debug_flag=True):
+         comparison_flag=False, mc_iterations=None, mc_memory=256,
+         debug_flag=True):
     """
 
     Args:
@@ -30,6 +33,7 @@ def main(file_name=None, station_elev=None,
         station_lon (float): station longitude [decimal degrees]
         comparison_flag (bool): if True,
         mc_iterations (int):
+        mc_memory (float): Monte Carlo memory budget [MB]
         debug_flag (bool): if True, enable debug level logging
 
     Returns:
@@ -120,26 +124,16 @@ def main(file_name=None, station_elev=None,
     # station_lat = 35.14887
     # station_lon = 98.46607
     if mc_iterations is None:
-        mc_iterations = float(raw_input(
+        mc_iterations = int(raw_input(
             'Specify the number of Monte Carlo iterations: '))
     # mc_iterations = int(raw_input(
     #    'Specify how many iterations to run (Expect ~10 run time per 1000):
 
-    # Read the Excel file
-    data_pd = pd.read_excel(
-        file_path, sheetname='Sheet1', na_values=['-999'],
-        index_col=0, has_index_names=True,
-        parse_dates={'Date': [2, 0, 1]},
-        date_parser=lambda x: pd.datetime.strptime(x, '%Y %m %d'))
+    # Read the station file (Excel, CSV or Parquet)
+    data_pd = read_station_data(file_path)
     # print data_pd.ix['1997-11-20']
     num_lines = len(data_pd.index)
 
-    # Assign month and DOY columns to the data frame
-    data_pd[year_col] = data_pd.index.year
-    data_pd[month_col] = data_pd.index.month
-    data_pd[day_col] = data_pd.index.day
-    data_pd[doy_col] = data_pd.index.dayofyear
-
     # Assigning dates
     # month = data_pd[:,0]
     # day = data_pd[:,1]
@@ -156,40 +150,13 @@ def main(file_name=None, station_elev=None,
     #precip = data[:,13]      # mm
     #uz = Wind                # change variable name for downhill code
 
-    # Compute pressure kPa
-    p = (2.406 - 0.0000534 * station_elev) ** 5.26
-
-    # FAO converting watts into mj m2 d
-    if rs_watts_flag:
-        data_pd[rs_col] *= 0.0864
-
-    # Mean monthly difference between Tmax and Tmin for T-R
-    data_pd[tdelta_col] = data_pd[tmax_col] - data_pd[tmin_col]
-    tdelta_monthly = data_pd[[month_col,tdelta_col]].groupby(month_col).mean()
-    tdelta_monthly.rename(columns={tdelta_col:tmonth_col}, inplace=True)
-    tdelta_monthly.reset_index(level=0, inplace=True)
-    # tdelta_monthly[month_col] = df.index
-
-    # Join mean monthly tdelta back to main table
-    # Date index is dropped by merge, so save it before merging
-    data_pd = data_pd.reset_index()
-    data_pd = pd.merge(data_pd, tdelta_monthly, on=month_col)
-    data_pd = data_pd.set_index('Date')
-
-    # Apply Limits on Variables, rhmax, rhmin, tmax, tmin, rs, wind, rh
-    data_pd[data_pd[tmax_col] < -40] = np.nan
-    data_pd[data_pd[tmax_col] > 60] = np.nan
-    data_pd[data_pd[tmin_col] < -40] = np.nan
-    data_pd[data_pd[tmin_col] > 60] = np.nan
-    # rhmax[rhmax < -40] = np.nan
-    # rhmax[rhmax >= 60] = np.nan
-    # rhmin[rhmin < -40] = np.nan
-    # rhmin[rhmin >= 60] = np.nan
+    # Pressure, Tdelta and the mean monthly Tdelta
+    data_pd, p = prep_station_data(data_pd, station_elev, rs_watts_flag)
 
     # Calculate all secondary variables as separate arrays
     eo_tmax = 0.6108 * np.exp((17.27 * data_pd[tmax_col]) / (data_pd[tmax_col] + 237.3))
     eo_tmin = 0.6108 * np.exp((17.27 * data_pd[tmin_col]) / (data_pd[tmin_col] + 237.3))
-    ea = 0.6108 * np.exp((17.27 * data_pd[tdew_col]) / (data_pd[tdew_col] + 237.3))
+    ea = actual_vapor_pressure(data_pd)
     #ea = ((eo_tmin * (rhmax / 100)) + (eo_tmax * (rhmin / 100))) / 2
     tdew = (116.91 + 237.3 * np.log(ea)) / (16.78 - np.log(ea))
     tmin_tdew = data_pd[tmin_col] - data_pd[tdew_col]
@@ -212,14 +179,7 @@ def main(file_name=None, station_elev=None,
     rs_max = max(rs_meas[rs_mask])
 
     # Calculate monthly means for rs and standard param rs_tr
-    rs_monthly = data_pd[[month_col, rs_col]].groupby(month_col).mean()
-    rs_monthly.rename(columns={rs_col: rs_month_col}, inplace=True)
-    rs_monthly.reset_index(level=0, inplace=True)
-
-    # Join mean monthly Rs back to main table
-    data_pd = data_pd.reset_index()
-    data_pd = pd.merge(data_pd, rs_monthly, on=month_col)
-    data_pd = data_pd.set_index('Date')
+    data_pd, rs_monthly = monthly_rs(data_pd)
 
     #
     rs_tr_standard_monthly = np.zeros(12)
@@ -346,65 +306,36 @@ def main(file_name=None, station_elev=None,
         del f, axarr
     else:
         # Monte Carlo Analysis
-        # np.random.randint(0, mc_iterations, size=1)
-        b0 =  0.031 + (0.031 * 0.2) * np.random.randn(mc_iterations)
-        b1 = 0.201 + (0.201 * 0.2) * np.random.randn(mc_iterations)
-        b2 = -0.185 + (-0.185 * 0.2) * np.random.randn(mc_iterations)
-        # b0 =  0.031 + (0.031 * 0.2) * randn(mc_iterations,1)
-        # b1 = 0.201 + (0.201 * 0.2) * randn(mc_iterations,1)
-        # b2 = -0.185 + (-0.185 * 0.2) * randn(mc_iterations,1)
-
-        mc_tr_matrix = np.zeros((mc_iterations, num_lines))
-        mc_tr_monthly = np.zeros((mc_iterations, 12))
-        mc_corr_vector = np.zeros(mc_iterations)
-        mc_rmse_vector = np.zeros(mc_iterations)
-        mc_pct_bias_vector = np.zeros(mc_iterations)
-        # mc_log10_bias_vector = np.zeros(mc_iterations)
-
         logging.info('\nMonte Carlo Iterations: {0}'.format(mc_iterations))
-        mc_clock = clock()
-        rmse_min = 1000
-        mc_width = len(str(mc_iterations))
-        logging.debug(
-            ('  {0:>{width}s}  {1:>8s}  {2:>8s} {3:>8s} {4:>8s}').format(
-             'MC', 'RMSE', 'B0', 'B1', 'B2', width=mc_width))
-        for mc_i in range(mc_iterations):
-            if mc_i % 1000 == 0:
-                 logging.info('  {0:>{width}d}'.format(
-                    mc_i, width=mc_width))
-            # logging.debug("{0} {1} {2}".format(b0[mc_i], b1[mc_i], b2[mc_i]))
-            # Eqn 15 Empirical fitting coefficient
-            b = b0[mc_i] + b1[mc_i] * np.exp(b2[mc_i] * data_pd[tdelta_col].values)
-            # Eqn 14 Empirical solar radiation [watts]
-            rs_tr = rso_d * (1 - 0.9 * np.exp(
-                -1 * b * data_pd[tdelta_col].values ** 1.5))
-            mc_tr_matrix[mc_i,:] = rs_tr
-            for month_i, month in enumerate(range(1, 13)):
-                month_mask = data_pd[month_col].values == month
-                mc_tr_monthly[mc_i, month_i] = np.nanmean(
-                    mc_tr_matrix[mc_i][month_mask])
-            mc_corr_vector[mc_i] = np.corrcoef(
-                rs_monthly[rs_month_col].values, mc_tr_monthly[mc_i, :])[0, 1]
-            mc_rmse_vector[mc_i] = rmse(rs_meas, mc_tr_matrix[mc_i, :])
-            mc_pct_bias_vector[mc_i] = pct_bias(mc_tr_matrix[mc_i, :], rs_meas)
-            # mc_log10_bias_vector[mc_i] = log10_bias(mc_tr_matrix[mc_i,:], rs_meas)
-
-            if mc_rmse_vector[mc_i] < rmse_min:
-                rmse_min = float(mc_rmse_vector[mc_i])
-                logging.debug(
-                    '  {0:>{width}d}  {1:.6f}  {2:.6f} {3:.6f} {4:.6f}'.format(
-                        mc_i, rmse_min, b0[mc_i], b1[mc_i], b2[mc_i],
-                        width=mc_width))
-
-        logging.debug('  {0} seconds\n'.format(clock() - mc_clock))
+        mc = monte_carlo(
+            rso_d, data_pd[tdelta_col].values, data_pd[month_col].values,
+            rs_meas, rs_monthly[rs_month_col].values, mc_iterations,
+            mc_memory=mc_memory)
+        b0, b1, b2 = mc['b0'], mc['b1'], mc['b2']
+        mc_tr_monthly = mc['tr_monthly']
+        mc_corr_vector, mc_rmse_vector = mc['corr'], mc['rmse']
 
         # FIND OPTIMIZED VALUES
         mc_max_corr_index = np.nanargmax(mc_corr_vector)
         mc_min_rmse_index = np.nanargmin(mc_rmse_vector)
         # mc_min_bias_index = np.nanargmin(mc_pct_bias_vector)
 
-        mc_corr_ratio_vector = mc_tr_matrix[mc_max_corr_index, :]
-        mc_rmse_ratio_vector = mc_tr_matrix[mc_min_rmse_index, :]
+        # Convergence of the search
+        for mc_i in sorted(set(
+                [n - 1 for n in [10, 100, 1000, 10000, 100000]
+                 if n < mc_iterations] + [mc_iterations - 1])):
+            logging.debug(
+                ('  After {0} iterations: RMSE {1:.6f}, ' +
+                 'correlation {2:.6f}').format(
+                    mc_i + 1, mc['rmse_best'][mc_i], mc['corr_best'][mc_i]))
+
+        # Only the daily estimates of the optimized coefficients are kept
+        mc_corr_ratio_vector = thornton_running(
+            rso_d, data_pd[tdelta_col].values, b0[mc_max_corr_index],
+            b1[mc_max_corr_index], b2[mc_max_corr_index])
+        mc_rmse_ratio_vector = thornton_running(
+            rso_d, data_pd[tdelta_col].values, b0[mc_min_rmse_index],
+            b1[mc_min_rmse_index], b2[mc_min_rmse_index])
 
         avg_diff_standard = np.nanmean(rs_standard_tr / rs_meas)
         avg_diff_corr_opt = np.nanmean(mc_corr_ratio_vector / rs_meas)
@@ -504,14 +435,13 @@ def main(file_name=None, station_elev=None,
 
         # Daily Optimized vs Measured
         axarr[1, 1].scatter(
-            rs_meas, mc_tr_matrix[mc_min_rmse_index, :],
+            rs_meas, mc_rmse_ratio_vector,
             s=2, c='b', alpha=0.3)
         axarr[1, 1].set_ylabel('Estimated (w/m2)')
         axarr[1, 1].set_xlabel('Observed (w/m2)')
         axarr[1, 1].set_title('Daily Optimized vs Measured')
         lsrl_optimized_eqn = np.polyfit(
-            rs_meas[rs_mask], mc_tr_matrix[mc_min_rmse_index, :][rs_mask],
-            deg=1)
+            rs_meas[rs_mask], mc_rmse_ratio_vector[rs_mask], deg=1)
         axarr[1, 1].plot(
             rs_meas[rs_mask],
             lsrl_optimized_eqn[0] * rs_meas[rs_mask] + lsrl_optimized_eqn[1],
@@ -531,6 +461,432 @@ def main(file_name=None, station_elev=None,
     raw_input('Press ENTER to close')
 
 
+def main_batch(station_path, output_path=None, mc_iterations=1000,
+               mp_procs=1, seed=None, mc_memory=256):
+    """Optimize the Thornton-Running coefficients of many stations
+
+    The station table is a CSV file with the STATION_ID, FILE, ELEV, LAT
+    and LON fields (FILE is relative to the station table folder).  The
+    optimized coefficients of all of the stations are written to a single
+    CSV file.
+
+    Args:
+        station_path (str): station table file path
+        output_path (str): output coefficients file path
+            (default is <station table name>_tr_coefficients.csv)
+        mc_iterations (int): number of Monte Carlo iterations per station
+        mp_procs (int): number of cores to use for multiprocessing
+        seed (int): random seed (each station uses seed + station index)
+        mc_memory (float): Monte Carlo memory budget of each process [MB]
+
+    Returns:
+        None
+    """
+    logging.info('\nOptimizing Thornton-Running Coefficients (batch)\n')
+    logging.info('  Station table: {}'.format(station_path))
+    station_ws = os.path.dirname(os.path.abspath(station_path))
+    if output_path is None:
+        output_path = os.path.join(
+            station_ws, os.path.splitext(os.path.basename(station_path))[0] +
+            '_tr_coefficients.csv')
+
+    # Station table field names are not case sensitive
+    station_pd = pd.read_csv(station_path, sep=',')
+    station_pd.columns = [str(c).strip().upper() for c in station_pd.columns]
+    for field in ['STATION_ID', 'FILE', 'ELEV', 'LAT', 'LON']:
+        if field not in station_pd.columns:
+            logging.error(
+                '\nERROR: The station table must have a {} field'.format(
+                    field))
+            return False
+
+    station_args_list = []
+    for station_i, station in enumerate(station_pd.to_dict('records')):
+        file_path = os.path.join(station_ws, str(station['FILE']).strip())
+        if not os.path.isfile(file_path):
+            logging.warning('  {} - {} doesn\'t exist, skipping'.format(
+                station['STATION_ID'], file_path))
+            continue
+        station_args_list.append([
+            str(station['STATION_ID']), file_path, float(station['ELEV']),
+            float(station['LAT']), int(mc_iterations),
+            None if seed is None else seed + station_i, mc_memory])
+    logging.info('  Stations: {}'.format(len(station_args_list)))
+    logging.info('  Monte Carlo Iterations: {}\n'.format(mc_iterations))
+
+    if mp_procs > 1 and len(station_args_list) > 1:
+        pool = mp.Pool(min(mp_procs, len(station_args_list)))
+        results = pool.imap(optimize_station_mp, station_args_list)
+        pool.close()
+    else:
+        results = (optimize_station(*args) for args in station_args_list)
+
+    output_list = []
+    for station_row in results:
+        logging.info(
+            ('  {STATION_ID}  b0 = {B0:.6f}, b1 = {B1:.6f}, b2 = {B2:.6f}' +
+             '  RMSE = {RMSE:.6f} (standard {STANDARD_RMSE:.6f})').format(
+                **station_row))
+        output_list.append(station_row)
+
+    output_fields = [
+        'STATION_ID', 'DAYS', 'ITERATIONS', 'B0', 'B1', 'B2', 'RMSE', 'CORR',
+        'PCT_BIAS', 'B0_CORR', 'B1_CORR', 'B2_CORR', 'CORR_MAX',
+        'STANDARD_RMSE', 'STANDARD_CORR', 'STANDARD_PCT_BIAS']
+    pd.DataFrame(output_list, columns=output_fields).to_csv(
+        output_path, sep=',', index=False, float_format='%.6f')
+    logging.info('\n  Coefficients: {}'.format(output_path))
+    return True
+
+
+def optimize_station_mp(tup):
+    """Pool multiprocessing friendly optimize_station function"""
+    return optimize_station(*tup)
+
+
+def optimize_station(station_id, file_path, station_elev, station_lat,
+                     mc_iterations, seed=None, mc_memory=256):
+    """Monte Carlo optimization of a single station (without plots)
+
+    Args:
+        station_id (str): station ID
+        file_path (str): station data file path (Excel, CSV or Parquet)
+        station_elev (float): station elevation [m]
+        station_lat (float): station latitude [decimal degrees]
+        mc_iterations (int): number of Monte Carlo iterations
+        seed (int): random seed
+        mc_memory (float): Monte Carlo memory budget [MB]
+
+    Returns:
+        dict of the optimized coefficients and statistics
+    """
+    # Column names
+    month_col = 'Month'
+    doy_col = 'DOY'
+    tdelta_col = 'Tdelta'
+    tmonth_col = 'Tmonth'
+    rs_month_col = 'Rs_month'
+    rs_col = 'Rs_MJ_m2'
+
+    data_pd = read_station_data(file_path)
+    data_pd, p = prep_station_data(data_pd, station_elev)
+    ea = actual_vapor_pressure(data_pd)
+    rso_d, rs_standard_tr = emprso_w_tr.emprso_w_tr(
+        station_lat, p, ea, data_pd[doy_col].values,
+        data_pd[tmonth_col].values, data_pd[tdelta_col].values,
+        b0=0.031, b1=0.201, b2=-0.185)
+    rs_meas = data_pd[rs_col].values
+    data_pd, rs_monthly = monthly_rs(data_pd)
+    rs_monthly = rs_monthly[rs_month_col].values
+
+    # Standard coefficient statistics
+    month_array = data_pd[month_col].values
+    rs_tr_standard_monthly = np.array([
+        np.nanmean(rs_standard_tr[month_array == month])
+        for month in range(1, 13)])
+
+    mc = monte_carlo(
+        rso_d, data_pd[tdelta_col].values, month_array, rs_meas, rs_monthly,
+        mc_iterations, rng=np.random.RandomState(seed), mc_memory=mc_memory)
+    rmse_i = np.nanargmin(mc['rmse'])
+    corr_i = np.nanargmax(mc['corr'])
+    return {
+        'STATION_ID': station_id, 'DAYS': len(data_pd.index),
+        'ITERATIONS': mc_iterations,
+        'B0': mc['b0'][rmse_i], 'B1': mc['b1'][rmse_i],
+        'B2': mc['b2'][rmse_i], 'RMSE': mc['rmse'][rmse_i],
+        'CORR': mc['corr'][rmse_i], 'PCT_BIAS': mc['pct_bias'][rmse_i],
+        'B0_CORR': mc['b0'][corr_i], 'B1_CORR': mc['b1'][corr_i],
+        'B2_CORR': mc['b2'][corr_i], 'CORR_MAX': mc['corr'][corr_i],
+        'STANDARD_RMSE': rmse(rs_standard_tr, rs_meas),
+        'STANDARD_CORR': np.corrcoef(rs_monthly, rs_tr_standard_monthly)[0, 1],
+        'STANDARD_PCT_BIAS': pct_bias(rs_standard_tr, rs_meas)}
+
+
+def read_station_data(file_path):
+    """Read the daily station data
+
+    The Excel files are read from Sheet1.  The CSV and Parquet files can
+    have the same Month, Day and Year columns as the Excel files or a Date
+    column.  Missing values are -999.
+
+    Args:
+        file_path (str): station data file path
+
+    Returns:
+        DataFrame indexed by date with Year, Month, Day and DOY columns
+    """
+    # Column names
+    year_col = 'Year'
+    month_col = 'Month'
+    day_col = 'Day'
+    doy_col = 'DOY'
+
+    file_ext = os.path.splitext(file_path)[1].lower()
+    if file_ext in ['.xls', '.xlsx']:
+        data_pd = pd.read_excel(file_path, 'Sheet1', na_values=['-999'])
+    elif file_ext == '.parquet':
+        data_pd = pd.read_parquet(file_path)
+        data_pd[data_pd == -999] = np.nan
+    else:
+        data_pd = pd.read_csv(file_path, sep=',', na_values=['-999'])
+
+    if 'Date' in data_pd.columns:
+        data_pd['Date'] = pd.to_datetime(data_pd['Date'])
+    else:
+        data_pd['Date'] = pd.to_datetime(dict(
+            year=data_pd[year_col], month=data_pd[month_col],
+            day=data_pd[day_col]))
+    data_pd = data_pd.set_index('Date')
+
+    # Assign month and DOY columns to the data frame
+    data_pd[year_col] = data_pd.index.year
+    data_pd[month_col] = data_pd.index.month
+    data_pd[day_col] = data_pd.index.day
+    data_pd[doy_col] = data_pd.index.dayofyear
+    return data_pd
+
+
+def prep_station_data(data_pd, station_elev, rs_watts_flag=False):
+    """Compute the pressure, Tdelta and mean monthly Tdelta
+
+    Args:
+        data_pd (DataFrame): daily station data (see read_station_data())
+        station_elev (float): station elevation [m]
+        rs_watts_flag (bool): if True, convert Rs from watts to MJ m-2 d-1
+
+    Returns:
+        tuple of the updated DataFrame and the pressure [kPa]
+    """
+    # Column names
+    month_col = 'Month'
+    tdelta_col = 'Tdelta'
+    tmonth_col = 'Tmonth'
+    tmax_col = 'TmaxC'
+    tmin_col = 'TminC'
+    rs_col = 'Rs_MJ_m2'
+
+    # Compute pressure kPa
+    p = (2.406 - 0.0000534 * station_elev) ** 5.26
+
+    # FAO converting watts into mj m2 d
+    if rs_watts_flag:
+        data_pd[rs_col] *= 0.0864
+
+    # Mean monthly difference between Tmax and Tmin for T-R
+    data_pd[tdelta_col] = data_pd[tmax_col] - data_pd[tmin_col]
+    tdelta_monthly = data_pd[[month_col,tdelta_col]].groupby(month_col).mean()
+    tdelta_monthly.rename(columns={tdelta_col:tmonth_col}, inplace=True)
+    tdelta_monthly.reset_index(level=0, inplace=True)
+    # tdelta_monthly[month_col] = df.index
+
+    # Join mean monthly tdelta back to main table
+    # Date index is dropped by merge, so save it before merging
+    data_pd = data_pd.reset_index()
+    data_pd = pd.merge(data_pd, tdelta_monthly, on=month_col)
+    data_pd = data_pd.set_index('Date')
+
+    # Apply Limits on Variables, rhmax, rhmin, tmax, tmin, rs, wind, rh
+    data_pd[data_pd[tmax_col] < -40] = np.nan
+    data_pd[data_pd[tmax_col] > 60] = np.nan
+    data_pd[data_pd[tmin_col] < -40] = np.nan
+    data_pd[data_pd[tmin_col] > 60] = np.nan
+    # rhmax[rhmax < -40] = np.nan
+    # rhmax[rhmax >= 60] = np.nan
+    # rhmin[rhmin < -40] = np.nan
+    # rhmin[rhmin >= 60] = np.nan
+
+    return data_pd, p
+
+
+def actual_vapor_pressure(data_pd):
+    """Actual vapor pressure [kPa] from the dew point temperature"""
+    tdew_col = 'TdewC'
+    return 0.6108 * np.exp(
+        (17.27 * data_pd[tdew_col]) / (data_pd[tdew_col] + 237.3))
+
+
+def monthly_rs(data_pd):
+    """Join the mean monthly measured Rs to the daily data
+
+    Returns:
+        tuple of the updated DataFrame and the mean monthly Rs DataFrame
+    """
+    # Column names
+    month_col = 'Month'
+    rs_month_col = 'Rs_month'
+    rs_col = 'Rs_MJ_m2'
+
+    rs_monthly = data_pd[[month_col, rs_col]].groupby(month_col).mean()
+    rs_monthly.rename(columns={rs_col: rs_month_col}, inplace=True)
+    rs_monthly.reset_index(level=0, inplace=True)
+
+    # Join mean monthly Rs back to main table
+    data_pd = data_pd.reset_index()
+    data_pd = pd.merge(data_pd, rs_monthly, on=month_col)
+    data_pd = data_pd.set_index('Date')
+    return data_pd, rs_monthly
+
+
+def monte_carlo(rso_d, tdelta, month_array, rs_meas, rs_monthly,
+                mc_iterations, rng=None, mc_memory=256):
+    """Monte Carlo search of the Thornton-Running coefficients
+
+    The coefficients are sampled from normal distributions around the
+    standard coefficients (20% standard deviation).  The candidates are
+    evaluated in chunks as 2D (candidate x day) arrays with the statistics
+    computed for each candidate row.  The chunk size is set so that the
+    chunk arrays fit in the memory budget.
+
+    Args:
+        rso_d (array): daily clear sky solar radiation
+        tdelta (array): daily Tmax - Tmin
+        month_array (array): month of each day
+        rs_meas (array): daily measured solar radiation
+        rs_monthly (array): mean monthly measured solar radiation
+        mc_iterations (int): number of parameter sets
+        rng (RandomState): random number generator
+            (default is the global NumPy generator)
+        mc_memory (float): memory budget of the chunk arrays [MB]
+
+    Returns:
+        dict of the coefficient and statistic arrays
+            The rmse_best and corr_best arrays are the best RMSE and
+            correlation after each iteration (for tracking convergence)
+    """
+    if rng is None:
+        rng = np.random
+    num_lines = len(rso_d)
+
+    # np.random.randint(0, mc_iterations, size=1)
+    b0 =  0.031 + (0.031 * 0.2) * rng.randn(mc_iterations)
+    b1 = 0.201 + (0.201 * 0.2) * rng.randn(mc_iterations)
+    b2 = -0.185 + (-0.185 * 0.2) * rng.randn(mc_iterations)
+    # b0 =  0.031 + (0.031 * 0.2) * randn(mc_iterations,1)
+    # b1 = 0.201 + (0.201 * 0.2) * randn(mc_iterations,1)
+    # b2 = -0.185 + (-0.185 * 0.2) * randn(mc_iterations,1)
+
+    mc_tr_monthly = np.full((mc_iterations, 12), np.nan)
+    mc_corr_vector = np.zeros(mc_iterations)
+    mc_rmse_vector = np.zeros(mc_iterations)
+    mc_pct_bias_vector = np.zeros(mc_iterations)
+
+    # Days without an estimate are skipped by all of the statistics
+    # The days are sorted by month so each month is a contiguous block
+    rs_meas = np.asarray(rs_meas, dtype=np.float64)
+    rs_meas_sum = np.nansum(rs_meas)
+    day_mask = np.isfinite(rso_d) & np.isfinite(tdelta)
+    # Tdelta ** 1.5 is undefined on days with Tmin > Tmax
+    day_mask[day_mask] = tdelta[day_mask] >= 0
+    day_i = np.flatnonzero(day_mask)[
+        np.argsort(month_array[day_mask], kind='mergesort')]
+    rso_d = rso_d[day_i]
+    # The empirical fitting only depends on Tdelta, so it is computed once
+    #   for each unique Tdelta value and then mapped to the days
+    tdelta, tdelta_index = np.unique(tdelta[day_i], return_inverse=True)
+    tdelta_15 = tdelta ** 1.5
+    rs_meas = rs_meas[day_i]
+    month_array = month_array[day_i]
+    month_list, month_start, month_count = np.unique(
+        month_array, return_index=True, return_counts=True)
+    month_index = month_list.astype(np.int64) - 1
+
+    # RMSE and bias only use the days with a measurement
+    meas_mask = np.isfinite(rs_meas)
+    if np.all(meas_mask):
+        meas_mask = slice(None)
+    rs_meas = rs_meas[meas_mask]
+    rs_meas_valid_sum = np.sum(rs_meas)
+
+    rs_monthly_diff = rs_monthly - np.mean(rs_monthly)
+    rs_monthly_ss = np.sum(rs_monthly_diff ** 2)
+
+    # Roughly 2 candidate x day float64 arrays are in memory at once
+    chunk_size = int(mc_memory * 2 ** 20 // (2 * 8 * max(len(day_i), 1)))
+    chunk_size = min(max(chunk_size, 1), mc_iterations)
+    logging.debug('  Chunk size: {0}'.format(chunk_size))
+
+    mc_clock = clock()
+    mc_width = len(str(mc_iterations))
+    logging.debug(
+        ('  {0:>{width}s}  {1:>8s}  {2:>8s}').format(
+         'MC', 'RMSE', 'CORR', width=mc_width))
+    for mc_i in range(0, mc_iterations, chunk_size):
+        mc_j = min(mc_i + chunk_size, mc_iterations)
+
+        # Eqn 15 Empirical fitting coefficient
+        tr_factor = np.multiply.outer(b2[mc_i:mc_j], tdelta)
+        np.exp(tr_factor, out=tr_factor)
+        tr_factor *= b1[mc_i:mc_j, None]
+        tr_factor += b0[mc_i:mc_j, None]
+        # Eqn 14 Empirical solar radiation [watts]
+        tr_factor *= -tdelta_15
+        np.exp(tr_factor, out=tr_factor)
+        tr_factor *= -0.9
+        tr_factor += 1
+        rs_tr = np.take(tr_factor, tdelta_index, axis=1)
+        rs_tr *= rso_d
+        del tr_factor
+
+        if len(month_start):
+            mc_tr_monthly[mc_i:mc_j, month_index] = np.add.reduceat(
+                rs_tr, month_start, axis=1) / month_count
+
+        # Correlation of the mean monthly values
+        tr_monthly_diff = (
+            mc_tr_monthly[mc_i:mc_j] -
+            np.mean(mc_tr_monthly[mc_i:mc_j], axis=1)[:, None])
+        mc_corr_vector[mc_i:mc_j] = np.clip(
+            np.sum(tr_monthly_diff * rs_monthly_diff, axis=1) / np.sqrt(
+                np.sum(tr_monthly_diff ** 2, axis=1) * rs_monthly_ss),
+            -1, 1)
+
+        # RMSE and percent bias (see rmse() and pct_bias())
+        # The estimates aren't needed after this, so the difference is
+        #   computed in place when all of the days have a measurement
+        rs_diff = rs_tr[:, meas_mask]
+        rs_diff -= rs_meas
+        mc_pct_bias_vector[mc_i:mc_j] = (
+            100 * np.sum(rs_diff, axis=1) / rs_meas_sum)
+        rs_diff *= rs_diff
+        mc_rmse_vector[mc_i:mc_j] = np.sqrt(
+            np.sum(rs_diff, axis=1) / rs_meas_valid_sum)
+        del rs_tr, rs_diff
+
+        logging.debug(
+            '  {0:>{width}d}  {1:.6f}  {2:.6f}'.format(
+                mc_j, np.nanmin(mc_rmse_vector[:mc_j]),
+                np.nanmax(mc_corr_vector[:mc_j]), width=mc_width))
+
+    logging.debug('  {0} seconds\n'.format(clock() - mc_clock))
+
+    return {
+        'b0': b0, 'b1': b1, 'b2': b2, 'tr_monthly': mc_tr_monthly,
+        'corr': mc_corr_vector, 'rmse': mc_rmse_vector,
+        'pct_bias': mc_pct_bias_vector,
+        'rmse_best': np.fmin.accumulate(mc_rmse_vector),
+        'corr_best': np.fmax.accumulate(mc_corr_vector)}
+
+
+def thornton_running(rso_d, tdelta, b0, b1, b2):
+    """Thornton-Running empirical solar radiation for a single parameter set
+
+    Args:
+        rso_d (array): daily clear sky solar radiation
+        tdelta (array): daily Tmax - Tmin
+        b0 (float):
+        b1 (float):
+        b2 (float):
+
+    Returns:
+        array
+    """
+    # Eqn 15 Empirical fitting coefficient
+    b = b0 + b1 * np.exp(b2 * tdelta)
+    # Eqn 14 Empirical solar radiation [watts]
+    return rso_d * (1 - 0.9 * np.exp(-1 * b * tdelta ** 1.5))
+
+
 def rmse(data, estimate):
     """Function to calculate root mean square error from a data vector or matrix
       and the corresponding estimates.
@@ -575,6 +931,22 @@ def parse_args():
     parser.add_argument(
         '-mc', '--iter', type=int, metavar='N',
         help='Monte Carlo iterations')
+    parser.add_argument(
+        '--memory', default=256, type=float, metavar='MB',
+        help='Monte Carlo memory budget [MB]')
+    parser.add_argument(
+        '--stations', metavar='PATH',
+        help='Station table (STATION_ID, FILE, ELEV, LAT, LON) for batch mode')
+    parser.add_argument(
+        '--output', metavar='PATH',
+        help='Batch mode output coefficients file')
+    parser.add_argument(
+        '--seed', type=int, metavar='N',
+        help='Batch mode random seed')
+    parser.add_argument(
+        '-mp', '--multiprocessing', default=1, type=int,
+        metavar='N', nargs='?', const=mp.cpu_count(),
+        help='Number of processers to use (batch mode)')
     parser.add_argument(
         '-c', '--compare', default=False, action="store_true",
         help='Comparison Flag')
@@ -592,6 +964,8 @@ def parse_args():
     # Convert relative paths to absolute paths
     if args.file and os.path.isfile(os.path.abspath(args.file)):
         args.file = os.path.abspath(args.file)
+    if args.stations and os.path.isfile(os.path.abspath(args.stations)):
+        args.stations = os.path.abspath(args.stations)
     return args
 
 
@@ -606,7 +980,18 @@ if __name__ == '__main__':
     # logging.info(log_f.format('Current Directory:', args.workspace))
     # logging.info(log_f.format('Script:', os.path.basename(sys.argv[0])))
 
-    main(file_name=args.file, station_elev=args.elev,
-         station_lat=args.lat, station_lon=args.lon,
-         comparison_flag=args.compare, mc_iterations=args.iter,
-         debug_flag=args.debug)
+    if args.stations:
+        logging.basicConfig(
+            level=logging.DEBUG if args.debug else logging.INFO,
+            format='%(message)s')
+        if not main_batch(
+                station_path=args.stations, output_path=args.output,
+                mc_iterations=args.iter if args.iter else 1000,
+                mp_procs=args.multiprocessing, seed=args.seed,
+                mc_memory=args.memory):
+            sys.exit(1)
+    else:
+        main(file_name=args.file, station_elev=args.elev,
+             station_lat=args.lat, station_lon=args.lon,
+             comparison_flag=args.compare, mc_iterations=args.iter,
+             mc_memory=args.memory, debug_flag=args.debug)
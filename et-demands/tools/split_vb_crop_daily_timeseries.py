@@ -7,7 +7,9 @@
 #--------------------------------
 
 import argparse
+from collections import OrderedDict
 import datetime as dt
+from itertools import islice
 import logging
 import os
 import re
@@ -18,12 +20,16 @@ import pandas as pd
 
 
 def main(pmdata_ws, start_date=None, end_date=None, niwr_flag=False,
-         kc_flag=False, crop_name_flag=False, overwrite_flag=True):
+         kc_flag=False, crop_name_flag=False, overwrite_flag=True,
+         chunk_rows=10000, max_open_files=32):
     """Split full daily data by crop
 
     For now, scipt will assume it is run in the project/basin folder and will
         look for a PMData sub-folder
 
+    The daily files are read in chunks of rows and each chunk is appended
+        to the crop files, so memory use doesn't depend on the file size
+
     Args:
         pmdata_ws (str):
         start_date (str): ISO format date string (YYYY-MM-DD)
@@ -32,6 +38,8 @@ def main(pmdata_ws, start_date=None, end_date=None, niwr_flag=False,
         kc_flag (bool): If True, compute daily Kc
         crop_name_flag (bool): If True, include crop name as first line in file
         overwrite_flag (bool): If True, overwrite existing files
+        chunk_rows (int): number of rows read from the daily files at once
+        max_open_files (int): maximum number of open crop output files
 
     Returns:
         None
@@ -141,8 +149,7 @@ def main(pmdata_ws, start_date=None, end_date=None, niwr_flag=False,
 
         # Read in file header
         with open(file_path, 'r') as f:
-            header_list = f.readlines()[:header_lines]
-        f.close()
+            header_list = list(islice(f, header_lines))
 
         # Parse crop list (split on Crop:, remove white space)
         # Split on "Crop:" but skip first item (number of crops)
@@ -168,48 +175,14 @@ def main(pmdata_ws, start_date=None, end_date=None, niwr_flag=False,
             for item in f_crop_list]
         logging.debug('\nCrops: \n{0}'.format(f_crop_list))
 
-        # Read data from file into record array (structured array)
-        try:
-            data = np.genfromtxt(
-                file_path, skip_header=(header_lines - 1), names=True)
-        except ValueError:
-            data = np.genfromtxt(
-                file_path, skip_header=(header_lines - 1), names=True,
-                delimiter=',')
-        logging.debug('\nFields: \n{0}'.format(data.dtype.names))
-
-        # Build list of unique years
-        year_sub_array = np.unique(data[year_field].astype(np.int))
-        logging.debug('\nAll Years: \n{0}'.format(year_sub_array.tolist()))
-        # Only keep years between year_start and year_end
-        if year_start:
-            year_sub_array = year_sub_array[(year_start <= year_sub_array)]
-        if year_end:
-            year_sub_array = year_sub_array[(year_sub_array <= year_end)]
-        logging.debug(
-            '\nPlot Years: \n{0}'.format(year_sub_array.tolist()))
-        date_mask = np.in1d(
-            data[year_field].astype(np.int), year_sub_array)
-
-        # Build separate arrays for each field of non-crop specific data
-        doy_array = data[doy_field][date_mask].astype(np.int)
-        year_array = data[year_field][date_mask].astype(np.int)
-        month_array = data[month_field][date_mask].astype(np.int)
-        day_array = data[day_field][date_mask].astype(np.int)
-        pmeto_array = data[pmeto_field][date_mask]
-        precip_array = data[precip_field][date_mask]
-        t30_array = data[t30_field][date_mask]
-        dt_array = np.array([
-            dt.datetime(int(year), int(month), int(day))
-            for year, month, day in zip(year_array, month_array, day_array)])
-
-        # Remove leap days
-        # leap_array = (doy_array == 366)
-        # doy_sub_array = np.delete(doy_array, np.where(leap_array)[0])
+        # Field names (repeated crop fields are numbered like genfromtxt)
+        field_list = header_fields(header_list[header_lines - 1])
+        logging.debug('\nFields: \n{0}'.format(field_list))
 
         # Process each crop
         # f_crop_i is based on order of crops in the file
         # crop_i is based on a sorted index of the user crop_list
+        crop_output_list = []
         for f_crop_i, (crop_num, crop_name) in enumerate(f_crop_list):
             logging.debug('  Crop: {0} ({1})'.format(crop_name, crop_num))
             if crop_num in crop_skip_list:
@@ -231,98 +204,205 @@ def main(pmdata_ws, start_date=None, end_date=None, niwr_flag=False,
 
             # Field names are built based on the crop i value
             if f_crop_i == 0:
-                etact_sub_field = etact_field
-                etpot_sub_field = etpot_field
-                etbas_sub_field = etbas_field
-                irrig_sub_field = irrig_field
-                season_sub_field = season_field
-                runoff_sub_field = runoff_field
-                dperc_sub_field = dperc_field
+                crop_fields = {
+                    'ETact': etact_field, 'ETpot': etpot_field,
+                    'ETbas': etbas_field, 'Irrigation': irrig_field,
+                    'Season': season_field, 'Runoff': runoff_field,
+                    'DPerc': dperc_field}
             else:
-                etact_sub_field = '{0}_{1}'.format(etact_field, f_crop_i)
-                etpot_sub_field = '{0}_{1}'.format(etpot_field, f_crop_i)
-                etbas_sub_field = '{0}_{1}'.format(etbas_field, f_crop_i)
-                irrig_sub_field = '{0}_{1}'.format(irrig_field, f_crop_i)
-                season_sub_field = '{0}_{1}'.format(season_field, f_crop_i)
-                runoff_sub_field = '{0}_{1}'.format(runoff_field, f_crop_i)
-                dperc_sub_field = '{0}_{1}'.format(dperc_field, f_crop_i)
-
-            # Remove leap days
-            # etact_sub_array = np.delete(etact_array, np.where(leap_array)[0])
-            # niwr_sub_array = np.delete(niwr_array, np.where(leap_array)[0])
+                crop_fields = {
+                    'ETact': '{0}_{1}'.format(etact_field, f_crop_i),
+                    'ETpot': '{0}_{1}'.format(etpot_field, f_crop_i),
+                    'ETbas': '{0}_{1}'.format(etbas_field, f_crop_i),
+                    'Irrigation': '{0}_{1}'.format(irrig_field, f_crop_i),
+                    'Season': '{0}_{1}'.format(season_field, f_crop_i),
+                    'Runoff': '{0}_{1}'.format(runoff_field, f_crop_i),
+                    'DPerc': '{0}_{1}'.format(dperc_field, f_crop_i)}
 
             # Timeseries figures of daily data
             output_name = '{0}_daily_crop_{1:02d}.csv'.format(
                 station, int(crop_num))
             output_path = os.path.join(output_ws, output_name)
-
-            # Build an output data frame
-            output_dict = {
-                'Date': dt_array, 'DOY': doy_array,
-                # 'T30':t30_array,
-                'PMETo': pmeto_array,
-                'ETact': data[etact_sub_field][date_mask],
-                'ETpot': data[etpot_sub_field][date_mask],
-                'ETbas': data[etbas_sub_field][date_mask],
-                'PPT': precip_array,
-                'Irrigation': data[irrig_sub_field][date_mask],
-                'Runoff': data[runoff_sub_field][date_mask],
-                'DPerc': data[dperc_sub_field][date_mask],
-                'Season': data[season_sub_field][date_mask].astype(np.int)}
-            output_df = pd.DataFrame(output_dict)
-            output_df.set_index('Date', inplace=True)
-
-            # NIWR is ET - precip + runoff + deep percolation
-            output_df['NIWR'] = output_df['ETact'] - (precip_array - output_df['Runoff'])
-            # Only include deep percolation when not irrigating
-            irrig_mask = output_df['Irrigation'] == 0
-            output_df.loc[irrig_mask, 'NIWR'] += output_df.loc[irrig_mask, 'DPerc']
-            del irrig_mask
-
-            # Crop coefficients
-            output_df['Kc'] = output_df['ETact'] / pmeto_array
-            output_df['Kcb'] = output_df['ETbas'] / pmeto_array
-
-            # Format the output columns
-            output_df['Year'] = output_df.index.year
-            output_df['Month'] = output_df.index.month
-            output_df['Day'] = output_df.index.day
-            output_df['Year'] = output_df['Year'].map(lambda x: ' %4d' % x)
-            output_df['Month'] = output_df['Month'].map(lambda x: ' %2d' % x)
-            output_df['Day'] = output_df['Day'].map(lambda x: ' %2d' % x)
-            output_df['DOY'] = output_df['DOY'].map(lambda x: ' %3d' % x)
-            # This will convert negative "zeros" to positive
-            output_df['NIWR'] = np.round(output_df['NIWR'], 6)
-            output_df['Season'] = output_df['Season'].map(lambda x: ' %1d' % x)
-
-            # Order the output columns
-            output_columns = [
-                'Year', 'Month', 'Day', 'DOY',
-                'PMETo', 'ETact', 'ETpot', 'ETbas',
-                'Kc', 'Kcb', 'PPT', 'Irrigation', 'Runoff',
-                'DPerc', 'NIWR', 'Season']
-            if not kc_flag:
-                output_columns.remove('Kc')
-                output_columns.remove('Kcb')
-            if not niwr_flag:
-                output_columns.remove('NIWR')
-            # output_df =  output_df[output_columns]
-
-            # Write output dataframe to file
-            with open(output_path, 'w') as output_f:
-                if crop_name_flag:
-                    output_f.write(
-                        '# {0:2d} - {1}\n'.format(crop_num, crop_name))
+            crop_output_list.append(
+                (crop_num, crop_name, crop_fields, output_path))
+
+        # Order the output columns
+        output_columns = [
+            'Year', 'Month', 'Day', 'DOY',
+            'PMETo', 'ETact', 'ETpot', 'ETbas',
+            'Kc', 'Kcb', 'PPT', 'Irrigation', 'Runoff',
+            'DPerc', 'NIWR', 'Season']
+        if not kc_flag:
+            output_columns.remove('Kc')
+            output_columns.remove('Kcb')
+        if not niwr_flag:
+            output_columns.remove('NIWR')
+
+        # Read the data in chunks
+        # Floats are parsed exactly (like genfromtxt) so values don't change
+        if ',' in header_list[header_lines - 1]:
+            delimiter_kwargs = {'sep': ','}
+        else:
+            delimiter_kwargs = {'delim_whitespace': True}
+        data_reader = pd.read_csv(
+            file_path, skiprows=header_lines, header=None, names=field_list,
+            comment='#', float_precision='round_trip', chunksize=chunk_rows,
+            **delimiter_kwargs)
+
+        # Start each crop file with the header before reading the data
+        #   so the files are always rewritten (even if no rows are in the
+        #   date range)
+        output_files = OutputFiles(max_open_files)
+        for crop_num, crop_name, crop_fields, output_path in crop_output_list:
+            output_f = output_files.get(output_path)
+            if crop_name_flag:
+                output_f.write('# {0:2d} - {1}\n'.format(crop_num, crop_name))
+            output_f.write(','.join(['Date'] + output_columns) + '\n')
+
+        for data in data_reader:
+            # Only keep years between year_start and year_end
+            year_array = data[year_field].values.astype(np.int)
+            date_mask = np.ones(len(year_array), dtype=np.bool)
+            if year_start:
+                date_mask &= (year_start <= year_array)
+            if year_end:
+                date_mask &= (year_array <= year_end)
+            if not np.any(date_mask):
+                continue
+            data = data[date_mask]
+
+            # Build separate arrays for each field of non-crop specific data
+            doy_array = data[doy_field].values.astype(np.int)
+            pmeto_array = data[pmeto_field].values
+            precip_array = data[precip_field].values
+            dt_index = pd.to_datetime(dict(
+                year=data[year_field].values.astype(np.int),
+                month=data[month_field].values.astype(np.int),
+                day=data[day_field].values.astype(np.int)))
+
+            for crop_output in crop_output_list:
+                crop_num, crop_name, crop_fields, output_path = crop_output
+                # Build an output data frame
+                output_dict = {
+                    'Date': dt_index.values, 'DOY': doy_array,
+                    'PMETo': pmeto_array, 'PPT': precip_array}
+                for output_field, data_field in crop_fields.items():
+                    output_dict[output_field] = data[data_field].values
+                output_dict['Season'] = output_dict['Season'].astype(np.int)
+                output_df = pd.DataFrame(output_dict)
+                output_df.set_index('Date', inplace=True)
+
+                # NIWR is ET - precip + runoff + deep percolation
+                output_df['NIWR'] = output_df['ETact'] - (
+                    precip_array - output_df['Runoff'])
+                # Only include deep percolation when not irrigating
+                irrig_mask = output_df['Irrigation'] == 0
+                output_df.loc[irrig_mask, 'NIWR'] += output_df.loc[
+                    irrig_mask, 'DPerc']
+                del irrig_mask
+
+                # Crop coefficients
+                output_df['Kc'] = output_df['ETact'] / pmeto_array
+                output_df['Kcb'] = output_df['ETbas'] / pmeto_array
+
+                # Format the output columns
+                output_df['Year'] = output_df.index.year
+                output_df['Month'] = output_df.index.month
+                output_df['Day'] = output_df.index.day
+                output_df['Year'] = output_df['Year'].map(lambda x: ' %4d' % x)
+                output_df['Month'] = output_df['Month'].map(
+                    lambda x: ' %2d' % x)
+                output_df['Day'] = output_df['Day'].map(lambda x: ' %2d' % x)
+                output_df['DOY'] = output_df['DOY'].map(lambda x: ' %3d' % x)
+                # This will convert negative "zeros" to positive
+                output_df['NIWR'] = np.round(output_df['NIWR'], 6)
+                output_df['Season'] = output_df['Season'].map(
+                    lambda x: ' %1d' % x)
+
+                # Append the chunk to the crop file
                 output_df.to_csv(
-                    output_f, sep=',', columns=output_columns,
-                    float_format='%10.6f', date_format='%Y-%m-%d')
-            del output_df
+                    output_files.get(output_path), sep=',',
+                    columns=output_columns, float_format='%10.6f',
+                    date_format='%Y-%m-%d', header=False)
+                del output_df
+            del data, dt_index, doy_array, pmeto_array, precip_array
+        output_files.close()
 
         # Cleanup
-        del file_path, f_crop_list, data
-        del doy_array, year_array, month_array, day_array
-        del pmeto_array, precip_array, t30_array
-        del date_mask, dt_array
+        del file_path, f_crop_list, crop_output_list, output_files
+
+
+def header_fields(header_line):
+    """Parse the field names from the daily file field name line
+
+    Repeated field names (the crop fields) are numbered starting with the
+    second instance (i.e. ETact, ETact_1, ETact_2), the same as
+    np.genfromtxt(names=True)
+
+    Args:
+        header_line (str): field name line (whitespace or comma delimited)
+
+    Returns:
+        list of field names
+    """
+    header_line = header_line.strip().lstrip('#')
+    if ',' in header_line:
+        field_list = [item.strip() for item in header_line.split(',')]
+    else:
+        field_list = header_line.split()
+    field_count = dict()
+    for field_i, field in enumerate(field_list):
+        if field in field_count.keys():
+            field_count[field] += 1
+            field_list[field_i] = '{0}_{1}'.format(field, field_count[field])
+        else:
+            field_count[field] = 0
+    return field_list
+
+
+class OutputFiles():
+    """Buffered output files with a limited number of open files
+
+    When the limit is reached, the least recently used file is closed and
+    reopened for appending the next time it is written to.  Files are
+    truncated the first time they are opened.
+    """
+    def __init__(self, max_open_files=32, buffer_size=2 ** 20):
+        """
+
+        Args:
+            max_open_files (int): maximum number of open files
+            buffer_size (int): write buffer size of each file [bytes]
+        """
+        self.max_open_files = max(int(max_open_files), 1)
+        self.buffer_size = buffer_size
+        self.open_files = OrderedDict()
+        self.started_paths = set()
+
+    def started(self, output_path):
+        """Check if the file has been opened before"""
+        return output_path in self.started_paths
+
+    def get(self, output_path):
+        """Get the open file object for the output path"""
+        if output_path in self.open_files.keys():
+            # Move the file to the end of the usage order
+            output_f = self.open_files.pop(output_path)
+            self.open_files[output_path] = output_f
+            return output_f
+        while len(self.open_files) >= self.max_open_files:
+            self.open_files.popitem(last=False)[1].close()
+        output_f = open(
+            output_path, 'a' if self.started(output_path) else 'w',
+            self.buffer_size)
+        self.started_paths.add(output_path)
+        self.open_files[output_path] = output_f
+        return output_f
+
+    def close(self):
+        """Close all of the open files"""
+        while self.open_files:
+            self.open_files.popitem(last=False)[1].close()
 
 
 def get_pmdata_workspace(workspace):
@@ -385,6 +465,12 @@ def parse_args():
     parser.add_argument(
         '--crop_name', action="store_true", default=False,
         help="Write crop name as first line in file")
+    parser.add_argument(
+        '--chunk', default=10000, type=int, metavar='N',
+        help='Number of rows read from the daily files at once')
+    parser.add_argument(
+        '--files', default=32, type=int, metavar='N',
+        help='Maximum number of open output files')
     parser.add_argument(
         '-o', '--overwrite', default=None, action="store_true",
         help='Force overwrite of existing files')
@@ -412,4 +498,5 @@ if __name__ == '__main__':
 
     main(pmdata_ws=args.workspace, start_date=args.start, end_date=args.end,
          niwr_flag=args.niwr, kc_flag=args.kc, crop_name_flag=args.crop_name,
-         overwrite_flag=args.overwrite)
+         overwrite_flag=args.overwrite, chunk_rows=args.chunk,
+         max_open_files=args.files)
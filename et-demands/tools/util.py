@@ -7,8 +7,11 @@
 #--------------------------------
 
 import argparse
+from collections import defaultdict
 import ConfigParser
+import cPickle
 import datetime as dt
+import hashlib
 from itertools import groupby
 import logging
 import os
@@ -16,6 +19,13 @@ import Tkinter
 import tkFileDialog
 import sys
 
+# The output file reader and the period statistics are shared with the
+#   Crop ET model (cropET/bin)
+sys.path.append(os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), os.pardir, 'cropET', 'bin'))
+from crop_output import read_output_frame
+from crop_stats import period_starts, period_sum
+
 
 def get_path(workspace, title_str, file_types=[('INI files', '.ini')]):
     """"""
@@ -148,6 +158,169 @@ def doy_2_date(test_year, test_doy):
         int(test_year), int(test_doy)), '%Y_%j').strftime('%Y-%m-%d')
 
 
+def read_crop_output(file_path, sep=',', usecols=None):
+    """Read a daily, monthly or annual Crop ET output file
+
+    See crop_output.read_output_frame() for the supported file formats
+
+    Args:
+        file_path (str): output file path
+        sep (str): CSV file delimiter
+        usecols (list): only read these columns (default reads all columns)
+
+    Returns:
+        tuple of the crop name and the DataFrame of the file values
+    """
+    crop_str, input_df = read_output_frame(
+        file_path, sep=sep, usecols=usecols)
+    return crop_str.split('-', 1)[1].strip(), input_df
+
+
+def cache_path(cache_ws, prefix, cache_key):
+    """Build a cache file path from a hash of the cache key
+
+    Args:
+        cache_ws (str): cache folder
+        prefix (str): file name prefix
+        cache_key (list): values the cached data depends on
+
+    Returns:
+        str
+    """
+    return os.path.join(cache_ws, '{}_{}.pkl'.format(
+        prefix, hashlib.md5(repr(cache_key)).hexdigest()[:12]))
+
+
+def file_cache_key(file_path, ext_list=None):
+    """Path, modified time and size of a file (and its sidecar files)
+
+    Args:
+        file_path (str): file path
+        ext_list (list): extensions of the files with the same base name
+            to include (i.e. ['.shp', '.dbf'])
+
+    Returns:
+        list
+    """
+    cache_key = [os.path.abspath(file_path)]
+    if ext_list is None:
+        path_list = [file_path]
+    else:
+        path_list = [
+            os.path.splitext(file_path)[0] + ext for ext in ext_list]
+    for item_path in path_list:
+        if os.path.isfile(item_path):
+            cache_key.extend([
+                os.path.getmtime(item_path), os.path.getsize(item_path)])
+    return cache_key
+
+
+def read_cache(cache_path, cache_key):
+    """Read a pickled cache file
+
+    Args:
+        cache_path (str): cache file path
+        cache_key (list): values the cached data depends on
+
+    Returns:
+        the cached data or None if the file doesn't exist, can't be read
+            or was written for a different key
+    """
+    if not os.path.isfile(cache_path):
+        return None
+    try:
+        with open(cache_path, 'rb') as cache_f:
+            cache = cPickle.load(cache_f)
+        if cache['key'] == cache_key:
+            return cache['data']
+    except Exception:
+        logging.debug('  {} could not be read'.format(
+            os.path.basename(cache_path)))
+    return None
+
+
+def write_cache(cache_path, cache_key, cache_data):
+    """Write a pickled cache file (see read_cache())"""
+    if not os.path.isdir(os.path.dirname(cache_path)):
+        os.makedirs(os.path.dirname(cache_path))
+    with open(cache_path, 'wb') as cache_f:
+        cPickle.dump(
+            {'key': cache_key, 'data': cache_data}, cache_f,
+            cPickle.HIGHEST_PROTOCOL)
+
+
+def read_cell_geometry(cells_path, cell_id_field, simplify_tol=None,
+                       cache_ws=None):
+    """Read the polygons and attributes of a shapefile with fiona and shapely
+
+    Multi-polygons are converted to lists of polygons (largest first).
+    The (simplified) polygons are cached to a pickle file for each
+    shapefile and tolerance, and the cache is rebuilt if the shapefile
+    is modified.
+
+    Args:
+        cells_path (str): shapefile path (i.e. the ET cells)
+        cell_id_field (str): ID field name
+        simplify_tol (float): simplify tolerance [in the shapefile units]
+        cache_ws (str): cache folder (if not set, the cache is not used)
+
+    Returns:
+        tuple of the geometry dictionary (ID, list of polygons),
+            the attribute dictionary and the extent of all of the features
+    """
+    import fiona
+    from shapely.geometry import shape
+
+    cache_key = file_cache_key(cells_path, ['.shp', '.dbf']) + [
+        cell_id_field, simplify_tol]
+    if cache_ws is not None:
+        geom_cache_path = cache_path(cache_ws, 'cell_geometry', cache_key)
+        cache_data = read_cache(geom_cache_path, cache_key)
+        if cache_data is not None:
+            logging.debug('  Reading cached cell geometry')
+            return cache_data
+
+    cell_geom_dict = defaultdict(list)
+    cell_data_dict = dict()
+    cell_extent = []
+    with fiona.open(cells_path, "r") as cell_f:
+        cell_extent = cell_f.bounds[:]
+        # Fiona is printing a debug statement here "Index: N"
+        for item in cell_f:
+            cell_id = item['properties'][cell_id_field]
+            cell_data_dict[cell_id] = dict(item['properties'])
+
+            # Simplify the geometry
+            if simplify_tol is not None:
+                item_geom = shape(item['geometry']).simplify(
+                    simplify_tol, preserve_topology=False)
+            else:
+                item_geom = shape(item['geometry'])
+
+            # Unpack multipolygons to lists of polygons
+            if item_geom.is_empty:
+                continue
+            elif item_geom.geom_type == 'MultiPolygon':
+                # Order the geometries from largest to smallest area
+                item_geom_list = sorted(
+                    [[g.area, g] for g in item_geom if not g.is_empty],
+                    reverse=True)
+                for item_area, item_poly in item_geom_list:
+                    cell_geom_dict[cell_id].append(item_poly)
+            elif item_geom.geom_type == 'Polygon':
+                cell_geom_dict[cell_id].append(item_geom)
+            else:
+                logging.error('Invalid geometry type')
+                continue
+    cell_geom_dict = dict(cell_geom_dict)
+
+    if cache_ws is not None and cell_geom_dict:
+        write_cache(
+            geom_cache_path, cache_key,
+            (cell_geom_dict, cell_data_dict, cell_extent))
+    return cell_geom_dict, cell_data_dict, cell_extent
+
+
 def list_re_or(input_list):
     """"""
     return '(' + '|'.join(map(str, input_list)) + ')'
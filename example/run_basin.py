@@ -8,7 +8,7 @@ import sys
 
 
 def main(ini_path, verbose_flag=False, debug_flag=False, vb_flag=False,
-         mp_procs=1):
+         mp_procs=1, queue_ws=None, workers=1):
     """Wrapper for running ET-Demands on a basin
 
     This serves the same purpose as the runBasinLinux.sh script in the
@@ -20,6 +20,11 @@ def main(ini_path, verbose_flag=False, debug_flag=False, vb_flag=False,
         debug_flag (bool): If True, write debug level comments to debug.txt
         vb_flag (bool): If True, mimic calculations in VB version of code
         mp_procs (int): number of cores to use
+        queue_ws (str): job queue folder shared by the workers
+            If set, the cell/crop tasks are published to the queue and then
+            run by the local workers (and any workers started on other
+            machines with "mod_crop_et.py -i INI --worker FOLDER")
+        workers (int): number of local workers to start
 
     Returns:
         None
@@ -51,6 +56,15 @@ def main(ini_path, verbose_flag=False, debug_flag=False, vb_flag=False,
         args_list.append('--verbose')
     if vb_flag:
         args_list.append('--vb')
+    if queue_ws:
+        # Publish the tasks, then run the workers until the queue is empty
+        subprocess.call(args_list + ['--publish', queue_ws])
+        worker_list = [
+            subprocess.Popen(args_list + ['--worker', queue_ws])
+            for i in range(workers)]
+        for worker in worker_list:
+            worker.wait()
+        return
     if mp_procs > 1:
         args_list.extend(['-mp', str(mp_procs)])
     subprocess.call(args_list)
@@ -79,6 +93,13 @@ def parse_args():
         '-mp', '--multiprocessing', default=1, type=int,
         metavar='N', nargs='?', const=mp.cpu_count(),
         help='Number of processers to use')
+    parser.add_argument(
+        '--queue', metavar='FOLDER',
+        help='Job queue folder for running the cell/crop tasks with ' +
+             'multiple workers (can be on a shared drive)')
+    parser.add_argument(
+        '-w', '--workers', default=mp.cpu_count(), type=int, metavar='N',
+        help='Number of local workers to start when using a job queue')
     args = parser.parse_args()
 
     # Convert INI path to an absolute path if necessary
@@ -119,4 +140,5 @@ if __name__ == '__main__':
         ini_path = get_ini_path(os.getcwd())
 
     main(ini_path, verbose_flag=args.verbose, debug_flag=args.debug,
-         vb_flag=args.vb, mp_procs=args.multiprocessing)
+         vb_flag=args.vb, mp_procs=args.multiprocessing,
+         queue_ws=args.queue, workers=args.workers)